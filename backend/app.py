@@ -13,18 +13,28 @@
   8. /api/test-checker повертає match_type та match_score
 """
 
-from flask import Flask, request, jsonify, render_template, send_file, redirect, url_for, make_response
+from flask import (Flask, request, jsonify, render_template, send_file, redirect, url_for,
+                   make_response, Response, stream_with_context)
 from flask_login import LoginManager, UserMixin, login_user, login_required, current_user, logout_user
 from datetime import datetime, timezone, timedelta
-from ocr import extract_text
+from ocr import lookup_cached
+from ocr_service import ocr_service, OCRBusy, OCRTimeout, OCR_TIMEOUT
 from checker import IngredientChecker, RAPIDFUZZ_AVAILABLE
 from export import ScanExporter
 from config import config
+import warmup
+import multiprocessing
 import os
 import json
 import traceback
 import io
 import zipfile
+import queue
+import threading
+import time
+import uuid
+import base64
+from concurrent.futures import ThreadPoolExecutor
 
 # ═══════════════════════════════════════════════════════════════════
 # ІНІЦІАЛІЗАЦІЯ ДОДАТКУ
@@ -37,9 +47,15 @@ app = Flask(__name__, template_folder=frontend_folder, static_folder=static_css_
 app.config.from_object(config.get('default'))
 
 # Імпорт моделей з models.py та ініціалізація БД
-from models import db, User, Ingredient, IngredientAlias, Scan, ScanIngredient, calculate_safety_status_with_message
+from models import (db, User, Ingredient, IngredientAlias, Scan, ScanIngredient, ScanJob,
+                    calculate_safety_status_with_message, compute_risk_statistics,
+                    record_index_change, ensure_schema)
 db.init_app(app)
 
+# Колонки, яких db.create_all() не додає до існуючих таблиць (models.ADDED_COLUMNS)
+with app.app_context():
+    ensure_schema()
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login_page'
@@ -49,16 +65,26 @@ scan_exporter = ScanExporter()
 # Ініціалізація чекера
 ingredient_checker = IngredientChecker(use_cache=True, fallback_to_local=True, auto_save_unknown=True)
 
+# Прогрів моделей (див. warmup.py). Батьківський процес reloader-а Flask
+# трафік не приймає — моделі в ньому не потрібні.
+# OCR-движки гріються в процесах пулу OCR (ocr_service.py), тут — лише решта.
+# Воркер пулу (spawn перезапускає app.py як __mp_main__) не стартує нічого.
+if (multiprocessing.parent_process() is None
+        and not (__name__ == '__main__' and app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true')):
+    # Словник назв для злиття рядків OCR (ocr.set_vocabulary)
+    ocr_service.start(vocabulary=ingredient_checker.vocabulary)
+    warmup.start(models=ocr_service.local_warmup_models())
+
 
 # ═══════════════════════════════════════════════════════════════════
 # ХЕЛПЕРИ
 # ═══════════════════════════════════════════════════════════════════
 
-def check_ingredients(text):
+def check_ingredients(text, progress=None, ocr_tokens=None):
     """Аналіз тексту через IngredientChecker."""
     if not text:
         return []
-    return ingredient_checker.find_ingredients(text)
+    return ingredient_checker.find_ingredients(text, progress, ocr_tokens)
 
 
 def _normalize_detected_ingredients(detected_ingredients):
@@ -92,9 +118,22 @@ def create_scan(user_id, text, detected_ingredients, input_type='manual', input_
     Створює Scan + ScanIngredient записи.
     Зберігає JSON у ingredients_detected для зворотної сумісності
     та створює нормалізовані ScanIngredient записи.
+
+    Запити до БД не залежать від кількості інгредієнтів: один SELECT ... IN
+    для перевірки ingredient_id, INSERT скану (з JSON) з RETURNING id і
+    один пакетний INSERT зв'язків (на PostgreSQL psycopg2 збирає рядки
+    в один multi-VALUES), далі COMMIT.
     """
     safety_info = calculate_safety_status_with_message(detected_ingredients)
     ingredients_for_json = _normalize_detected_ingredients(detected_ingredients)
+    detected = [ing for ing in detected_ingredients if isinstance(ing, dict)]
+
+    # Перевіряємо, що ingredient_id реально існують у БД — одним запитом
+    ids = {ing.get('id') for ing in detected if ing.get('id')}
+    existing_ids = set()
+    if ids:
+        existing_ids = {row[0] for row in
+                        db.session.query(Ingredient.id).filter(Ingredient.id.in_(ids))}
 
     scan = Scan(
         user_id=user_id,
@@ -106,44 +145,38 @@ def create_scan(user_id, text, detected_ingredients, input_type='manual', input_
         contains_unknown=safety_info['contains_unknown'],
         unknown_count=safety_info['unknown_count'],
         ingredients_detected=ingredients_for_json,
+        ingredients_count=len(ingredients_for_json),
+        risk_statistics=compute_risk_statistics(ingredients_for_json),
     )
     db.session.add(scan)
     db.session.flush()  # отримуємо scan.id
-
-    # Створюємо нормалізовані зв'язки ScanIngredient
-    for ing_data in detected_ingredients:
-        if not isinstance(ing_data, dict):
-            continue
-
-        ingredient_id = ing_data.get('id')
-        # Перевіряємо, що ingredient_id реально існує в БД
-        if ingredient_id:
-            exists = Ingredient.query.get(ingredient_id)
-            if not exists:
-                ingredient_id = None
-
-        scan_ing = ScanIngredient(
-            scan_id=scan.id,
-            ingredient_id=ingredient_id if ingredient_id else None,
-            raw_name=ing_data.get('name', ''),
-            normalized_name=ing_data.get('name', ''),
-            risk_level=ing_data.get('risk_level', 'unknown'),
-            category=ing_data.get('category', ''),
-            description=ing_data.get('description', ''),
-            position=ing_data.get('position'),
-            match_type=ing_data.get('match_type', ''),
-            match_score=ing_data.get('match_score'),
-            source=ing_data.get('source', ''),
-        )
-        db.session.add(scan_ing)
+    # Після commit об'єкт протухає — scan.id зробив би зайвий SELECT
+    scan_id = scan.id
+
+    # Нормалізовані зв'язки ScanIngredient — одним пакетним INSERT
+    rows = [{
+        'scan_id': scan_id,
+        'ingredient_id': ing.get('id') if ing.get('id') in existing_ids else None,
+        'raw_name': ing.get('name', ''),
+        'normalized_name': ing.get('name', ''),
+        'risk_level': ing.get('risk_level', 'unknown'),
+        'category': ing.get('category', ''),
+        'description': ing.get('description', ''),
+        'position': ing.get('position'),
+        'match_type': ing.get('match_type', ''),
+        'match_score': ing.get('match_score'),
+        'source': ing.get('source', ''),
+    } for ing in detected]
+    if rows:
+        db.session.execute(ScanIngredient.__table__.insert(), rows)
 
     db.session.commit()
 
-    print(f"Створено сканування ID: {scan.id} | "
+    print(f"Створено сканування ID: {scan_id} | "
           f"{len(detected_ingredients)} інгредієнтів | "
           f"статус: {safety_info['status']}")
 
-    return scan.id
+    return scan_id
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -230,6 +263,32 @@ def api_status():
 # АНАЛІЗ (OCR / текст / файл)
 # ═══════════════════════════════════════════════════════════════════
 
+def _ocr_busy_response(e):
+    response = jsonify({"status": "error",
+                        "message": "Сервер зайнятий розпізнаванням інших фото. Спробуйте за хвилину."})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+
+def _analyze_result(text, detected_ingredients, scan_id, ocr_timings):
+    """Тіло відповіді /api/analyze (і результат асинхронного завдання)."""
+    if not text or text.strip() == "":
+        return {
+            "status": "warning",
+            "message": "Не вдалося розпізнати текст. Спробуйте інше зображення.",
+            "text": "", "ingredients": [], "ingredients_count": 0,
+            "ocr_timings": ocr_timings,
+        }
+    return {
+        "status": "success",
+        "text": text[:5000],
+        "ingredients": detected_ingredients,
+        "ingredients_count": len(detected_ingredients),
+        "scan_id": scan_id,
+        "ocr_timings": ocr_timings,
+    }
+
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze():
     try:
@@ -247,32 +306,288 @@ def analyze():
         if file_size == 0:
             return jsonify({"status": "error", "message": "Файл порожній"}), 400
 
-        text = extract_text(file)
+        if request.args.get('async') in ('1', 'true'):
+            return _start_scan_job(file, input_method)
+
+        ocr_timings = {}
+        try:
+            text = ocr_service.extract_text(file, ocr_timings)
+        except OCRBusy as e:
+            return _ocr_busy_response(e)
+        except OCRTimeout:
+            return jsonify({"status": "error",
+                            "message": "Розпізнавання триває занадто довго. Спробуйте інше зображення."}), 504
+        # Довіра OCR до слів іде в результати (ocr_confidence), а не у відповідь як є
+        ocr_tokens = ocr_timings.pop('tokens', None)
         if not text or text.strip() == "":
-            return jsonify({
-                "status": "warning",
-                "message": "Не вдалося розпізнати текст. Спробуйте інше зображення.",
-                "text": "", "ingredients": [], "ingredients_count": 0
-            })
+            return jsonify(_analyze_result(text, [], None, ocr_timings))
 
-        detected_ingredients = check_ingredients(text)
+        detected_ingredients = check_ingredients(text, ocr_tokens=ocr_tokens)
 
         scan_id = None
         if current_user.is_authenticated:
             scan_id = create_scan(current_user.id, text, detected_ingredients, 'camera', input_method)
 
-        return jsonify({
-            "status": "success",
-            "text": text[:5000],
-            "ingredients": detected_ingredients,
-            "ingredients_count": len(detected_ingredients),
-            "scan_id": scan_id,
-        })
+        return jsonify(_analyze_result(text, detected_ingredients, scan_id, ocr_timings))
     except Exception as e:
         traceback.print_exc()
         return jsonify({"status": "error", "message": f"Помилка: {str(e)}"}), 500
 
 
+# ═══════════════════════════════════════════════════════════════════
+# АСИНХРОННІ ЗАВДАННЯ СКАНУВАННЯ
+# ═══════════════════════════════════════════════════════════════════
+#
+# POST /api/analyze?async=1 одразу повертає 202 з id завдання. OCR іде в
+# пул ocr_service (OCRBusy → 503 ще на етапі POST), а решта — у фоновому
+# потоці цього воркера. Стан і події прогресу пишуться в scan_jobs, тож
+# GET /api/jobs/<id> і SSE-потік /api/jobs/<id>/events може обслуговувати
+# будь-який воркер.
+#
+# Етапи: queued → cache | detect → [preprocess] → ocr (на кожен движок) → candidates
+#        → matching → persisted → done (або failed)
+#
+# Поки завдання виконується, фоновий потік воркера раз на JOB_HEARTBEAT
+# секунд оновлює updated_at. Завдання, яке не оновлювалось JOB_STALE_AFTER
+# секунд (воркер перезапущено чи вбито), вважається failed. Завершені
+# завдання видаляються через JOB_TTL секунд.
+
+# Завдань не більше, ніж місць у черзі OCR, — інші відсікає OCRBusy
+_job_executor = ThreadPoolExecutor(max_workers=ocr_service.capacity,
+                                   thread_name_prefix='scan-job')
+
+# SSE: частота опитування БД, keep-alive для проксі, максимальна тривалість потоку
+JOB_POLL_INTERVAL = 0.5
+JOB_KEEPALIVE = 15
+JOB_STREAM_TIMEOUT = OCR_TIMEOUT + 60
+JOB_HEARTBEAT = 10
+JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', '60'))
+JOB_TTL = int(os.environ.get('JOB_TTL', str(24 * 3600)))
+JOB_CLEANUP_INTERVAL = 600
+JOB_STALE_ERROR = "Завдання перервано: воркер не відповідає. Спробуйте ще раз."
+
+# Завдання цього процесу (queued/running), для яких потік шле heartbeat
+_active_jobs = set()
+_active_jobs_lock = threading.Lock()
+_maintenance_thread = None
+
+
+def _job_update(job_id, event=None, **fields):
+    """Додає подію прогресу та/або оновлює поля завдання (окремий commit)."""
+    job = ScanJob.query.get(job_id)
+    if job is None:
+        return
+    if event is not None:
+        event = dict(event, at=datetime.now(timezone.utc).isoformat())
+        job.events = (job.events or []) + [event]
+        job.stage = event['stage']
+    for key, value in fields.items():
+        setattr(job, key, value)
+    job.updated_at = datetime.now(timezone.utc)
+    db.session.commit()
+
+
+def _track_job(job_id, active):
+    global _maintenance_thread
+    with _active_jobs_lock:
+        if active:
+            _active_jobs.add(job_id)
+        else:
+            _active_jobs.discard(job_id)
+        if _maintenance_thread is None:
+            _maintenance_thread = threading.Thread(target=_job_maintenance,
+                                                   name='scan-job-maintenance', daemon=True)
+            _maintenance_thread.start()
+
+
+def _job_maintenance():
+    """Heartbeat завдань цього процесу; раз на JOB_CLEANUP_INTERVAL — завислі й старі завдання."""
+    last_cleanup = 0.0
+    while True:
+        time.sleep(JOB_HEARTBEAT)
+        with app.app_context():
+            try:
+                now = datetime.now(timezone.utc)
+                with _active_jobs_lock:
+                    job_ids = list(_active_jobs)
+                if job_ids:
+                    (ScanJob.query
+                     .filter(ScanJob.id.in_(job_ids), ScanJob.status.in_(('queued', 'running')))
+                     .update({'updated_at': now}, synchronize_session=False))
+                if time.time() - last_cleanup > JOB_CLEANUP_INTERVAL:
+                    last_cleanup = time.time()
+                    stale = (ScanJob.query
+                             .filter(ScanJob.status.in_(('queued', 'running')),
+                                     ScanJob.updated_at < now - timedelta(seconds=JOB_STALE_AFTER))
+                             .update({'status': 'failed', 'stage': 'failed',
+                                      'error': JOB_STALE_ERROR, 'updated_at': now},
+                                     synchronize_session=False))
+                    expired = (ScanJob.query
+                               .filter(ScanJob.status.in_(('done', 'failed')),
+                                       ScanJob.updated_at < now - timedelta(seconds=JOB_TTL))
+                               .delete(synchronize_session=False))
+                    if stale or expired:
+                        print(f"[Jobs] Завислих завдань: {stale}, видалено старих: {expired}")
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"[Jobs] Помилка обслуговування завдань: {e}")
+            finally:
+                db.session.remove()
+
+
+def _fail_if_stale(job):
+    """Позначає failed завдання, для якого heartbeat не приходив JOB_STALE_AFTER секунд."""
+    if job.status not in ('queued', 'running') or job.updated_at is None:
+        return job
+    updated_at = job.updated_at
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    if datetime.now(timezone.utc) - updated_at < timedelta(seconds=JOB_STALE_AFTER):
+        return job
+    _job_update(job.id, {'stage': 'failed'}, status='failed', error=JOB_STALE_ERROR)
+    return job
+
+
+def _drain_progress(job_id, progress_queue, future, timeout):
+    """Переносить події OCR з черги в БД, доки задача OCR не завершиться."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            _job_update(job_id, progress_queue.get(timeout=JOB_POLL_INTERVAL))
+            continue
+        except queue.Empty:
+            pass
+        if future.done():
+            break
+        if time.time() > deadline:
+            future.cancel()
+            raise OCRTimeout(f"OCR не завершився за {timeout:.0f}с")
+    while True:
+        try:
+            _job_update(job_id, progress_queue.get_nowait())
+        except queue.Empty:
+            return future.result()
+
+
+def _run_scan_job(job_id, user_id, input_method, future, progress_queue, text, ocr_timings):
+    with app.app_context():
+        try:
+            _job_update(job_id, status='running')
+            if future is not None:
+                text, ocr_timings = _drain_progress(job_id, progress_queue, future, OCR_TIMEOUT)
+            ocr_tokens = ocr_timings.pop('tokens', None)
+
+            detected_ingredients = []
+            scan_id = None
+            if text and text.strip():
+                detected_ingredients = check_ingredients(
+                    text, progress=lambda event: _job_update(job_id, event),
+                    ocr_tokens=ocr_tokens)
+                if user_id is not None:
+                    scan_id = create_scan(user_id, text, detected_ingredients, 'camera', input_method)
+                    _job_update(job_id, {'stage': 'persisted', 'scan_id': scan_id})
+
+            result = _analyze_result(text, detected_ingredients, scan_id, ocr_timings)
+            _job_update(job_id, {'stage': 'done'}, status='done',
+                        result=json.loads(json.dumps(result, default=str)))
+        except Exception as e:
+            traceback.print_exc()
+            db.session.rollback()
+            _job_update(job_id, {'stage': 'failed'}, status='failed', error=str(e))
+        finally:
+            _track_job(job_id, active=False)
+            db.session.remove()
+
+
+def _start_scan_job(file, input_method):
+    filename = file.filename or 'unknown'
+    file.stream.seek(0)
+    raw_bytes = file.stream.read()
+
+    ocr_timings = {}
+    text = lookup_cached(raw_bytes, ocr_timings)
+    future = progress_queue = None
+    if text is None:
+        progress_queue = ocr_service.progress_queue()
+        try:
+            future = ocr_service.submit(raw_bytes, filename, progress_queue)
+        except OCRBusy as e:
+            return _ocr_busy_response(e)
+
+    user_id = current_user.id if current_user.is_authenticated else None
+    job = ScanJob(id=uuid.uuid4().hex, user_id=user_id, status='queued', stage='queued',
+                  events=[{'stage': 'queued', 'at': datetime.now(timezone.utc).isoformat()}])
+    db.session.add(job)
+    db.session.commit()
+
+    _track_job(job.id, active=True)
+    _job_executor.submit(_run_scan_job, job.id, user_id, input_method,
+                         future, progress_queue, text, ocr_timings)
+    return jsonify({
+        "status": "accepted", "job_id": job.id,
+        "status_url": url_for('get_job', job_id=job.id),
+        "events_url": url_for('job_events', job_id=job.id),
+    }), 202
+
+
+def _get_visible_job(job_id):
+    """Завдання, якщо воно анонімне або належить поточному користувачу."""
+    job = ScanJob.query.get(job_id)
+    if job is None:
+        return None
+    if job.user_id is not None and (not current_user.is_authenticated
+                                    or current_user.id != job.user_id):
+        return None
+    return job
+
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    job = _get_visible_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Завдання не знайдено"}), 404
+    return jsonify(_fail_if_stale(job).to_dict())
+
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-Sent Events: 'progress' на кожну подію, наприкінці 'done' або 'failed'."""
+    if _get_visible_job(job_id) is None:
+        return jsonify({"status": "error", "message": "Завдання не знайдено"}), 404
+
+    def stream():
+        sent = 0
+        last_write = started = time.time()
+        while time.time() - started < JOB_STREAM_TIMEOUT:
+            # Завдання оновлює інший потік чи воркер — читаємо свіжий стан
+            db.session.expire_all()
+            job = ScanJob.query.get(job_id)
+            if job is None:
+                # Видалено (JOB_TTL) під час потоку
+                yield 'event: failed\ndata: {"error": "Завдання не знайдено"}\n\n'
+                return
+            job = _fail_if_stale(job)
+            events = job.events or []
+            for event in events[sent:]:
+                yield f"event: progress\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                last_write = time.time()
+            sent = len(events)
+            if job.status in ('done', 'failed'):
+                payload = json.dumps(job.to_dict(include_events=False), ensure_ascii=False, default=str)
+                yield f"event: {job.status}\ndata: {payload}\n\n"
+                return
+            db.session.commit()
+            if time.time() - last_write > JOB_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                last_write = time.time()
+            time.sleep(JOB_POLL_INTERVAL)
+        yield "event: timeout\ndata: {}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/api/analyze_text', methods=['POST'])
 def analyze_text():
     try:
@@ -459,16 +774,103 @@ def get_enhanced_ingredients():
 # СКАНИ API
 # ═══════════════════════════════════════════════════════════════════
 
+SCANS_PAGE_SIZE = int(os.environ.get('SCANS_PAGE_SIZE', '20'))
+SCANS_PAGE_MAX = 100
+
+# Фільтр ризику історії → значення safety_status (старі та нові назви)
+SCAN_RISK_STATUSES = {
+    'high': ('danger', 'high'),
+    'medium': ('warning', 'medium'),
+    'low': ('low_warning', 'low'),
+    'safe': ('safe',),
+    'unknown': ('unknown',),
+}
+
+
+def _encode_scan_cursor(scan):
+    raw = f"{scan.created_at.isoformat()}|{scan.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_scan_cursor(cursor):
+    """cursor → (created_at, id); ValueError, якщо cursor пошкоджено."""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, scan_id = raw.rsplit('|', 1)
+    return datetime.fromisoformat(created_at), int(scan_id)
+
+
 @app.route('/api/scans', methods=['GET'])
 @login_required
 def get_user_scans():
+    """
+    Історія сканувань сторінками (keyset-пагінація по created_at, id).
+
+    Параметри:
+      limit   — розмір сторінки (типово 20, максимум 100)
+      cursor  — next_cursor з попередньої відповіді
+      summary — 1: без списку інгредієнтів, лише лічильники
+      risk    — safe | low | medium | high | unknown
+      method  — input_method (camera, gallery, device, text)
+
+    Без summary зв'язки ScanIngredient для всієї сторінки читаються
+    одним запитом, а не окремим запитом на кожен скан.
+    """
     try:
-        scans = (Scan.query.filter_by(user_id=current_user.id)
-                 .order_by(Scan.created_at.desc()).all())
+        limit = min(max(int(request.args.get('limit', SCANS_PAGE_SIZE)), 1), SCANS_PAGE_MAX)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Некоректний limit"}), 400
+    summary = request.args.get('summary') in ('1', 'true')
+    cursor = request.args.get('cursor')
+    risk = request.args.get('risk')
+    method = request.args.get('method')
+
+    try:
+        query = Scan.query.filter(Scan.user_id == current_user.id)
+        if risk in SCAN_RISK_STATUSES:
+            statuses = SCAN_RISK_STATUSES[risk]
+            condition = Scan.safety_status.in_(statuses)
+            if risk == 'safe':
+                condition = db.or_(condition, Scan.safety_status.is_(None))
+            query = query.filter(condition)
+        if method:
+            query = query.filter(Scan.input_method == method)
+        total = query.order_by(None).count()
+
+        if cursor:
+            try:
+                created_at, last_id = _decode_scan_cursor(cursor)
+            except ValueError:
+                return jsonify({"status": "error", "message": "Некоректний cursor"}), 400
+            query = query.filter(db.or_(
+                Scan.created_at < created_at,
+                db.and_(Scan.created_at == created_at, Scan.id < last_id),
+            ))
+
+        scans = (query.order_by(Scan.created_at.desc(), Scan.id.desc())
+                 .limit(limit + 1).all())
+        has_more = len(scans) > limit
+        scans = scans[:limit]
+
+        if summary:
+            items = [s.to_summary_dict() for s in scans]
+        else:
+            links_by_scan = {s.id: [] for s in scans}
+            if scans:
+                links = (ScanIngredient.query
+                         .filter(ScanIngredient.scan_id.in_(list(links_by_scan)))
+                         .order_by(ScanIngredient.scan_id, ScanIngredient.id).all())
+                for link in links:
+                    links_by_scan[link.scan_id].append(link)
+            items = [s.to_dict(links=links_by_scan[s.id]) for s in scans]
+
+        next_cursor = _encode_scan_cursor(scans[-1]) if has_more else None
         return jsonify({
             "status": "success",
-            "scans": [s.to_dict() for s in scans],
-            "total": len(scans),
+            "scans": items,
+            "total": total,
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
             "user": current_user.email,
         })
     except Exception as e:
@@ -603,7 +1005,7 @@ def external_search():
         name = data.get('name', '').strip()
         if not name:
             return jsonify({"status": "error", "message": "Не вказано назву"}), 400
-        result = ingredient_checker.search_ingredient(name)
+        result = dict(ingredient_checker.search_ingredient(name))
         return jsonify({"status": "success", "ingredient": result, "source": result.get('source', 'unknown')})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -676,7 +1078,9 @@ def verify_ingredient(ingredient_id):
         ing.verified_by = current_user.email
         ing.source_of_risk_assessment = data.get('source_of_risk_assessment', 'manual')
 
+        record_index_change('ingredient', ing.id, 'update')
         db.session.commit()
+        ingredient_checker.sync_index(force=True)
         return jsonify({"status": "success", "message": f"Інгредієнт '{ing.name}' верифіковано", "ingredient": ing.to_dict()})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -693,8 +1097,10 @@ def reject_ingredient(ingredient_id):
         if not ing:
             return jsonify({"status": "error", "message": "Інгредієнт не знайдено"}), 404
         name = ing.name
+        record_index_change('ingredient', ing.id, 'remove')
         db.session.delete(ing)
         db.session.commit()
+        ingredient_checker.sync_index(force=True)
         return jsonify({"status": "success", "message": f"Інгредієнт '{name}' видалено"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -764,7 +1170,10 @@ def add_alias():
             alias_lower=alias_text.lower(), alias_type=alias_type, language=language,
         )
         db.session.add(new_alias)
+        db.session.flush()
+        record_index_change('alias', new_alias.id, 'add', name=new_alias.alias_lower)
         db.session.commit()
+        ingredient_checker.sync_index(force=True)
         return jsonify({"status": "success", "message": f"Аліас '{alias_text}' додано", "alias": new_alias.to_dict()})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -780,8 +1189,10 @@ def delete_alias(alias_id):
         alias = IngredientAlias.query.get(alias_id)
         if not alias:
             return jsonify({"status": "error", "message": "Аліас не знайдено"}), 404
+        record_index_change('alias', alias.id, 'remove', name=alias.alias_lower)
         db.session.delete(alias)
         db.session.commit()
+        ingredient_checker.sync_index(force=True)
         return jsonify({"status": "success", "message": "Аліас видалено"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -793,10 +1204,13 @@ def delete_alias(alias_id):
 
 @app.route('/api/health')
 def health_check():
+    # 503, доки моделі гріються: балансувальник не шле трафік на воркер
+    ready = warmup.is_ready() and ocr_service.is_ready()
     return jsonify({
-        "status": "healthy", "service": "Cosmetics Scanner API",
+        "status": "healthy" if ready else "warming_up", "service": "Cosmetics Scanner API",
         "timestamp": datetime.now(timezone.utc).isoformat(),
-    })
+        "ready": ready, "models": warmup.status(), "ocr_pool": ocr_service.stats(),
+    }), 200 if ready else 503
 
 @app.route('/api/simple-check')
 def simple_check():
@@ -827,6 +1241,8 @@ def test_checker():
                 "total_aliases": len(ingredient_checker._alias_index),
                 "ocr_fixes": len(ingredient_checker.ocr_fixes),
                 "rapidfuzz": RAPIDFUZZ_AVAILABLE,
+                "search_cache": ingredient_checker.search_cache.stats(),
+                "index_version": ingredient_checker._index_version,
             },
         })
     except Exception as e:
@@ -975,6 +1391,7 @@ def init_db():
         os.makedirs('data_cache', exist_ok=True)
 
         db.create_all()
+        ensure_schema()
         print("Структура БД перевірена (включно з ingredient_aliases, scan_ingredients)")
 
         if User.query.count() == 0:
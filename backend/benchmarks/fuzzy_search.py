@@ -0,0 +1,112 @@
+# fuzzy_search.py
+"""Бенчмарк нечіткого пошуку: повний список назв vs FuzzyCandidateIndex.
+
+Порівнює два виклики process.extractOne (token_sort_ratio і partial_ratio,
+як у IngredientChecker._fuzzy_search) на повному списку назв та на
+кандидатах після попереднього відбору. Заодно перевіряє, що найкращий
+збіг в обох випадках однаковий.
+
+Синтетичний словник: назви з seed_ingredients.py плюс згенеровані
+INCI-подібні назви з типових складів і суфіксів.
+
+Запуск (з папки backend):
+  python benchmarks/fuzzy_search.py
+  python benchmarks/fuzzy_search.py 1000 10000 100000
+"""
+
+import os
+import sys
+import random
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rapidfuzz import fuzz, process
+from seed_ingredients import INGREDIENTS
+from text_index import FuzzyCandidateIndex
+
+SYLLABLES = ['meth', 'eth', 'prop', 'but', 'hex', 'oct', 'dec', 'lauryl', 'cetyl',
+             'stear', 'ole', 'glyc', 'cocam', 'amido', 'sorb', 'benz', 'phen', 'oxy',
+             'hydr', 'sil', 'dimeth', 'acryl', 'poly', 'tri', 'di', 'iso', 'capr',
+             'palm', 'myrist', 'lin', 'ter', 'chlor', 'sulf', 'phosph', 'carb']
+ENDINGS = ['ate', 'ide', 'ol', 'one', 'ene', 'in', 'ium', 'ane', 'ose', 'yl']
+TAILS = ['', '', '', ' acid', ' extract', ' oil', ' ester', ' sulfate', ' chloride',
+         ' leaf extract', ' seed oil', ' copolymer']
+
+
+def make_names(size, rnd):
+    names = [ing['name'].lower() for ing in INGREDIENTS]
+    seen = set(names)
+    while len(names) < size:
+        words = []
+        for _ in range(rnd.choice([1, 1, 2, 2, 3])):
+            word = ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(1, 3)))
+            words.append(word + rnd.choice(ENDINGS))
+        name = ' '.join(words) + rnd.choice(TAILS)
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def make_queries(names, count, rnd):
+    """Назви зі словника з OCR-подібними спотвореннями."""
+    queries = []
+    while len(queries) < count:
+        chars = list(rnd.choice(names))
+        for _ in range(rnd.randint(0, 2)):
+            i = rnd.randrange(len(chars))
+            chars[i] = rnd.choice('abcdeilnorstu1')
+        query = ''.join(chars).strip()
+        if len(query) >= 4:
+            queries.append(query)
+    return queries
+
+
+def fuzzy_full(query, names):
+    threshold = 85 if len(query) <= 10 else 78
+    token = process.extractOne(query, names, scorer=fuzz.token_sort_ratio,
+                               score_cutoff=threshold)
+    partial = process.extractOne(query, names, scorer=fuzz.partial_ratio,
+                                 score_cutoff=threshold + 5)
+    return token and token[:2], partial and partial[:2]
+
+
+def fuzzy_blocked(query, index):
+    threshold = 85 if len(query) <= 10 else 78
+    token_names, partial_names = index.candidates(query, threshold, threshold + 5)
+    token = process.extractOne(query, token_names, scorer=fuzz.token_sort_ratio,
+                               score_cutoff=threshold)
+    partial = process.extractOne(query, partial_names, scorer=fuzz.partial_ratio,
+                                 score_cutoff=threshold + 5)
+    return token and token[:2], partial and partial[:2]
+
+
+def run(size, n_queries=200, seed=42):
+    rnd = random.Random(seed)
+    names = make_names(size, rnd)
+    queries = make_queries(names, n_queries, rnd)
+
+    start = time.perf_counter()
+    index = FuzzyCandidateIndex(names)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [fuzzy_full(q, names) for q in queries]
+    full_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [fuzzy_blocked(q, index) for q in queries]
+    blocked_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"{size:>7} назв | побудова {build_time:6.2f}с | "
+          f"повний {full_time / n_queries * 1000:7.2f} мс/запит | "
+          f"з відбором {blocked_time / n_queries * 1000:6.2f} мс/запит | "
+          f"x{full_time / blocked_time:5.1f} | розбіжностей: {mismatches}")
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 100000]
+    for size in sizes:
+        run(size)
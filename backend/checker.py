@@ -12,11 +12,22 @@
 import re
 import json
 import requests
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 import sqlite3
 import os
+import time
+import hashlib
+import threading
 import traceback
 
+from text_index import (normalize_word, AhoCorasick, TokenTrie, SubstringIndex,
+                        FuzzyCandidateIndex, NUMPY_AVAILABLE)
+from search_cache import SearchCache, DEFAULT_MAXSIZE
+from index_snapshot import load_snapshot, save_snapshot
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
 try:
     from rapidfuzz import fuzz, process
     RAPIDFUZZ_AVAILABLE = True
@@ -29,11 +40,14 @@ except ImportError:
 # --- ML-фільтр ---
 try:
     from ingredient_classifier import is_ingredient as ml_is_ingredient
+    from ingredient_classifier import is_ingredient_batch as ml_is_ingredient_batch
     ML_CLASSIFIER_AVAILABLE = True
 except ImportError:
     ML_CLASSIFIER_AVAILABLE = False
     def ml_is_ingredient(text):
         return True
+    def ml_is_ingredient_batch(texts):
+        return [True] * len(texts)
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -157,52 +171,314 @@ def _make_description(category, risk, lang='uk'):
     return base
 
 
+# ═══════════════════════════════════════════════════════════════════
+# ПРАВИЛА ФІЛЬТРА КАНДИДАТІВ (is_potential_ingredient)
+# ═══════════════════════════════════════════════════════════════════
+# Таблиці компілюються один раз при імпорті: кожна група ключових слів —
+# один регулярний вираз (один прохід по рядку в C) замість циклу any(...).
+
+def _keywords_re(keywords):
+    """Регулярний вираз, що знаходить будь-яке з ключових слів як підрядок."""
+    return re.compile('|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)))
+
+
+STOP_PHRASES = [
+    'isntree', 'clinically proven', 'non-irritating',
+    'an emulsion', 'how to use', 'at the last stage',
+    'apply proper amount', 'until absorbed', 'cautions for use',
+    'if skin irritations', 'seek immediate medical',
+    'do not apply on wounded area', 'cautions for storage',
+    'keep out of reach', 'keep out of direct sunlight',
+    'the manufacturing number', 'expiration date',
+    'manufacturing distributor', 'manufacturer',
+    'republic of korea', 'made in', 'distributed by',
+]
+
+POSTAL_PATTERNS = [
+    r'\b[A-Z]{1,2}\d[A-Z\d]?\s?\d[A-Z]{2}\b',
+    r'\b[A-Z]{2,3}\d?[A-Z]?\s?\d[A-Z]{2}\b',
+    r'\b[A-Z]\d[A-Z]\s?\d[A-Z]\d\b',
+    r'\b\d{5}(-\d{4})?\b',
+    r'\b\d{5,6}\b',
+]
+
+COUNTRY_CODES = frozenset({
+    'uk', 'gb', 'be', 'fr', 'de', 'us', 'ca', 'it', 'es', 'pt', 'nl',
+    'ru', 'ua', 'pl', 'cz', 'sk', 'hu', 'ro', 'bg', 'gr', 'se', 'no',
+    'dk', 'fi', 'ee', 'lv', 'lt', 'jp', 'kr', 'cn', 'in', 'br', 'au', 'nz',
+    'ch', 'at', 'ie', 'mx', 'ar', 'tr',
+})
+
+CITY_NAMES = frozenset({
+    'london', 'paris', 'berlin', 'tokyo', 'seoul', 'toronto', 'sydney',
+    'kyiv', 'kiev', 'moscow', 'москва', 'київ', 'киев',
+    'new york', 'los angeles', 'chicago', 'washington', 'san francisco',
+    'warsaw', 'praha', 'vienna', 'budapest', 'bucuresti', 'sofia',
+    'рим', 'мадрид', 'берлин', 'варшава', 'париж',
+})
+
+GEO_KEYWORDS = frozenset({
+    'область', 'област', 'республика', 'край', 'район',
+    'місто', 'село', 'смт', 'region', 'district', 'city',
+    'province', 'state', 'county',
+})
+
+SINGLE_COUNTRIES = frozenset({
+    'україна', 'ukraine', 'россия', 'russia', 'беларусь', 'belarus',
+    'сша', 'usa', 'канада', 'canada', 'великобритания', 'uk',
+    'франция', 'france', 'германия', 'germany', 'италия', 'italy',
+    'испания', 'spain', 'польша', 'poland',
+})
+
+NON_INGREDIENT_MARKERS = [
+    'building', 'kesson', 'eonju-ro', 'inc.', 'ltd.', 'co.',
+    'gmbh', 'distributor', 'expiration',
+    'cautions', 'keep out', 'sunlight', 'reach of',
+    'manufactured', 'address', 'tel', 'fax', 'zip', 'city',
+    'country', 'part no', 'lot no', 'batch', 'www.', '.com',
+    '©', '®', '™', 'please', 'visit', 'our website',
+    'contact', 'phone', 'inquiries', 'head office',
+    'street', 'road', 'avenue', 'blvd', 'drive',
+    'apt', 'suite', 'postal', 'code', 'po box',
+]
+
+MARKETING_WORDS = [
+    'продукція', 'косметична', 'гігієнічна', 'призначено',
+    'зберігати', 'виготовлювач', 'росія', 'область', 'україна',
+]
+
+# Закінчення, з якими фраза з Великих Літер ще може бути INCI-назвою
+INCI_SUFFIXES = ('ate', 'ide', 'one', 'ene', 'ol', 'ic', 'in', 'ium', 'ester', 'acid', 'gum')
+CHEMICAL_SUFFIXES = ('ate', 'ide', 'one', 'ene', 'ol', 'ic', 'in', 'ose',
+                     'ium', 'ester', 'oil', 'acid', 'al', 'ane')
+
+_STOP_PHRASES_RE = _keywords_re(STOP_PHRASES)
+_POSTAL_RE = re.compile('|'.join(f'(?:{p})' for p in POSTAL_PATTERNS))
+_GEO_TEXT_RE = re.compile(r'[A-Za-zА-Яа-я\s/,\-]+')
+_GEO_SPLIT_RE = re.compile(r'[\s/,]+')
+_NON_INGREDIENT_RE = _keywords_re(NON_INGREDIENT_MARKERS)
+_MARKETING_RE = _keywords_re(MARKETING_WORDS)
+_DIGIT_RE = re.compile(r'\d')
+_CI_NUMBER_RE = re.compile(r'ci\s*\d+')
+_LATIN_WORD_RE = re.compile(r'[a-zA-Z]{3,}')
+_LATIN_RE = re.compile(r'[a-zA-Z]')
+_CYRILLIC_RE = re.compile(r'[а-яА-ЯіІїЇєЄ]')
+
+
 # ═══════════════════════════════════════════════════════════════════
 # ОСНОВНИЙ КЛАС
 # ═══════════════════════════════════════════════════════════════════
 
+# Знімок індексів, спільний для всіх воркерів (None — вимкнено)
+INDEX_SNAPSHOT_PATH = os.path.join('data_cache', 'matcher_index.snapshot')
+
+# Скільки останніх id журналу змін перечитувати при синхронізації: id
+# SERIAL видаються до COMMIT, тож транзакція з меншим id може стати
+# видимою пізніше за більший — такі записи підхоплюються в межах вікна
+INDEX_SYNC_LOOKBACK = int(os.environ.get('INDEX_SYNC_LOOKBACK', '1000'))
+
+# Атрибути IngredientChecker, що зберігаються у знімку
+_SNAPSHOT_ATTRS = (
+    'local_ingredients', 'ocr_fixes',
+    '_exact_index', '_alias_index', '_all_names',
+    '_phrase_automaton', '_phrase_trie', '_substring_index', '_fuzzy_candidates',
+    '_index_seq',
+)
+
+
 class IngredientChecker:
-    def __init__(self, use_cache=True, fallback_to_local=True, auto_save_unknown=True):
+    def __init__(self, use_cache=True, fallback_to_local=True, auto_save_unknown=True,
+                 cache_size=DEFAULT_MAXSIZE, cache_ttl=None,
+                 snapshot_path=INDEX_SNAPSHOT_PATH, sync_interval=5.0):
         self.use_cache = use_cache
         self.fallback_to_local = fallback_to_local
         self.auto_save_unknown = auto_save_unknown
+        self.snapshot_path = snapshot_path
+        self.sync_interval = sync_interval
 
-        self.local_ingredients = self._load_ingredients_from_db()
-        self.ocr_fixes = self._load_ocr_fixes_from_db()
         self.external_sources = ExternalDataFetcher()
-
-        self.search_cache = {}
+        self.search_cache = SearchCache(maxsize=cache_size, ttl=cache_ttl)
         self.stop_words = self._load_stop_words()
 
-        self._build_fuzzy_index()
+        # Один замок на всі структури пошуку: зміни (sync_index, add_*/
+        # remove_*/update_*) і читання індексів у потоках запитів
+        self._index_lock = threading.RLock()
+        # Лічильник змін набору назв (_add_name/_drop_name) — версія словника OCR
+        self._names_version = 0
+
+        # Стан журналу читаємо до завантаження даних: зміни, що прийдуть під
+        # час завантаження, будуть застосовані повторно (операції ідемпотентні)
+        self._index_version = None
+        self._applied_changes = set()
+        self._last_sync = time.monotonic()
+        state = self._db_index_state()
+        if state is None:
+            print("  Журнал змін індексів недоступний — синхронізацію відкладено")
+        else:
+            self._index_version, self._applied_changes = state
+
+        fingerprint = self._db_fingerprint() if snapshot_path else None
+        if not self._load_index_snapshot(fingerprint):
+            self.local_ingredients = self._load_ingredients_from_db()
+            self.ocr_fixes = self._load_ocr_fixes_from_db()
+            self._build_fuzzy_index()
+            self._save_index_snapshot(fingerprint)
         print(f"IngredientChecker ініціалізований: "
               f"{len(self.local_ingredients)} інгредієнтів, "
               f"{len(self._alias_index)} аліасів, "
               f"{len(self.ocr_fixes)} OCR-виправлень")
 
+    # --- Синхронізація з журналом змін ---
+    def _db_index_state(self):
+        """(MAX(id), id журналу у вікні INDEX_SYNC_LOOKBACK) або None, якщо БД недоступна."""
+        try:
+            from app import app
+            from models import db, IndexChange
+            with app.app_context():
+                latest = db.session.query(db.func.max(IndexChange.id)).scalar() or 0
+                ids = {row[0] for row in db.session.query(IndexChange.id)
+                       .filter(IndexChange.id > latest - INDEX_SYNC_LOOKBACK)}
+                return latest, ids
+        except Exception:
+            return None
+
+    def sync_index(self, force=False):
+        """Застосовує зміни з index_changes, яких цей процес ще не бачив.
+
+        Версія — не просто MAX(id): запис з меншим id може закомітитись
+        пізніше, тому перевіряються всі id у вікні INDEX_SYNC_LOOKBACK під
+        поточною версією проти множини вже застосованих. Перевірка — один
+        запит COUNT, не частіше ніж раз на sync_interval секунд
+        (force=True — негайно). Повертає кількість застосованих змін.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_interval:
+            return 0
+        self._last_sync = now
+        if self._index_version is None:
+            # Під час старту журналу не було — далі рахуємо від поточного стану
+            state = self._db_index_state()
+            if state is not None:
+                self._index_version, self._applied_changes = state
+            return 0
+
+        applied = 0
+        try:
+            from app import app
+            from models import db, IndexChange
+            with app.app_context():
+                floor = self._index_version - INDEX_SYNC_LOOKBACK
+                visible, oldest = (db.session.query(db.func.count(IndexChange.id),
+                                                    db.func.min(IndexChange.id))
+                                   .filter(IndexChange.id > floor).one())
+                # Застосовані id, які вже видалено з журналу, не рахуються
+                known = sum(1 for i in self._applied_changes
+                            if oldest is not None and i >= oldest)
+                if visible <= known:
+                    return 0
+                pending = [row[0] for row in db.session.query(IndexChange.id)
+                           .filter(IndexChange.id > floor)
+                           if row[0] not in self._applied_changes]
+                changes = (IndexChange.query
+                           .filter(IndexChange.id.in_(pending))
+                           .order_by(IndexChange.id)
+                           .all())
+                with self._index_lock:
+                    for change in changes:
+                        self._apply_index_change(change)
+                        self._applied_changes.add(change.id)
+                        self._index_version = max(self._index_version, change.id)
+                        applied += 1
+                    floor = self._index_version - INDEX_SYNC_LOOKBACK
+                    self._applied_changes = {i for i in self._applied_changes if i > floor}
+        except Exception as e:
+            print(f"  Помилка синхронізації індексів: {e}")
+        if applied:
+            print(f"  Індекси синхронізовано: {applied} змін (версія {self._index_version})")
+        return applied
+
+    def _apply_index_change(self, change):
+        """Застосовує один запис журналу; дані читаються з БД на момент застосування."""
+        from models import Ingredient, IngredientAlias
+        if change.entity == 'ingredient':
+            ing = None if change.action == 'remove' else Ingredient.query.get(change.entity_id)
+            if ing is None:
+                self.remove_ingredient(change.entity_id)
+            else:
+                self.update_ingredient(self._ingredient_row(ing))
+                # Аліаси, раніше затінені старою назвою, тепер можуть стати видимими
+                for alias in ing.aliases:
+                    self.update_alias(alias.alias_lower, self._alias_row(alias))
+        elif change.entity == 'alias':
+            alias = None if change.action == 'remove' else IngredientAlias.query.get(change.entity_id)
+            if alias is None:
+                self.remove_alias(change.name)
+            else:
+                self.update_alias(alias.alias_lower, self._alias_row(alias))
+
+    # --- Знімок індексів ---
+    def _db_fingerprint(self):
+        """SHA-256 усіх полів, з яких будуються індекси, або None, якщо БД недоступна.
+
+        Читаються лише кортежі колонок (без ORM-об'єктів і зв'язків),
+        тож це значно дешевше за повне завантаження.
+        """
+        try:
+            from app import app
+            from models import db, Ingredient, IngredientAlias
+            with app.app_context():
+                queries = (
+                    db.session.query(
+                        Ingredient.id, Ingredient.name, Ingredient.inci_name,
+                        Ingredient.risk_level, Ingredient.category,
+                        Ingredient.description, Ingredient.description_en,
+                        Ingredient.cas_number, Ingredient.ewg_score,
+                        Ingredient.eu_max_concentration, Ingredient.is_banned_eu,
+                        Ingredient.verified,
+                    ).order_by(Ingredient.id),
+                    db.session.query(
+                        IngredientAlias.id, IngredientAlias.ingredient_id,
+                        IngredientAlias.alias_lower, IngredientAlias.alias_type,
+                    ).order_by(IngredientAlias.id),
+                )
+                digest = hashlib.sha256()
+                for query in queries:
+                    for row in query.yield_per(5000):
+                        digest.update(repr(tuple(row)).encode('utf-8'))
+                    digest.update(b'\0')
+                return digest.hexdigest()
+        except Exception as e:
+            print(f"  Не вдалося обчислити відбиток БД: {e}")
+            return None
+
+    def _load_index_snapshot(self, fingerprint):
+        if not fingerprint:
+            return False
+        payload = load_snapshot(self.snapshot_path, fingerprint)
+        if payload is None:
+            return False
+        for attr in _SNAPSHOT_ATTRS:
+            setattr(self, attr, payload[attr])
+        print(f"  Індекси завантажено зі знімка {self.snapshot_path}")
+        return True
+
+    def _save_index_snapshot(self, fingerprint):
+        if not fingerprint:
+            return
+        try:
+            save_snapshot(self.snapshot_path, fingerprint,
+                          {attr: getattr(self, attr) for attr in _SNAPSHOT_ATTRS})
+            print(f"  Знімок індексів збережено: {self.snapshot_path}")
+        except Exception as e:
+            print(f"  Не вдалося зберегти знімок індексів: {e}")
+
     # --- Завантаження даних ---
     def _load_ingredients_from_db(self):
         try:
             from app import app
             from models import Ingredient
             with app.app_context():
-                ingredients = []
-                for ing in Ingredient.query.all():
-                    ingredients.append({
-                        "id": ing.id,
-                        "name": ing.name,
-                        "inci_name": ing.inci_name or ing.name,
-                        "risk_level": ing.risk_level,
-                        "category": ing.category,
-                        "description": ing.description,
-                        "description_en": ing.description_en or "",
-                        "cas_number": ing.cas_number,
-                        "ewg_score": ing.ewg_score,
-                        "eu_max_concentration": ing.eu_max_concentration,
-                        "is_banned_eu": ing.is_banned_eu,
-                        "verified": ing.verified,
-                        "source": "database",
-                    })
+                ingredients = [self._ingredient_row(ing) for ing in Ingredient.query.all()]
                 if ingredients:
                     print(f"  Завантажено {len(ingredients)} інгредієнтів з БД")
                     return ingredients
@@ -210,6 +486,43 @@ class IngredientChecker:
             print(f"  Не вдалося завантажити з БД: {e}")
         return self._fallback_ingredients()
 
+    @staticmethod
+    def _ingredient_row(ing):
+        """Словник інгредієнта в тому вигляді, в якому він лежить в індексах."""
+        return {
+            "id": ing.id,
+            "name": ing.name,
+            "inci_name": ing.inci_name or ing.name,
+            "risk_level": ing.risk_level,
+            "category": ing.category,
+            "description": ing.description,
+            "description_en": ing.description_en or "",
+            "cas_number": ing.cas_number,
+            "ewg_score": ing.ewg_score,
+            "eu_max_concentration": ing.eu_max_concentration,
+            "is_banned_eu": ing.is_banned_eu,
+            "verified": ing.verified,
+            "source": "database",
+        }
+
+    @staticmethod
+    def _alias_row(a):
+        ing = a.ingredient
+        return {
+            "id": ing.id,
+            "name": ing.name,
+            "inci_name": ing.inci_name or ing.name,
+            "risk_level": ing.risk_level,
+            "category": ing.category,
+            "description": ing.description,
+            "description_en": ing.description_en or "",
+            "cas_number": ing.cas_number,
+            "ewg_score": ing.ewg_score,
+            "verified": ing.verified,
+            "source": "database",
+            "alias_type": a.alias_type,
+        }
+
     def _load_aliases_from_db(self):
         alias_map = {}
         try:
@@ -220,21 +533,7 @@ class IngredientChecker:
                            .join(Ingredient)
                            .all())
                 for a in aliases:
-                    ing = a.ingredient
-                    alias_map[a.alias_lower] = {
-                        "id": ing.id,
-                        "name": ing.name,
-                        "inci_name": ing.inci_name or ing.name,
-                        "risk_level": ing.risk_level,
-                        "category": ing.category,
-                        "description": ing.description,
-                        "description_en": ing.description_en or "",
-                        "cas_number": ing.cas_number,
-                        "ewg_score": ing.ewg_score,
-                        "verified": ing.verified,
-                        "source": "database",
-                        "alias_type": a.alias_type,
-                    }
+                    alias_map[a.alias_lower] = self._alias_row(a)
                 print(f"  Завантажено {len(alias_map)} аліасів з БД")
         except Exception as e:
             print(f"  Не вдалося завантажити аліаси: {e}")
@@ -327,9 +626,231 @@ class IngredientChecker:
                 self._alias_index[alias_lower] = ingredient_dict
                 self._all_names.append(alias_lower)
 
+        self._build_search_indexes()
+        # Попередній відбір для RapidFuzz; доповнюється інкрементно (add)
+        self._fuzzy_candidates = (FuzzyCandidateIndex(self._all_names)
+                                  if RAPIDFUZZ_AVAILABLE and NUMPY_AVAILABLE else None)
+
         print(f"  Fuzzy-індекс: {len(self._exact_index)} назв + "
               f"{len(self._alias_index)} аліасів = {len(self._all_names)} записів")
 
+    def _build_search_indexes(self):
+        """Будує автомат Ахо–Корасік і пословний trie над назвами та аліасами,
+        а також n-gram індекс підрядків над точними назвами.
+
+        Payload кожного шаблону автомата — (тип, ранг): тип 0 = назва,
+        1 = аліас; ранг — (−довжина, порядковий номер), тож сортування
+        за рангом дає «спершу довші, при рівній довжині — раніше додані».
+        Це той самий порядок, у якому раніше перебиралися назви, і він
+        зберігається при інкрементному додаванні (новий номер — найбільший).
+        Порядковий номер точної назви є також її номером у SubstringIndex.
+        """
+        automaton = AhoCorasick()
+        trie = TokenTrie()
+        substrings = SubstringIndex(min_len=5)
+        self._phrase_automaton = automaton
+        self._phrase_trie = trie
+        self._substring_index = substrings
+        self._index_seq = 0
+        for name in self._exact_index:
+            self._index_phrase(name, 0)
+        for alias in self._alias_index:
+            self._index_phrase(alias, 1)
+        automaton.build()
+        substrings.build()
+
+    def _index_phrase(self, name, kind):
+        """Додає назву (kind 0) або аліас (kind 1) до автомата, trie та індексу підрядків."""
+        seq = self._index_seq
+        self._index_seq += 1
+        self._phrase_automaton.add(name, (kind, (-len(name), seq)))
+        self._phrase_trie.add(name)
+        if kind == 0:
+            self._substring_index.add(name, seq)
+
+    # --- Інкрементне оновлення індексів ---
+    def _add_name(self, name, kind):
+        self._names_version += 1
+        self._all_names.append(name)
+        if self._fuzzy_candidates is not None:
+            self._fuzzy_candidates.add(name)
+        self._index_phrase(name, kind)
+
+    def _drop_name(self, name):
+        """Прибирає назву з усіх структур пошуку, якщо на неї вже ніщо не посилається."""
+        if name in self._exact_index or name in self._alias_index:
+            return
+        self._names_version += 1
+        for ident, existing in enumerate(self._all_names):
+            if existing == name:
+                # Позиції в _all_names — ідентифікатори FuzzyCandidateIndex,
+                # тому замість видалення лишаємо None (RapidFuzz їх пропускає)
+                self._all_names[ident] = None
+                if self._fuzzy_candidates is not None:
+                    self._fuzzy_candidates.remove(ident)
+        self._phrase_automaton.remove(name)
+        self._phrase_trie.remove(name)
+        self._substring_index.remove(name)
+
+    @staticmethod
+    def _ingredient_names(ingredient):
+        names = [ingredient['name'].lower()]
+        inci = ingredient.get('inci_name', '')
+        if inci and inci.lower() != names[0]:
+            names.append(inci.lower())
+        return names
+
+    def add_ingredient(self, ingredient):
+        """Додає інгредієнт (словник як у _load_ingredients_from_db) до індексів."""
+        with self._index_lock:
+            if any(ing['id'] == ingredient['id'] for ing in self.local_ingredients):
+                return self.update_ingredient(ingredient)
+            self.local_ingredients.append(ingredient)
+            names = self._ingredient_names(ingredient)
+            for name in names:
+                is_new = name not in self._exact_index
+                self._exact_index[name] = ingredient
+                if is_new:
+                    self._add_name(name, 0)
+            self._forget_cached(names, added=names)
+
+    def remove_ingredient(self, ingredient_id):
+        """Прибирає інгредієнт і всі його аліаси з індексів.
+
+        Аліаси інших інгредієнтів, які збігалися з прибраними назвами
+        (і тому не індексувалися), стають видимими.
+        """
+        with self._index_lock:
+            names = []
+            for name, ingredient in list(self._exact_index.items()):
+                if ingredient['id'] == ingredient_id:
+                    del self._exact_index[name]
+                    names.append(name)
+            for alias, ingredient in list(self._alias_index.items()):
+                if ingredient['id'] == ingredient_id:
+                    del self._alias_index[alias]
+                    names.append(alias)
+            for name in names:
+                self._drop_name(name)
+            self.local_ingredients = [ing for ing in self.local_ingredients
+                                      if ing['id'] != ingredient_id]
+            self._forget_cached(names, ingredient_id=ingredient_id)
+            for alias_lower, entry in self._shadowed_aliases(names, ingredient_id).items():
+                self.add_alias(alias_lower, entry)
+
+    def _shadowed_aliases(self, names, ingredient_id):
+        """Аліаси з БД серед names, що належать іншим інгредієнтам: {alias_lower: запис}."""
+        if not names:
+            return {}
+        try:
+            from app import app
+            from models import IngredientAlias
+            with app.app_context():
+                aliases = (IngredientAlias.query
+                           .filter(IngredientAlias.alias_lower.in_(names),
+                                   IngredientAlias.ingredient_id != ingredient_id)
+                           .all())
+                return {a.alias_lower: self._alias_row(a) for a in aliases}
+        except Exception as e:
+            print(f"  Не вдалося прочитати затінені аліаси: {e}")
+            return {}
+
+    def update_ingredient(self, ingredient):
+        """Оновлює поля інгредієнта; якщо змінилися назви — переіндексує їх.
+
+        Якщо інгредієнта ще немає в індексах, додає його.
+        """
+        with self._index_lock:
+            current = next((ing for ing in self.local_ingredients
+                            if ing['id'] == ingredient['id']), None)
+            if current is None:
+                return self.add_ingredient(ingredient)
+
+            if self._ingredient_names(current) != self._ingredient_names(ingredient):
+                aliases = {alias: dict(entry) for alias, entry in self._alias_index.items()
+                           if entry['id'] == ingredient['id']}
+                self.remove_ingredient(ingredient['id'])
+                self.add_ingredient(ingredient)
+                for alias, entry in aliases.items():
+                    self._refresh_alias_entry(entry, ingredient)
+                    self.add_alias(alias, entry)
+                return
+
+            # Ті самі назви: словник спільний для local_ingredients і _exact_index
+            current.clear()
+            current.update(ingredient)
+            for entry in self._alias_index.values():
+                if entry['id'] == ingredient['id']:
+                    self._refresh_alias_entry(entry, ingredient)
+            self._forget_cached((), ingredient_id=ingredient['id'])
+
+    @staticmethod
+    def _refresh_alias_entry(entry, ingredient):
+        """Оновлює поля інгредієнта в записі аліаса (набір полів — як у _alias_row)."""
+        for key in entry:
+            if key in ingredient and key != 'alias_type':
+                entry[key] = ingredient[key]
+
+    def add_alias(self, alias_lower, ingredient):
+        """Додає аліас (ingredient — словник як у _load_aliases_from_db)."""
+        with self._index_lock:
+            if alias_lower in self._exact_index:
+                return
+            is_new = alias_lower not in self._alias_index
+            self._alias_index[alias_lower] = ingredient
+            if is_new:
+                self._add_name(alias_lower, 1)
+            self._forget_cached([alias_lower], added=[alias_lower])
+
+    def remove_alias(self, alias_lower):
+        with self._index_lock:
+            entry = self._alias_index.pop(alias_lower, None)
+            if entry is None:
+                return
+            self._drop_name(alias_lower)
+            # Fuzzy/підрядкові збіги з аліасом кешуються під іншими ключами
+            # з даними інгредієнта — прибираємо всі результати з ним
+            self._forget_cached([alias_lower], ingredient_id=entry.get('id'))
+
+    def update_alias(self, alias_lower, ingredient):
+        with self._index_lock:
+            previous = self._alias_index.get(alias_lower)
+            if previous is None:
+                return self.add_alias(alias_lower, ingredient)
+            self._alias_index[alias_lower] = ingredient
+            self._forget_cached([alias_lower], ingredient_id=previous.get('id'))
+
+    def _forget_cached(self, names, ingredient_id=None, added=()):
+        """Видаляє з search_cache лише записи, на які могла вплинути зміна.
+
+          - ключі, що збігаються зі зміненими назвами;
+          - результати, що посилаються на змінений інгредієнт;
+          - непрямі збіги (fuzzy, підрядок, евристика, зовнішні джерела),
+            які щойно додана назва могла б перевершити.
+        """
+        names = set(names)
+
+        def affected(key, data, source):
+            if key in names:
+                return True
+            if ingredient_id is not None and source == 'local' and data.get('id') == ingredient_id:
+                return True
+            if data.get('match_type') in ('exact', 'alias'):
+                return False
+            return any(self._could_match(key, name) for name in added)
+
+        self.search_cache.invalidate(affected)
+
+    def _could_match(self, query, name):
+        """Чи могла б назва name знайтися для запиту query (підрядок або fuzzy)."""
+        if len(query) > 4 and len(name) >= 5 and (query in name or name in query):
+            return True
+        if RAPIDFUZZ_AVAILABLE and len(query) >= 4:
+            threshold = self._fuzzy_threshold(query)
+            return (fuzz.token_sort_ratio(query, name) >= threshold
+                    or fuzz.partial_ratio(query, name) >= threshold + 5)
+        return False
+
     # --- Очищення тексту ---
     def clean_text(self, text):
         if not text:
@@ -349,185 +870,168 @@ class IngredientChecker:
         return text
 
     # --- Фільтр кандидатів ---
-    def is_potential_ingredient(self, text):
+    def is_potential_ingredient(self, text, with_reason=False, ml_verdicts=None):
+        """Чи схожий фрагмент тексту на назву інгредієнта.
+
+        З with_reason=True повертає (рішення, код причини). Коди відмови:
+        too_short, stop_word, too_long, stop_phrase, title_case, postal_code,
+        geo, country, non_ingredient, digits_only, numeric, mixed_script,
+        marketing, ml_rejected, no_evidence. Для прийнятих кандидатів
+        код — None.
+
+        ml_verdicts — готові рішення ML-фільтра {текст: bool} з _prefetch_ml;
+        для текстів поза ним модель викликається як раніше.
+        """
+        accepted, reason = self._classify_candidate(text, ml_verdicts)
+        return (accepted, reason) if with_reason else accepted
+
+    def _prefetch_ml(self, texts):
+        """Рішення ML-фільтра для всіх texts, яким він потрібен, одним пакетним викликом."""
+        if not ML_CLASSIFIER_AVAILABLE:
+            return {}
+        pending = [t for t in dict.fromkeys(texts)
+                   if self._classify_candidate(t, defer_ml=True)[1] == 'ml_pending']
+        if not pending:
+            return {}
+        return dict(zip(pending, ml_is_ingredient_batch(pending)))
+
+    def _classify_candidate(self, text, ml_verdicts=None, defer_ml=False):
+        """(рішення, код причини); з defer_ml=True замість виклику моделі
+        повертає (None, 'ml_pending')."""
         if not text or len(text) < 3:
-            return False
+            return False, 'too_short'
         text_lower = text.lower().strip()
         if text_lower in self.stop_words:
-            return False
+            return False, 'stop_word'
         if len(text) > 100:
-            return False
+            return False, 'too_long'
 
-        stop_phrases = [
-            'isntree', 'clinically proven', 'non-irritating',
-            'an emulsion', 'how to use', 'at the last stage',
-            'apply proper amount', 'until absorbed', 'cautions for use',
-            'if skin irritations', 'seek immediate medical',
-            'do not apply on wounded area', 'cautions for storage',
-            'keep out of reach', 'keep out of direct sunlight',
-            'the manufacturing number', 'expiration date',
-            'manufacturing distributor', 'manufacturer',
-            'republic of korea', 'made in', 'distributed by',
-        ]
-        if any(phrase in text_lower for phrase in stop_phrases):
-            return False
+        if _STOP_PHRASES_RE.search(text_lower):
+            return False, 'stop_phrase'
 
         words = text.split()
         if len(words) >= 2 and all(w[0].isupper() for w in words if w):
-            inci_suffixes = ['ate', 'ide', 'one', 'ene', 'ol', 'ic', 'in', 'ium', 'ester', 'acid', 'gum']
-            if not any(text_lower.endswith(suf) for suf in inci_suffixes):
-                return False
+            if not text_lower.endswith(INCI_SUFFIXES):
+                return False, 'title_case'
 
-        postal_regexes = [
-            r'\b[A-Z]{1,2}\d[A-Z\d]?\s?\d[A-Z]{2}\b',
-            r'\b[A-Z]{2,3}\d?[A-Z]?\s?\d[A-Z]{2}\b',
-            r'\b[A-Z]\d[A-Z]\s?\d[A-Z]\d\b',
-            r'\b\d{5}(-\d{4})?\b',
-            r'\b\d{5,6}\b',
-        ]
-        if any(re.search(p, text) for p in postal_regexes):
-            return False
+        if _POSTAL_RE.search(text):
+            return False, 'postal_code'
 
-        country_codes = {
-            'uk', 'gb', 'be', 'fr', 'de', 'us', 'ca', 'it', 'es', 'pt', 'nl',
-            'ru', 'ua', 'pl', 'cz', 'sk', 'hu', 'ro', 'bg', 'gr', 'se', 'no',
-            'dk', 'fi', 'ee', 'lv', 'lt', 'jp', 'kr', 'cn', 'in', 'br', 'au', 'nz',
-            'ch', 'at', 'ie', 'mx', 'ar', 'tr'
-        }
-        city_names = {
-            'london', 'paris', 'berlin', 'tokyo', 'seoul', 'toronto', 'sydney',
-            'kyiv', 'kiev', 'moscow', 'москва', 'київ', 'киев',
-            'new york', 'los angeles', 'chicago', 'washington', 'san francisco',
-            'warsaw', 'praha', 'vienna', 'budapest', 'bucuresti', 'sofia',
-            'рим', 'мадрид', 'берлин', 'варшава', 'париж'
-        }
-        if re.fullmatch(r'[A-Za-zА-Яа-я\s/,\-]+', text):
-            tokens = re.split(r'[\s/,]+', text.strip())
-            geo_keywords = {'область', 'област', 'республика', 'край', 'район',
-                            'місто', 'село', 'смт', 'region', 'district', 'city',
-                            'province', 'state', 'county'}
+        if _GEO_TEXT_RE.fullmatch(text):
+            tokens = _GEO_SPLIT_RE.split(text.strip())
             if tokens and all(
-                t.lower() in country_codes or
-                t.lower() in city_names or
-                t.lower() in geo_keywords or
+                t.lower() in COUNTRY_CODES or
+                t.lower() in CITY_NAMES or
+                t.lower() in GEO_KEYWORDS or
                 (len(t) <= 2 and t.isupper())
                 for t in tokens if t
             ):
-                return False
+                return False, 'geo'
 
-        single_country = {
-            'україна', 'ukraine', 'россия', 'russia', 'беларусь', 'belarus',
-            'сша', 'usa', 'канада', 'canada', 'великобритания', 'uk',
-            'франция', 'france', 'германия', 'germany', 'италия', 'italy',
-            'испания', 'spain', 'польша', 'poland'
-        }
-        if text_lower.strip() in single_country:
-            return False
+        if text_lower.strip() in SINGLE_COUNTRIES:
+            return False, 'country'
 
-        non_ingredient_markers = [
-            'building', 'kesson', 'eonju-ro', 'inc.', 'ltd.', 'co.',
-            'gmbh', 'distributor', 'expiration',
-            'cautions', 'keep out', 'sunlight', 'reach of',
-            'manufactured', 'address', 'tel', 'fax', 'zip', 'city',
-            'country', 'part no', 'lot no', 'batch', 'www.', '.com',
-            '©', '®', '™', 'please', 'visit', 'our website',
-            'contact', 'phone', 'inquiries', 'head office',
-            'street', 'road', 'avenue', 'blvd', 'drive',
-            'apt', 'suite', 'postal', 'code', 'po box',
-        ]
-        if any(marker in text_lower for marker in non_ingredient_markers):
-            return False
+        if _NON_INGREDIENT_RE.search(text_lower):
+            return False, 'non_ingredient'
 
         if text.isdigit():
-            return False
+            return False, 'digits_only'
 
-        if re.match(r'^\d', text) and not re.match(r'^ci\s*\d+', text_lower):
-            if not re.search(r'[a-zA-Z]{3,}', text):
-                return False
+        if _DIGIT_RE.match(text) and not _CI_NUMBER_RE.match(text_lower):
+            if not _LATIN_WORD_RE.search(text):
+                return False, 'numeric'
 
-        has_latin = bool(re.search(r'[a-zA-Z]', text))
-        has_cyrillic = bool(re.search(r'[а-яА-ЯіІїЇєЄ]', text))
+        has_latin = bool(_LATIN_RE.search(text))
+        has_cyrillic = bool(_CYRILLIC_RE.search(text))
         if has_cyrillic and has_latin:
             latin_count = sum(1 for c in text if c.isascii() and c.isalpha())
             if latin_count < 4:
-                return False
+                return False, 'mixed_script'
 
         if len(words) == 1 or '-' in text:
-            chemical_suffixes = [
-                'ate', 'ide', 'one', 'ene', 'ol', 'ic', 'in', 'ose',
-                'ium', 'ester', 'oil', 'acid', 'al', 'ane',
-            ]
-            for suffix in chemical_suffixes:
-                if text_lower.endswith(suffix) and len(text) > 3:
-                    return True
-            if re.search(r'\d', text):
-                return True
+            if len(text) > 3 and text_lower.endswith(CHEMICAL_SUFFIXES):
+                return True, None
+            if _DIGIT_RE.search(text):
+                return True, None
             if text_lower in self._exact_index or text_lower in self._alias_index:
-                return True
+                return True, None
 
         if 2 <= len(words) <= 4:
-            marketing_words = [
-                'продукція', 'косметична', 'гігієнічна', 'призначено',
-                'зберігати', 'виготовлювач', 'росія', 'область', 'україна',
-            ]
-            if not any(mw in text_lower for mw in marketing_words):
-                if re.search(r'[a-zA-Z]', text):
-                    if ML_CLASSIFIER_AVAILABLE and len(words) >= 2:
-                        if not ml_is_ingredient(text):
-                            return False
-                    return True
-        return False
+            if _MARKETING_RE.search(text_lower):
+                return False, 'marketing'
+            if has_latin:
+                if ML_CLASSIFIER_AVAILABLE and len(words) >= 2:
+                    if ml_verdicts and text in ml_verdicts:
+                        verdict = ml_verdicts[text]
+                    elif defer_ml:
+                        return None, 'ml_pending'
+                    else:
+                        verdict = ml_is_ingredient(text)
+                    if not verdict:
+                        return False, 'ml_rejected'
+                return True, None
+        return False, 'no_evidence'
 
     # --- Виділення кандидатів ---
     def _split_into_ingredient_phrases(self, text_without_delimiters):
+        """
+        Сегментує текст без роздільників на фрази-інгредієнти.
+
+        Жадібний найдовший збіг за пословним trie відомих назв та аліасів
+        (один прохід вперед). Fuzzy-пошук запускається лише для відрізків
+        зі слів, з яких не починається жодна відома назва.
+        """
         tokens = text_without_delimiters.split()
         if not tokens:
             return []
+        if self._phrase_trie is None:
+            self._build_search_indexes()
 
+        tokens_lower = [t.lower() for t in tokens]
         phrases = []
         idx = 0
-        max_phrase_len = 6
 
         while idx < len(tokens):
-            best_len = 0
-            best_phrase = None
-
-            for length in range(min(max_phrase_len, len(tokens) - idx), 0, -1):
-                candidate_words = tokens[idx:idx+length]
-                candidate_phrase = ' '.join(candidate_words)
-                candidate_lower = candidate_phrase.lower()
+            match_len = self._phrase_trie.longest_match(tokens_lower, idx)
+            if match_len:
+                phrases.append(' '.join(tokens[idx:idx+match_len]))
+                idx += match_len
+                continue
 
-                if candidate_lower in self._exact_index or candidate_lower in self._alias_index:
-                    best_len = length
-                    best_phrase = candidate_phrase
-                    break
+            # Відрізок слів без точних збігів — до наступного відомого слова
+            run_end = idx + 1
+            while (run_end < len(tokens)
+                   and not self._phrase_trie.longest_match(tokens_lower, run_end)):
+                run_end += 1
+            phrases.extend(self._split_unmatched_run(tokens[idx:run_end]))
+            idx = run_end
 
-                if not best_phrase:
-                    for name in self._exact_index:
-                        if candidate_lower in name or name in candidate_lower:
-                            best_len = length
-                            best_phrase = candidate_phrase
-                            break
+        return phrases
 
-                if not best_phrase and RAPIDFUZZ_AVAILABLE and len(candidate_lower) >= 4:
+    def _split_unmatched_run(self, tokens, max_phrase_len=6):
+        """Fuzzy-сегментація відрізка слів, що не збіглися з trie."""
+        phrases = []
+        idx = 0
+        while idx < len(tokens):
+            best_len = 1
+            if RAPIDFUZZ_AVAILABLE:
+                for length in range(min(max_phrase_len, len(tokens) - idx), 0, -1):
+                    candidate_lower = ' '.join(tokens[idx:idx+length]).lower()
+                    if len(candidate_lower) < 4:
+                        continue
+                    choices = self._all_names
+                    if self._fuzzy_candidates is not None:
+                        choices, _ = self._fuzzy_candidates.candidates(candidate_lower, 85)
                     result = process.extractOne(
-                        candidate_lower, self._all_names,
+                        candidate_lower, choices,
                         scorer=fuzz.token_sort_ratio,
                         score_cutoff=85
                     )
                     if result:
                         best_len = length
-                        best_phrase = candidate_phrase
                         break
-
-            if best_phrase:
-                phrases.append(best_phrase)
-                idx += best_len
-            else:
-                single_word = tokens[idx]
-                phrases.append(single_word)
-                idx += 1
-
+            phrases.append(' '.join(tokens[idx:idx+best_len]))
+            idx += best_len
         return phrases
 
     def _find_known_phrases(self, text):
@@ -536,28 +1040,34 @@ class IngredientChecker:
         (точні, аліаси, fuzzy) і повертає список знайдених фраз
         у порядку їх появи.
         """
-        found = []
+        return [phrase for _, _, phrase in self._find_known_spans(text)]
+
+    def _find_known_spans(self, text):
+        """
+        Те саме, що _find_known_phrases, але повертає (позиція, довжина, фраза).
+
+        Точні назви та аліаси знаходяться за один прохід автомата
+        Ахо–Корасік; при перетинах лишається довша фраза.
+        """
+        if self._phrase_automaton is None:
+            self._build_search_indexes()
+
         text_lower = text.lower()
-        # Спочатку точні збіги та аліаси
-        for name in sorted(self._exact_index, key=len, reverse=True):
-            idx = 0
-            while True:
-                pos = text_lower.find(name, idx)
-                if pos == -1:
-                    break
-                original = text[pos:pos+len(name)]
-                found.append((pos, len(name), original))
-                idx = pos + 1
-        for alias in sorted(self._alias_index, key=len, reverse=True):
-            idx = 0
-            while True:
-                pos = text_lower.find(alias, idx)
-                if pos == -1:
-                    break
-                original = text[pos:pos+len(alias)]
-                if not any(f[0] <= pos < f[0]+f[1] for f in found):
-                    found.append((pos, len(alias), original))
-                idx = pos + 1
+        exact_hits = []
+        alias_hits = []
+        for pos, length, (kind, rank) in self._phrase_automaton.iter_matches(text_lower):
+            if kind == 0:
+                exact_hits.append((rank, pos, length))
+            else:
+                alias_hits.append((rank, pos, length))
+
+        # Точні збіги та аліаси (довші назви мають пріоритет)
+        found = []
+        for _, pos, length in sorted(exact_hits):
+            found.append((pos, length, text[pos:pos+length]))
+        for _, pos, length in sorted(alias_hits):
+            if not any(f[0] <= pos < f[0]+f[1] for f in found):
+                found.append((pos, length, text[pos:pos+length]))
 
         # Fuzzy‑пошук тільки якщо rapidfuzz доступний і кандидатів мало
         if RAPIDFUZZ_AVAILABLE and len(found) < 5:
@@ -581,7 +1091,7 @@ class IngredientChecker:
             else:
                 if length > filtered[-1][1]:
                     filtered[-1] = (pos, length, phrase)
-        return [phrase for _, _, phrase in filtered]
+        return filtered
 
     def extract_ingredient_candidates(self, text):
         if not text:
@@ -639,9 +1149,13 @@ class IngredientChecker:
 
         has_delimiters = bool(re.search(r'[;,\.\+*]', ingredients_text))
 
-        # Стандартне розбиття за роздільниками
         candidates = []
-        items = re.split(r'[,;]', ingredients_text)
+        if has_delimiters:
+            # Стандартне розбиття за роздільниками
+            items = re.split(r'[,;]', ingredients_text)
+        else:
+            # Етикетка без роздільників — сегментація за словником назв
+            items = self._split_into_ingredient_phrases(ingredients_text)
 
         marketing_keywords = [
             'продукція', 'косметична', 'гігієнічна', 'миюча',
@@ -652,6 +1166,7 @@ class IngredientChecker:
             'виникнення', 'алергічної', 'реакції', 'подразнення',
         ]
 
+        filtered_items = []
         for item in items:
             item = item.strip()
             if not item or len(item) < 3:
@@ -665,14 +1180,20 @@ class IngredientChecker:
                 continue
             if re.search(r'\d{2,}', item) and not re.search(r'ci\s*\d+', item_lower):
                 continue
-            if self.is_potential_ingredient(item):
-                candidates.append(item)
+            filtered_items.append(item)
 
         # ЗАВЖДИ запускаємо пошук за відомими назвами (з бази та аліасів)
         print("  Додатковий пошук за базою інгредієнтів...")
         known_phrases = self._find_known_phrases(ingredients_text)
+
+        # ML-фільтр для всіх кандидатів — один пакетний прохід моделі
+        ml_verdicts = self._prefetch_ml(filtered_items + known_phrases)
+
+        for item in filtered_items:
+            if self.is_potential_ingredient(item, ml_verdicts=ml_verdicts):
+                candidates.append(item)
         for phrase in known_phrases:
-            if phrase not in candidates and self.is_potential_ingredient(phrase):
+            if phrase not in candidates and self.is_potential_ingredient(phrase, ml_verdicts=ml_verdicts):
                 candidates.append(phrase)
 
         # Якщо все ще мало, додаємо окремі слова (крім стоп-слів)
@@ -697,11 +1218,30 @@ class IngredientChecker:
         return unique
 
     # --- Локальний пошук ---
-    def _search_local(self, ingredient_name):
+    def _search_local(self, ingredient_name, fuzzy_results=None):
+        """Локальний пошук: точний → аліас → підрядок → fuzzy.
+
+        fuzzy_results — заздалегідь пораховані пакетом результати
+        fuzzy-пошуку (див. _prefetch_fuzzy); якщо запит там є,
+        RapidFuzz повторно не викликається.
+        """
         ingredient_lower = ingredient_name.lower().strip()
         if not ingredient_lower or len(ingredient_lower) < 2:
             return None, None, None
 
+        direct = self._search_direct(ingredient_lower)
+        if direct[0]:
+            return direct
+
+        if RAPIDFUZZ_AVAILABLE and len(ingredient_lower) >= 4:
+            if fuzzy_results is not None and ingredient_lower in fuzzy_results:
+                return fuzzy_results[ingredient_lower]
+            return self._fuzzy_search(ingredient_lower)
+
+        return None, None, None
+
+    def _search_direct(self, ingredient_lower):
+        """Точний збіг, аліас або підрядок (без fuzzy)."""
         exact = self._exact_index.get(ingredient_lower)
         if exact:
             return exact, 'exact', 100.0
@@ -711,32 +1251,45 @@ class IngredientChecker:
             return alias_match, 'alias', 100.0
 
         if len(ingredient_lower) > 4:
-            for name, ingredient in self._exact_index.items():
-                if len(name) > 4 and (ingredient_lower in name or name in ingredient_lower):
-                    return ingredient, 'substring', 90.0
-
-        if RAPIDFUZZ_AVAILABLE and len(ingredient_lower) >= 4:
-            return self._fuzzy_search(ingredient_lower)
+            if self._substring_index is None:
+                self._build_search_indexes()
+            ordinal = self._substring_index.first_match(ingredient_lower)
+            if ordinal is not None:
+                name = self._substring_index.get(ordinal)
+                return self._exact_index[name], 'substring', 90.0
 
         return None, None, None
 
+    @staticmethod
+    def _fuzzy_threshold(query):
+        return 85 if len(query) <= 10 else 78
+
     def _fuzzy_search(self, query):
         if not RAPIDFUZZ_AVAILABLE or not self._all_names:
             return None, None, None
 
-        threshold = 85 if len(query) <= 10 else 78
+        threshold = self._fuzzy_threshold(query)
+
+        # Відсікаємо назви, що гарантовано не досягнуть порогу
+        token_choices = partial_choices = self._all_names
+        if self._fuzzy_candidates is not None:
+            token_choices, partial_choices = self._fuzzy_candidates.candidates(
+                query, threshold, threshold + 5)
 
         result_token = process.extractOne(
-            query, self._all_names,
+            query, token_choices,
             scorer=fuzz.token_sort_ratio,
             score_cutoff=threshold,
         )
         result_partial = process.extractOne(
-            query, self._all_names,
+            query, partial_choices,
             scorer=fuzz.partial_ratio,
             score_cutoff=threshold + 5,
         )
+        return self._pick_fuzzy(query, result_token, result_partial)
 
+    def _pick_fuzzy(self, query, result_token, result_partial):
+        """Обирає кращий з результатів token_sort_ratio та partial_ratio."""
         best_name = None
         best_score = 0.0
 
@@ -757,31 +1310,137 @@ class IngredientChecker:
 
         return None, None, None
 
+    def _batch_fuzzy_search(self, queries):
+        """Fuzzy-пошук для багатьох запитів одним викликом process.cdist.
+
+        Повертає {запит: (інгредієнт, 'fuzzy', оцінка) | (None, None, None)}
+        з тими самими результатами, що й _fuzzy_search для кожного запиту.
+        Скорування йде у C++ на всіх ядрах (workers=-1).
+        """
+        queries = list(dict.fromkeys(q for q in queries if len(q) >= 4))
+        if not queries or not RAPIDFUZZ_AVAILABLE or not self._all_names:
+            return {}
+        if not NUMPY_AVAILABLE:
+            return {q: self._fuzzy_search(q) for q in queries}
+
+        thresholds = [self._fuzzy_threshold(q) for q in queries]
+        if self._fuzzy_candidates is not None:
+            token_ids, partial_ids = zip(*(
+                self._fuzzy_candidates.candidate_ids(q, t, t + 5)
+                for q, t in zip(queries, thresholds)))
+        else:
+            all_ids = np.arange(len(self._all_names))
+            token_ids = partial_ids = [all_ids] * len(queries)
+
+        token_best = self._batch_best(queries, token_ids, fuzz.token_sort_ratio,
+                                      thresholds)
+        partial_best = self._batch_best(queries, partial_ids, fuzz.partial_ratio,
+                                        [t + 5 for t in thresholds])
+        return {q: self._pick_fuzzy(q, token, partial)
+                for q, token, partial in zip(queries, token_best, partial_best)}
+
+    def _batch_best(self, queries, ids_per_query, scorer, cutoffs):
+        """Найкращий (назва, оцінка) або None для кожного запиту.
+
+        Стовпці матриці — об'єднання кандидатів усіх запитів у вихідному
+        порядку _all_names, тож argmax по рядку дає той самий перший
+        найкращий збіг, що й extractOne. Якщо кандидати запитів майже
+        не перетинаються і ядро одне, повна матриця дорожча за окремі
+        виклики — тоді скоруємо кожен запит лише по його кандидатах.
+        """
+        mask = np.zeros(len(self._all_names), dtype=bool)
+        for ids in ids_per_query:
+            mask[ids] = True
+        union = np.flatnonzero(mask)
+        if not len(union):
+            return [None] * len(queries)
+
+        workers = os.cpu_count() or 1
+        if len(queries) * len(union) > workers * sum(len(ids) for ids in ids_per_query):
+            results = []
+            for q, ids, cutoff in zip(queries, ids_per_query, cutoffs):
+                result = process.extractOne(q, [self._all_names[i] for i in ids],
+                                            scorer=scorer, score_cutoff=cutoff)
+                results.append(result[:2] if result else None)
+            return results
+
+        choices = [self._all_names[i] for i in union]
+        scores = process.cdist(queries, choices, scorer=scorer,
+                               score_cutoff=min(cutoffs), dtype=np.float64, workers=-1)
+        best = np.argmax(scores, axis=1)
+        results = []
+        for row, cutoff in enumerate(cutoffs):
+            score = float(scores[row, best[row]])
+            results.append((choices[best[row]], score) if score >= cutoff else None)
+        return results
+
+    def _prefetch_fuzzy(self, candidates):
+        """Пакетний fuzzy-пошук для кандидатів, що не знайдені напряму.
+
+        Відтворює порядок search_ingredient: спершу fuzzy за вихідною
+        назвою, і лише для тих, де він не спрацював, — пряма перевірка
+        та fuzzy за очищеною назвою.
+        """
+        if not RAPIDFUZZ_AVAILABLE:
+            return {}
+
+        pending = []
+        for candidate in candidates:
+            if not isinstance(candidate, str):
+                continue
+            name = candidate.strip()
+            if not name or name.lower() in self.search_cache:
+                continue
+            query = name.lower().strip()
+            if len(query) >= 2 and not self._search_direct(query)[0]:
+                pending.append((name, query))
+
+        results = self._batch_fuzzy_search(q for _, q in pending)
+
+        second = []
+        for name, query in pending:
+            if results.get(query, (None,))[0]:
+                continue
+            cleaned = self.clean_text(name)
+            if cleaned == name.lower():
+                continue
+            cleaned_query = cleaned.lower().strip()
+            if len(cleaned_query) >= 2 and not self._search_direct(cleaned_query)[0]:
+                second.append(cleaned_query)
+
+        results.update(self._batch_fuzzy_search(
+            q for q in second if q not in results))
+        return results
+
     # --- Основний пошук ---
-    def search_ingredient(self, ingredient_name):
+    def search_ingredient(self, ingredient_name, fuzzy_results=None):
         if not ingredient_name or not isinstance(ingredient_name, str):
             return self._create_not_found_response(ingredient_name or "")
 
+        self.sync_index()
         ingredient_name = ingredient_name.strip()
         cache_key = ingredient_name.lower()
 
-        if cache_key in self.search_cache:
-            cached = self.search_cache[cache_key]
-            if datetime.now() - cached['timestamp'] < timedelta(hours=24):
-                return cached['data']
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
         cleaned_name = self.clean_text(ingredient_name)
 
-        local_result, match_type, match_score = self._search_local(ingredient_name)
-        if not local_result and cleaned_name != ingredient_name.lower():
-            local_result, match_type, match_score = self._search_local(cleaned_name)
+        with self._index_lock:
+            local_result, match_type, match_score = self._search_local(
+                ingredient_name, fuzzy_results)
+            if not local_result and cleaned_name != ingredient_name.lower():
+                local_result, match_type, match_score = self._search_local(
+                    cleaned_name, fuzzy_results)
+            # Копія — запис індексу оновлюється на місці (update_ingredient)
+            local_result = dict(local_result) if local_result else None
 
         if local_result:
-            result = dict(local_result)
+            result = local_result
             result['match_type'] = match_type
             result['match_score'] = match_score
-            self._cache(cache_key, result, 'local')
-            return result
+            return self.search_cache.put(cache_key, result, 'local')
 
         if self.use_cache:
             try:
@@ -789,25 +1448,15 @@ class IngredientChecker:
                 if external_result and external_result.get('source') != 'not_found':
                     external_result['match_type'] = 'external'
                     external_result['match_score'] = None
-                    self._cache(cache_key, external_result, 'external')
-
                     if self.auto_save_unknown:
                         self._auto_save_to_db(external_result)
 
-                    return external_result
+                    return self.search_cache.put(cache_key, external_result, 'external')
             except Exception as e:
                 print(f"  Помилка зовнішнього пошуку: {e}")
 
         not_found = self._create_not_found_response(ingredient_name)
-        self._cache(cache_key, not_found, 'not_found')
-        return not_found
-
-    def _cache(self, key, data, source):
-        self.search_cache[key] = {
-            'data': data,
-            'timestamp': datetime.now(),
-            'source': source,
-        }
+        return self.search_cache.put(cache_key, not_found, 'not_found')
 
     def _create_not_found_response(self, ingredient_name):
         ingredient_lower = ingredient_name.lower() if ingredient_name else ""
@@ -830,7 +1479,7 @@ class IngredientChecker:
     def _auto_save_to_db(self, ingredient_dict):
         try:
             from app import app
-            from models import db, Ingredient
+            from models import db, Ingredient, record_index_change
             with app.app_context():
                 name = ingredient_dict.get('name', '')
                 if not name:
@@ -859,37 +1508,95 @@ class IngredientChecker:
                     created_at=datetime.now(timezone.utc)
                 )
                 db.session.add(new_ing)
+                db.session.flush()
+                record_index_change('ingredient', new_ing.id, 'add')
                 db.session.commit()
 
-                self.local_ingredients.append(new_ing.to_dict())
-                name_lower = name.lower()
-                self._exact_index[name_lower] = new_ing.to_dict()
-                self._all_names.append(name_lower)
+                # Інші воркери підхоплять запис журналу через sync_index
+                self.add_ingredient(self._ingredient_row(new_ing))
 
                 print(f"    ✚ Авто-збережено: {name} (verified=False, джерело: {source})")
         except Exception as e:
             print(f"    Помилка авто-збереження: {e}")
 
     # --- Головна функція пошуку інгредієнтів у тексті ---
-    def find_ingredients(self, text):
+    def known_names(self):
+        """Усі назви та аліаси індексу (нижній регістр) — словник для злиття OCR."""
+        with self._index_lock:
+            # None — місця прибраних назв (див. _drop_name)
+            return {name for name in self._all_names if name is not None}
+
+    def vocabulary(self, since=None):
+        """(версія, known_names()) або (версія, None), якщо з версії since назви не змінювались.
+
+        Джерело словника для пулу OCR (ocr_service.start): перевірка
+        версії дешева, повний набір назв будується лише після змін.
+        """
+        with self._index_lock:
+            if since == self._names_version:
+                return since, None
+            return self._names_version, self.known_names()
+
+    @staticmethod
+    def _word_confidences(ocr_tokens):
+        """{слово: довіра} з токенів OCR; для повторів — найнижча довіра."""
+        confidences = {}
+        for token in ocr_tokens:
+            word = normalize_word(token['text'])
+            if word:
+                confidences[word] = min(token['conf'], confidences.get(word, 1.0))
+        return confidences
+
+    @staticmethod
+    def _candidate_confidence(candidate, confidences):
+        """Середня довіра OCR до слів кандидата або None, якщо слів не знайдено."""
+        found = [confidences[w] for w in map(normalize_word, candidate.split()) if w in confidences]
+        return round(sum(found) / len(found), 3) if found else None
+
+    def find_ingredients(self, text, progress=None, ocr_tokens=None):
+        """Інгредієнти з тексту складу.
+
+        progress (callable, необов'язково) отримує події етапів:
+        {'stage': 'candidates', 'count': ...} після виділення кандидатів і
+        {'stage': 'matching', 'count': ...} після пошуку в базі.
+
+        ocr_tokens (необов'язково) — слова OCR з довірою ({'text', 'conf'},
+        timings['tokens'] з ocr.extract_text); тоді кожен результат
+        отримує 'ocr_confidence' — середню довіру до слів кандидата.
+        """
         if not text or not isinstance(text, str):
             print("Текст для аналізу порожній або не є рядком")
             return []
 
         print(f"Пошук інгредієнтів у тексті ({len(text)} символів)")
+        self.sync_index()
 
         # Склеюємо переноси
         text = self._fix_line_breaks(text)
-        candidates = self.extract_ingredient_candidates(text)
+        with self._index_lock:
+            candidates = self.extract_ingredient_candidates(text)
+        if progress is not None:
+            progress({'stage': 'candidates', 'count': len(candidates)})
+
+        # Fuzzy-пошук для всіх кандидатів одним пакетом
+        with self._index_lock:
+            fuzzy_results = self._prefetch_fuzzy(candidates)
+
+        confidences = self._word_confidences(ocr_tokens) if ocr_tokens else None
 
         found_ingredients = []
         seen_names = set()
 
         for position, candidate in enumerate(candidates, start=1):
-            ingredient = self.search_ingredient(candidate)
+            # Результат із кешу незмінний — position додаємо до копії
+            ingredient = dict(self.search_ingredient(candidate, fuzzy_results))
 
             if ingredient['name'] not in seen_names:
                 ingredient['position'] = position
+                if confidences:
+                    confidence = self._candidate_confidence(candidate, confidences)
+                    if confidence is not None:
+                        ingredient['ocr_confidence'] = confidence
                 found_ingredients.append(ingredient)
                 seen_names.add(ingredient['name'])
                 print(f"  #{position}: {ingredient['name']} "
@@ -901,6 +1608,8 @@ class IngredientChecker:
             risk = ing.get('risk_level', 'unknown')
             if risk in risk_stats:
                 risk_stats[risk] += 1
+        if progress is not None:
+            progress({'stage': 'matching', 'count': len(found_ingredients)})
 
         print(f"ПІДСУМОК: {len(found_ingredients)} інгредієнтів | "
               f"високий: {risk_stats['high']} помірний: {risk_stats['medium']} "
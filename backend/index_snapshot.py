@@ -0,0 +1,113 @@
+# index_snapshot.py — збережений на диску знімок індексів IngredientChecker
+"""
+Знімок скомпільованих індексів пошуку інгредієнтів.
+
+Побудова індексів (Ахо–Корасік, trie, n-gram індекси) займає секунди
+на кожному воркері. Знімок зберігає їх один раз і далі лише
+завантажується, доки не зміниться відбиток вмісту БД.
+
+Формат — один файл:
+
+    [pickle-дані][буфери масивів, вирівняні по 64 байти][заголовок][довжина][MAGIC]
+
+Масиви numpy серіалізуються поза pickle (protocol 5, out-of-band) і при
+завантаженні стають read-only представленнями над mmap-файлом: сторінки
+читаються з диска ліниво і спільні для всіх процесів, що відкрили той
+самий знімок. Решта об'єктів (словники, автомат) відновлюються з pickle.
+
+Запис атомарний (тимчасовий файл + os.replace), тож воркери, які
+стартують одночасно, ніколи не бачать недописаний знімок.
+"""
+
+import gc
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+
+# Змінювати при будь-якій зміні структури індексів чи логіки їх побудови
+SNAPSHOT_VERSION = 2
+
+MAGIC = b'CSIDXSNP'
+_ALIGN = 64
+_TAIL = struct.Struct('<Q8s')
+
+
+def _padding(offset):
+    return -offset % _ALIGN
+
+
+def save_snapshot(path, fingerprint, payload):
+    """Атомарно записує payload (будь-який pickle-сумісний об'єкт) у path."""
+    buffers = []
+    data = pickle.dumps(payload, protocol=5, buffer_callback=buffers.append)
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            offset = len(data)
+            layout = []
+            for buf in buffers:
+                raw = buf.raw()
+                pad = _padding(offset)
+                f.write(b'\0' * pad)
+                offset += pad
+                f.write(raw)
+                layout.append((offset, raw.nbytes))
+                offset += raw.nbytes
+            header = pickle.dumps({
+                'version': SNAPSHOT_VERSION,
+                'fingerprint': fingerprint,
+                'payload_size': len(data),
+                'buffers': layout,
+            }, protocol=5)
+            f.write(header)
+            f.write(_TAIL.pack(len(header), MAGIC))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_header(mm):
+    if len(mm) < _TAIL.size:
+        return None
+    header_size, magic = _TAIL.unpack(mm[-_TAIL.size:])
+    if magic != MAGIC or header_size > len(mm) - _TAIL.size:
+        return None
+    return pickle.loads(mm[-_TAIL.size - header_size:-_TAIL.size])
+
+
+def load_snapshot(path, fingerprint):
+    """Повертає payload зі знімка або None, якщо знімка немає чи він застарів."""
+    try:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        header = _read_header(mm)
+        if (header is None or header.get('version') != SNAPSHOT_VERSION
+                or header.get('fingerprint') != fingerprint):
+            mm.close()
+            return None
+
+        view = memoryview(mm)
+        buffers = [view[offset:offset + size] for offset, size in header['buffers']]
+        # Мільйони дрібних об'єктів: без GC завантаження в рази швидше
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return pickle.loads(view[:header['payload_size']], buffers=buffers)
+        finally:
+            if gc_enabled:
+                gc.enable()
+    except Exception as e:
+        print(f"  Пошкоджений знімок індексів {path}: {e}")
+        return None
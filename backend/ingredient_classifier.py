@@ -1,35 +1,196 @@
 # ingredient_classifier.py (локальне завантаження, без інтернету)
-"""Семантичний фільтр інгредієнтів на основі донавченої ModernBERT-base (локально)."""
+"""Семантичний фільтр інгредієнтів на основі донавченої ModernBERT-base (локально).
+
+Тексти оцінюються пакетами: один прохід моделі на пакет із динамічним
+доповненням (padding) до найдовшого тексту в пакеті. Щоб доповнення
+було мінімальним, тексти перед розбиттям на пакети сортуються за
+довжиною. Оцінки кешуються (LRU) за нормалізованим текстом.
+
+Перша ступінь — n-грамний класифікатор (ngram_classifier.py, лише NumPy),
+якщо його модель натренована (ml_training/train_ngram.py). Його впевнені
+оцінки приймаються одразу; до ModernBERT доходять лише тексти з оцінкою
+всередині escalate_band.
+
+Бекенд інференсу обирається змінною середовища
+INGREDIENT_CLASSIFIER_BACKEND:
+  - auto (типово) — ONNX Runtime, якщо є int8-модель
+    (ml_training/export_onnx.py) і встановлено onnxruntime, інакше PyTorch;
+  - onnx — так само, але з попередженням, якщо довелося відкотитися на PyTorch;
+  - torch — завжди повноточна модель через transformers/PyTorch;
+  - ngram — лише n-грамна модель, transformers не завантажується взагалі.
+"""
 import os
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+import threading
+from importlib.util import find_spec
+import numpy as np
+from cachetools import LRUCache
+from ngram_classifier import NgramClassifier, DEFAULT_MODEL_PATH as NGRAM_MODEL_PATH
 
 LOCAL_MODEL_PATH = os.path.join(os.path.dirname(__file__), "ingredient_classifier")
+ONNX_MODEL_PATH = os.path.join(LOCAL_MODEL_PATH, "model.int8.onnx")
+BACKEND = os.environ.get("INGREDIENT_CLASSIFIER_BACKEND", "auto").lower()
+THRESHOLD = 0.6
+BATCH_SIZE = 32
+MAX_LENGTH = 64
+
 _tokenizer = None
-_model = None
+_backend = None      # 'onnx' | 'torch' після load_model()
+_session = None      # onnxruntime.InferenceSession
+_model = None        # torch-модель
 _device = None
+_ngram = None
+_score_cache = LRUCache(maxsize=8192)
+# cachetools не потокобезпечний: get переставляє записи, вставка витісняє
+_cache_lock = threading.Lock()
+_load_lock = threading.Lock()
 
-def load_model():
-    global _tokenizer, _model, _device
-    if _model is not None:
-        return
+TRANSFORMER_ENABLED = BACKEND != "ngram" and find_spec("transformers") is not None
+if not TRANSFORMER_ENABLED and not os.path.exists(NGRAM_MODEL_PATH):
+    raise ImportError("Немає жодної моделі фільтра: transformers вимкнено/відсутній, "
+                      f"а n-грамної моделі {NGRAM_MODEL_PATH} не знайдено")
+
+def _get_ngram():
+    global _ngram
+    if _ngram is None and os.path.exists(NGRAM_MODEL_PATH):
+        with _load_lock:
+            if _ngram is None:
+                _ngram = NgramClassifier.load(NGRAM_MODEL_PATH)
+                low, high = _ngram.escalate_band
+                print(f"[NLP] n-грамна модель завантажена (escalate_band=({low:.3f}, {high:.3f})).")
+                if not TRANSFORMER_ENABLED:
+                    print("[NLP] ModernBERT недоступна — оцінки всередині escalate_band "
+                          f"n-грамна модель вирішує сама (поріг {THRESHOLD}).")
+    return _ngram
+
+def _load_onnx() -> bool:
+    global _session
+    if not os.path.exists(ONNX_MODEL_PATH):
+        return False
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return False
+    print(f"[NLP] Завантаження int8 ONNX-моделі {ONNX_MODEL_PATH}...")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    _session = ort.InferenceSession(ONNX_MODEL_PATH, options,
+                                    providers=["CPUExecutionProvider"])
+    return True
+
+def _load_torch():
+    global _model, _device
+    import torch
+    from transformers import AutoModelForSequenceClassification
     _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"[NLP] Завантаження моделі з локальної папки {LOCAL_MODEL_PATH} на {_device}...")
-    _tokenizer = AutoTokenizer.from_pretrained(LOCAL_MODEL_PATH)
     _model = AutoModelForSequenceClassification.from_pretrained(
         LOCAL_MODEL_PATH, num_labels=2, ignore_mismatched_sizes=True
     )
     _model.to(_device)
     _model.eval()
-    print("[NLP] Модель готова.")
+
+def load_model():
+    global _tokenizer, _backend
+    if _backend is not None:
+        return
+    # Одночасні перші запити не повинні завантажувати модель двічі
+    with _load_lock:
+        if _backend is not None:
+            return
+        from transformers import AutoTokenizer
+        _tokenizer = AutoTokenizer.from_pretrained(LOCAL_MODEL_PATH)
+        if BACKEND in ("auto", "onnx") and _load_onnx():
+            backend = "onnx"
+        else:
+            if BACKEND == "onnx":
+                print(f"[NLP] ONNX-модель недоступна ({ONNX_MODEL_PATH} або onnxruntime), використовую PyTorch")
+            _load_torch()
+            backend = "torch"
+        # _backend — ознака готовності, тож виставляємо його останнім
+        _backend = backend
+    print(f"[NLP] Модель готова (бекенд: {_backend}).")
+
+def _forward_onnx(texts: list) -> list:
+    inputs = _tokenizer(texts, return_tensors="np",
+                        padding=True, truncation=True, max_length=MAX_LENGTH)
+    feed = {i.name: inputs[i.name].astype(np.int64) for i in _session.get_inputs()}
+    logits = _session.run(None, feed)[0]
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return (exp[:, 1] / exp.sum(axis=1)).tolist()
+
+def _forward_torch(texts: list) -> list:
+    import torch
+    inputs = _tokenizer(texts, return_tensors="pt",
+                        padding=True, truncation=True, max_length=MAX_LENGTH)
+    inputs = {k: v.to(_device) for k, v in inputs.items()}
+    with torch.inference_mode():
+        return torch.softmax(_model(**inputs).logits, dim=1)[:, 1].tolist()
+
+def _normalize(text: str) -> str:
+    """Ключ кешу: зайві пробіли не змінюють рішення моделі."""
+    return " ".join(text.split())
+
+def _score_uncached(texts: list) -> list:
+    """Ймовірності класу «інгредієнт» для texts (без кешу): n-грамна модель,
+    а неоднозначні оцінки — ModernBERT."""
+    scores = [None] * len(texts)
+    ngram = _get_ngram()
+    if ngram is not None:
+        low, high = ngram.escalate_band
+        for i, score in enumerate(ngram.score(texts)):
+            if not TRANSFORMER_ENABLED or not low < score < high:
+                scores[i] = score
+    pending = [i for i, score in enumerate(scores) if score is None]
+    if pending:
+        for i, score in zip(pending, _score_transformer([texts[i] for i in pending])):
+            scores[i] = score
+    return scores
+
+def _score_transformer(texts: list) -> list:
+    """Ймовірності класу «інгредієнт» від ModernBERT (пакетами)."""
+    load_model()
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    scores = [0.0] * len(texts)
+    for start in range(0, len(order), BATCH_SIZE):
+        batch = order[start:start + BATCH_SIZE]
+        batch_texts = [texts[i] for i in batch]
+        probs = _forward_onnx(batch_texts) if _backend == "onnx" else _forward_torch(batch_texts)
+        for i, score in zip(batch, probs):
+            scores[i] = score
+    return scores
+
+def score_batch(texts) -> list:
+    """Ймовірність класу «інгредієнт» для кожного тексту (з LRU-кешем)."""
+    keys = [_normalize(t) for t in texts]
+    scores = {}
+    with _cache_lock:
+        for key in dict.fromkeys(keys):
+            score = _score_cache.get(key)
+            if score is not None:
+                scores[key] = score
+    missing = [k for k in dict.fromkeys(keys) if k not in scores]
+    if missing:
+        # Модель — поза замком: інші потоки тим часом читають кеш
+        computed = _score_uncached(missing)
+        with _cache_lock:
+            for key, score in zip(missing, computed):
+                scores[key] = _score_cache[key] = score
+    return [scores[k] for k in keys]
+
+def is_ingredient_batch(texts) -> list:
+    """Для кожного тексту — True, якщо він схожий на назву інгредієнта."""
+    return [score > THRESHOLD for score in score_batch(texts)]
 
 def is_ingredient(text: str) -> bool:
     """Повертає True, якщо текст схожий на назву інгредієнта."""
-    load_model()
-    inputs = _tokenizer(text, return_tensors="pt", truncation=True, max_length=64)
-    inputs = {k: v.to(_device) for k, v in inputs.items()}
-    with torch.no_grad():
-        outputs = _model(**inputs)
-        probs = torch.softmax(outputs.logits, dim=1)
-        score = probs[0, 1].item()
-    return score > 0.6
\ No newline at end of file
+    return is_ingredient_batch([text])[0]
+
+def warm_up():
+    """Завантажує моделі фільтра й проганяє фіктивний пакет повз кеш."""
+    texts = ["Aqua", "Sodium Laureth Sulfate", "Made in Korea"]
+    ngram = _get_ngram()
+    if ngram is not None:
+        ngram.score(texts)
+    if TRANSFORMER_ENABLED:
+        _score_transformer(texts)
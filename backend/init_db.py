@@ -46,8 +46,11 @@ def step_create_tables(app, db):
     print("КРОК 1: Створення таблиць")
     print("─" * 50)
 
+    from models import ensure_schema
+
     with app.app_context():
         db.create_all()
+        ensure_schema()
         print("✓ Таблиці створено/перевірено:")
         print("  • users")
         print("  • ingredients (розширена: inci_name, cas_number, ewg_score, ...)")
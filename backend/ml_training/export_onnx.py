@@ -0,0 +1,140 @@
+# export_onnx.py
+"""Экспорт дообученного классификатора ингредиентов в ONNX с int8-квантизацией.
+
+1. Экспорт ../ingredient_classifier в ONNX (fp32, динамические batch и длина).
+2. Динамическая int8-квантизация весов (onnxruntime.quantization).
+3. Проверка паритета на train.csv: решения int8-модели сравниваются
+   с PyTorch при том же пороге. Если доля изменившихся решений больше
+   допуска, артефакт не устанавливается и скрипт завершается с кодом 1.
+
+Результат — ../ingredient_classifier/model.int8.onnx, который
+ingredient_classifier.py подхватывает автоматически (бекенд auto/onnx).
+
+Запуск: python export_onnx.py [--max-flip-rate 0.01]
+"""
+import os
+import sys
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+import torch
+import onnxruntime as ort
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingredient_classifier import (
+    LOCAL_MODEL_PATH, ONNX_MODEL_PATH, THRESHOLD, BATCH_SIZE, MAX_LENGTH,
+)
+
+TRAIN_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "train.csv")
+OPSET = 17
+
+
+def export_fp32(model, tokenizer, path):
+    sample = tokenizer(["Aqua", "Sodium Laureth Sulfate"], return_tensors="pt",
+                       padding=True, truncation=True, max_length=MAX_LENGTH)
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        opset_version=OPSET,
+        do_constant_folding=True,
+    )
+
+
+def predict_torch(model, tokenizer, texts):
+    scores = []
+    for start in range(0, len(texts), BATCH_SIZE):
+        inputs = tokenizer(texts[start:start + BATCH_SIZE], return_tensors="pt",
+                           padding=True, truncation=True, max_length=MAX_LENGTH)
+        with torch.inference_mode():
+            logits = model(input_ids=inputs["input_ids"],
+                           attention_mask=inputs["attention_mask"]).logits
+        scores.extend(torch.softmax(logits, dim=1)[:, 1].tolist())
+    return np.array(scores)
+
+
+def predict_onnx(path, tokenizer, texts):
+    session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+    scores = []
+    for start in range(0, len(texts), BATCH_SIZE):
+        inputs = tokenizer(texts[start:start + BATCH_SIZE], return_tensors="np",
+                           padding=True, truncation=True, max_length=MAX_LENGTH)
+        logits = session.run(None, {
+            "input_ids": inputs["input_ids"].astype(np.int64),
+            "attention_mask": inputs["attention_mask"].astype(np.int64),
+        })[0]
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        scores.extend((exp[:, 1] / exp.sum(axis=1)).tolist())
+    return np.array(scores)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-flip-rate", type=float, default=0.01,
+                        help="допустимая доля решений, изменившихся после квантизации")
+    args = parser.parse_args()
+
+    # 1. Модель и данные для проверки
+    tokenizer = AutoTokenizer.from_pretrained(LOCAL_MODEL_PATH)
+    # eager-attention: sdpa/flash-варианты ModernBERT не экспортируются в ONNX
+    model = AutoModelForSequenceClassification.from_pretrained(
+        LOCAL_MODEL_PATH, num_labels=2, ignore_mismatched_sizes=True,
+        attn_implementation="eager",
+    )
+    model.eval()
+    df = pd.read_csv(TRAIN_CSV).dropna(subset=["text"])
+    df = df[df["text"].str.strip() != ""]
+    texts = df["text"].tolist()
+    labels = df["label"].to_numpy()
+
+    with tempfile.TemporaryDirectory(dir=LOCAL_MODEL_PATH) as tmp:
+        fp32_path = os.path.join(tmp, "model.onnx")
+        int8_path = os.path.join(tmp, "model.int8.onnx")
+
+        # 2. Экспорт и квантизация
+        print(f"Экспорт в ONNX (opset {OPSET})...")
+        export_fp32(model, tokenizer, fp32_path)
+        print("Динамическая int8-квантизация...")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+        # 3. Паритет с PyTorch
+        ref = predict_torch(model, tokenizer, texts)
+        quant = predict_onnx(int8_path, tokenizer, texts)
+        ref_dec = ref > THRESHOLD
+        quant_dec = quant > THRESHOLD
+        flips = int((ref_dec != quant_dec).sum())
+        flip_rate = flips / len(texts)
+        print(f"Примеров: {len(texts)}")
+        print(f"Точность PyTorch: {(ref_dec == labels).mean():.4f}, "
+              f"int8 ONNX: {(quant_dec == labels).mean():.4f}")
+        print(f"Макс. расхождение вероятностей: {np.abs(ref - quant).max():.4f}")
+        print(f"Изменённых решений: {flips} ({flip_rate:.2%}, допуск {args.max_flip_rate:.2%})")
+        for text, r, q in zip(texts, ref, quant):
+            if (r > THRESHOLD) != (q > THRESHOLD):
+                print(f"  {text!r}: {r:.3f} -> {q:.3f}")
+
+        if flip_rate > args.max_flip_rate:
+            print("Паритет не пройден, модель не установлена.")
+            sys.exit(1)
+
+        os.replace(int8_path, ONNX_MODEL_PATH)
+
+    size_mb = os.path.getsize(ONNX_MODEL_PATH) / 2**20
+    print(f"int8 ONNX-модель сохранена в {ONNX_MODEL_PATH} ({size_mb:.1f} МБ)")
+
+
+if __name__ == "__main__":
+    main()
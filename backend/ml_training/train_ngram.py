@@ -0,0 +1,118 @@
+# train_ngram.py
+"""Обучение лёгкого классификатора ингредиентов на символьных n-граммах.
+
+Логистическая регрессия над хешированными n-граммами (ngram_classifier.py),
+обучается на том же train.csv, что и ModernBERT, только средствами NumPy.
+Модель сохраняется в ../ingredient_classifier/ngram_model.npz и используется
+ingredient_classifier.py как первая ступень фильтра: уверенные оценки
+принимаются сразу, неуверенные (внутри escalate_band) уходят в ModernBERT.
+
+escalate_band калибруется на отложенных оценках (FOLDS-кратная
+кросс-валидация: каждый пример оценивает модель, обученная без него):
+вне полосы доля верных решений не ниже TARGET_PRECISION. Полоса
+сохраняется в .npz вместе с весами.
+
+Запуск: python train_ngram.py
+"""
+import os
+import sys
+import csv
+import random
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ngram_classifier import (
+    NgramClassifier, featurize, DEFAULT_MODEL_PATH, N_FEATURES, NGRAM_RANGE,
+)
+
+TRAIN_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "train.csv")
+THRESHOLD = 0.6      # тот же порог, что в ingredient_classifier.py
+EPOCHS = 1000
+LEARNING_RATE = 10.0
+L2 = 1e-4
+FOLDS = 10
+# Доля верных уверенных решений на отложенных оценках (по каждую сторону полосы)
+TARGET_PRECISION = 0.95
+
+
+def is_valid(text):
+    return text is not None and text.strip() != ""
+
+
+def fit(features, labels, escalate_band=(THRESHOLD, THRESHOLD)):
+    """Полнопакетный градиентный спуск для логистической регрессии с L2."""
+    rows = np.repeat(np.arange(len(features)), [len(f) for f in features])
+    cols = np.concatenate(features)
+    vals = np.repeat([1.0 / np.sqrt(max(len(f), 1)) for f in features],
+                     [len(f) for f in features])
+    y = np.asarray(labels, dtype=np.float64)
+    w = np.zeros(N_FEATURES)
+    b = 0.0
+    for _ in range(EPOCHS):
+        z = np.bincount(rows, weights=w[cols] * vals, minlength=len(y)) + b
+        p = 1.0 / (1.0 + np.exp(-z))
+        err = (p - y) / len(y)
+        grad = np.bincount(cols, weights=err[rows] * vals, minlength=N_FEATURES) + L2 * w
+        w -= LEARNING_RATE * grad
+        b -= LEARNING_RATE * err.sum()
+    return NgramClassifier(w, b, NGRAM_RANGE, escalate_band)
+
+
+def out_of_fold_scores(data):
+    """Оценка каждого примера моделью, обученной на остальных фолдах."""
+    scores = np.zeros(len(data))
+    for k in range(FOLDS):
+        held = [i for i in range(len(data)) if i % FOLDS == k]
+        train = [d for i, d in enumerate(data) if i % FOLDS != k]
+        model = fit([featurize(t) for t, _ in train], [l for _, l in train])
+        scores[held] = model.score([data[i][0] for i in held])
+    return scores
+
+
+def calibrate_band(scores, labels, target=TARGET_PRECISION):
+    """(low, high): среди оценок <= low не-ингредиентов, а среди >= high
+    ингредиентов не меньше target. Полоса всегда содержит THRESHOLD."""
+    order = np.argsort(scores)
+    s, y = scores[order], np.asarray(labels)[order]
+    counts = np.arange(1, len(y) + 1)
+    # Точность «не ингредиент» для порогов s[i] снизу и «ингредиент» — сверху
+    negative_precision = np.cumsum(1 - y) / counts
+    positive_precision = (np.cumsum(y[::-1]) / counts)[::-1]
+    ok = np.nonzero(negative_precision >= target)[0]
+    low = float(s[ok[-1]]) if len(ok) else 0.0
+    ok = np.nonzero(positive_precision >= target)[0]
+    high = float(s[ok[0]]) if len(ok) else 1.0
+    return min(low, THRESHOLD), max(high, THRESHOLD)
+
+
+def report(scores, labels, band, title):
+    scores = np.asarray(scores)
+    labels = np.asarray(labels)
+    low, high = band
+    confident = (scores <= low) | (scores >= high)
+    accuracy = ((scores > THRESHOLD) == labels).mean()
+    confident_accuracy = ((scores[confident] > THRESHOLD) == labels[confident]).mean() if confident.any() else float("nan")
+    print(f"{title}: полоса ({low:.3f}, {high:.3f}), точность {accuracy:.4f}, уверенных {confident.mean():.1%} "
+          f"(точность на них {confident_accuracy:.4f}), в ModernBERT {1 - confident.mean():.1%}")
+
+
+# 1. Загрузка данных
+with open(TRAIN_CSV, encoding="utf-8", newline="") as f:
+    data = [(row["text"], int(row["label"])) for row in csv.DictReader(f) if is_valid(row["text"])]
+
+# 2. Отложенные оценки и калибровка escalate_band
+random.Random(42).shuffle(data)
+labels = [l for _, l in data]
+held_out = out_of_fold_scores(data)
+band = calibrate_band(held_out, labels)
+report(held_out, labels, band, f"Отложенные оценки ({FOLDS} фолдов)")
+
+# 3. Финальное обучение на всех данных и сохранение
+model = fit([featurize(t) for t, _ in data], labels, band)
+report(model.score([t for t, _ in data]), labels, band, "Обучающая выборка")
+os.makedirs(os.path.dirname(DEFAULT_MODEL_PATH), exist_ok=True)
+model.save(DEFAULT_MODEL_PATH)
+print(f"n-граммная модель сохранена в {DEFAULT_MODEL_PATH} "
+      f"({os.path.getsize(DEFAULT_MODEL_PATH) / 1024:.0f} КБ)")
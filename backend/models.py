@@ -10,8 +10,16 @@
      переклади (укр/рус/фр), INCI-альтернативні назви для кожного інгредієнта.
   3. Нова таблиця ScanIngredient — нормалізований зв'язок між Scan та Ingredient
      (замість зберігання JSON у полі ingredients_detected).
+  4. Нова таблиця IndexChange — журнал змін інгредієнтів та аліасів, за яким
+     воркери інкрементно оновлюють індекси пошуку.
+  5. Нова таблиця ScanJob — стан асинхронних завдань сканування
+     (POST /api/analyze?async=1), доступний будь-якому воркеру.
+  6. Scan зберігає ingredients_count та risk_statistics при створенні —
+     історія (GET /api/scans?summary=1) не читає рядки ScanIngredient.
+     Існуючі БД отримують ці колонки через ensure_schema().
 """
 
+import os
 from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
@@ -177,6 +185,50 @@ class IngredientAlias(db.Model):
         }
 
 
+# ═══════════════════════════════════════════════════════════════════
+# ЖУРНАЛ ЗМІН ДЛЯ СИНХРОНІЗАЦІЇ ІНДЕКСІВ (НОВА ТАБЛИЦЯ)
+# ═══════════════════════════════════════════════════════════════════
+class IndexChange(db.Model):
+    """
+    Один рядок = одна зміна інгредієнта чи аліаса, що впливає на пошук.
+    Кожен воркер IngredientChecker періодично перечитує останні id
+    журналу, застосовує ще не бачені (зокрема з меншим id, закомічені
+    пізніше) і так оновлює індекси без повної перебудови. Старіші
+    записи видаляються при кожному новому (record_index_change).
+    """
+    __tablename__ = 'index_changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    entity = db.Column(db.String(20), nullable=False)   # 'ingredient' | 'alias'
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)   # 'add' | 'update' | 'remove'
+
+    # alias_lower для аліасів: після видалення рядка його вже не прочитати
+    name = db.Column(db.String(200))
+
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+# Скільки останніх id журналу зберігати. Воркери перевіряють лише вікно
+# INDEX_SYNC_LOOKBACK (checker.py) під своєю версією; подвійний запас —
+# для воркера, що відстав від журналу.
+INDEX_CHANGES_KEEP = 2 * int(os.environ.get('INDEX_SYNC_LOOKBACK', '1000'))
+
+
+def record_index_change(entity, entity_id, action, name=None):
+    """Додає запис у журнал змін у поточній сесії (commit робить викликач).
+
+    Заодно видаляє записи, старші за останні INDEX_CHANGES_KEEP id.
+    """
+    db.session.add(IndexChange(entity=entity, entity_id=entity_id,
+                               action=action, name=name))
+    latest = db.session.query(db.func.max(IndexChange.id)).scalar_subquery()
+    (IndexChange.query
+     .filter(IndexChange.id <= latest - INDEX_CHANGES_KEEP)
+     .delete(synchronize_session=False))
+
+
 # ═══════════════════════════════════════════════════════════════════
 # СКАНУВАННЯ
 # ═══════════════════════════════════════════════════════════════════
@@ -198,14 +250,28 @@ class Scan(db.Model):
     # JSON-поле зберігається для зворотної сумісності
     ingredients_detected = db.Column(db.JSON)
 
+    # Денормалізовані лічильники для списку історії (NULL у старих записах)
+    ingredients_count = db.Column(db.Integer)
+    risk_statistics = db.Column(db.JSON)
+
     # Нормалізований зв'язок (нова таблиця)
     ingredient_links = db.relationship('ScanIngredient', backref='scan',
                                         lazy='dynamic', cascade="all, delete-orphan")
 
-    def get_ingredients_list(self):
-        """Повертає список інгредієнтів (зворотна сумісність з JSON-полем)."""
+    # Keyset-пагінація історії: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+    __table_args__ = (
+        db.Index('idx_scans_user_created_id', 'user_id', 'created_at', 'id'),
+    )
+
+    def get_ingredients_list(self, links=None):
+        """Повертає список інгредієнтів (зворотна сумісність з JSON-полем).
+
+        links — уже завантажені ScanIngredient цього скану (пакетне
+        завантаження для сторінки історії); None — окремий запит.
+        """
         # Спочатку пробуємо нормалізований зв'язок
-        links = self.ingredient_links.all()
+        if links is None:
+            links = self.ingredient_links.all()
         if links:
             return [link.to_dict() for link in links]
 
@@ -222,19 +288,12 @@ class Scan(db.Model):
         except (ValueError, TypeError):
             return []
 
-    def get_risk_statistics(self):
-        ingredients_list = self.get_ingredients_list()
-        stats = {'total': len(ingredients_list),
-                 'high': 0, 'medium': 0, 'low': 0, 'unknown': 0, 'safe': 0}
-        for ing in ingredients_list:
-            risk = ing.get('risk_level', 'unknown')
-            if risk in stats:
-                stats[risk] += 1
-        return stats
-
-    def to_dict(self):
-        ingredients_list = self.get_ingredients_list()
+    def get_risk_statistics(self, ingredients_list=None):
+        if ingredients_list is None:
+            ingredients_list = self.get_ingredients_list()
+        return compute_risk_statistics(ingredients_list)
 
+    def _apply_safety_info(self, ingredients_list):
         if not self.safety_message:
             safety_info = calculate_safety_status_with_message(ingredients_list)
             self.safety_status = safety_info['status']
@@ -242,6 +301,39 @@ class Scan(db.Model):
             self.contains_unknown = safety_info['contains_unknown']
             self.unknown_count = safety_info['unknown_count']
 
+    def to_summary_dict(self):
+        """Скан без списку інгредієнтів — для сторінки історії.
+
+        Лічильники беруться з денормалізованих колонок; для старих
+        записів (NULL) — з JSON-поля, без запиту до scan_ingredients.
+        """
+        count, stats = self.ingredients_count, self.risk_statistics
+        if count is None or stats is None:
+            ingredients_list = self.get_ingredients_list(links=[])
+            self._apply_safety_info(ingredients_list)
+            count = len(ingredients_list)
+            stats = compute_risk_statistics(ingredients_list)
+
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'input_type': self.input_type,
+            'input_method': self.input_method,
+            'original_text': self.original_text,
+            'safety_status': self.safety_status,
+            'safety_message': self.safety_message,
+            'contains_unknown': self.contains_unknown,
+            'unknown_count': self.unknown_count,
+            'image_filename': self.image_filename,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'ingredients_count': count,
+            'risk_statistics': stats,
+        }
+
+    def to_dict(self, links=None):
+        ingredients_list = self.get_ingredients_list(links)
+        self._apply_safety_info(ingredients_list)
+
         return {
             'id': self.id,
             'user_id': self.user_id,
@@ -256,8 +348,49 @@ class Scan(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'ingredients': ingredients_list,
             'ingredients_count': len(ingredients_list),
-            'risk_statistics': self.get_risk_statistics(),
+            'risk_statistics': self.get_risk_statistics(ingredients_list),
+        }
+
+
+# ═══════════════════════════════════════════════════════════════════
+# АСИНХРОННЕ ЗАВДАННЯ СКАНУВАННЯ (НОВА ТАБЛИЦЯ)
+# ═══════════════════════════════════════════════════════════════════
+class ScanJob(db.Model):
+    """
+    Завдання POST /api/analyze?async=1. Виконується у фоні одним воркером,
+    а стан і події прогресу лежать у БД — опитування (/api/jobs/<id>)
+    та SSE-потік може обслуговувати будь-який воркер.
+    """
+    __tablename__ = 'scan_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)   # uuid4().hex
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued | running | done | failed
+    stage = db.Column(db.String(30))
+
+    # Події прогресу: [{'stage': ..., 'at': ISO-час, ...}, ...]
+    events = db.Column(db.JSON, default=list)
+    # Та сама відповідь, що й у синхронного /api/analyze
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def to_dict(self, include_events=True):
+        data = {
+            'id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
+        if include_events:
+            data['events'] = self.events or []
+        return data
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -316,9 +449,73 @@ class ScanIngredient(db.Model):
         }
 
 
+# ═══════════════════════════════════════════════════════════════════
+# ДОДАНІ КОЛОНКИ (МІГРАЦІЯ ІСНУЮЧИХ БД)
+# ═══════════════════════════════════════════════════════════════════
+# db.create_all() не змінює таблиці, що вже існують. Колонки, додані до
+# моделей пізніше (усі nullable), додає ensure_schema() — викликається
+# при старті app.py та в init_db.py.
+ADDED_COLUMNS = {
+    'scans': (('ingredients_count', 'INTEGER'), ('risk_statistics', 'JSON')),
+}
+
+
+def ensure_schema():
+    """Додає відсутні колонки з ADDED_COLUMNS та індекси Scan (потрібен app context).
+
+    Повертає список доданих колонок ('таблиця.колонка'). Якщо колонки
+    немає і додати її не вдалося (наприклад, немає прав на ALTER) —
+    RuntimeError з SQL, який треба виконати вручну.
+    """
+    from sqlalchemy import inspect, text
+    try:
+        inspector = inspect(db.engine)
+        tables = set(inspector.get_table_names())
+    except Exception as e:
+        print(f"  Схему БД не перевірено (БД недоступна): {e}")
+        return []
+
+    if_not_exists = 'IF NOT EXISTS ' if db.engine.dialect.name == 'postgresql' else ''
+    added = []
+    for table, columns in ADDED_COLUMNS.items():
+        if table not in tables:
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table)}
+        for name, ddl_type in columns:
+            if name in existing:
+                continue
+            statement = f'ALTER TABLE {table} ADD COLUMN {if_not_exists}{name} {ddl_type}'
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(text(statement))
+            except Exception as e:
+                raise RuntimeError(
+                    f"У таблиці {table} немає колонки {name}, і додати її не вдалося: {e}. "
+                    f"Виконайте вручну: {statement};") from e
+            added.append(f'{table}.{name}')
+
+    if 'scans' in tables:
+        for index in Scan.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+    if added:
+        print(f"  Додано колонки: {', '.join(added)}")
+    return added
+
+
 # ═══════════════════════════════════════════════════════════════════
 # ФУНКЦІЯ ОЦІНКИ БЕЗПЕКИ (перенесена з app.py)
 # ═══════════════════════════════════════════════════════════════════
+def compute_risk_statistics(ingredients_list):
+    """Кількість інгредієнтів за рівнями ризику: {'total', 'high', ..., 'safe'}."""
+    stats = {'total': len(ingredients_list),
+             'high': 0, 'medium': 0, 'low': 0, 'unknown': 0, 'safe': 0}
+    for ing in ingredients_list:
+        risk = ing.get('risk_level', 'unknown')
+        if risk in stats:
+            stats[risk] += 1
+    return stats
+
+
 def calculate_safety_status_with_message(detected_ingredients):
     """
     Обчислює зведений статус безпеки продукту та текстове повідомлення
@@ -0,0 +1,73 @@
+# ngram_classifier.py — легкий класифікатор інгредієнтів на символьних n-грамах
+"""
+Лінійна модель над хешованими символьними n-грамами.
+
+Потребує лише NumPy: жодного PyTorch/transformers, модель — один .npz
+на кількасот кілобайт, оцінка одного тексту — мікросекунди. Тренується
+скриптом ml_training/train_ngram.py на тому ж train.csv, що й ModernBERT.
+
+Ознаки: текст у нижньому регістрі з нормалізованими пробілами,
+обрамлений пробілами; кожна n-грама довжини ngram_range хешується
+(CRC32) у n_features кошиків. Ознаки бінарні, вектор нормується на
+корінь із кількості ненульових ознак.
+
+escalate_band — інтервал оцінок, у якому модель не впевнена; такі
+тексти ingredient_classifier передає ModernBERT. Межі калібруються
+train_ngram.py на відкладених оцінках і зберігаються в .npz.
+"""
+
+import os
+import zlib
+
+import numpy as np
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), "ingredient_classifier", "ngram_model.npz")
+N_FEATURES = 2 ** 16
+NGRAM_RANGE = (2, 5)
+# Типова полоса для моделі без калібрування
+ESCALATE_BAND = (0.2, 0.9)
+
+
+def featurize(text, n_features=N_FEATURES, ngram_range=NGRAM_RANGE):
+    """Індекси ненульових ознак тексту (без повторів)."""
+    padded = " " + " ".join(text.lower().split()) + " "
+    lo, hi = ngram_range
+    buckets = {
+        zlib.crc32(padded[i:i + n].encode("utf-8")) % n_features
+        for n in range(lo, hi + 1)
+        for i in range(len(padded) - n + 1)
+    }
+    return np.fromiter(buckets, dtype=np.int64, count=len(buckets))
+
+
+class NgramClassifier:
+    """Логістична регресія над featurize(); score() — ймовірність класу «інгредієнт»."""
+
+    def __init__(self, weights, bias, ngram_range=NGRAM_RANGE, escalate_band=ESCALATE_BAND):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.n_features = len(self.weights)
+        self.ngram_range = tuple(int(n) for n in ngram_range)
+        self.escalate_band = tuple(float(x) for x in escalate_band)
+
+    def features(self, text):
+        return featurize(text, self.n_features, self.ngram_range)
+
+    def score_one(self, text):
+        idx = self.features(text)
+        z = self.weights[idx].sum() / np.sqrt(max(len(idx), 1)) + self.bias
+        return float(1.0 / (1.0 + np.exp(-z)))
+
+    def score(self, texts):
+        return [self.score_one(t) for t in texts]
+
+    def save(self, path):
+        np.savez(path, weights=self.weights, bias=self.bias,
+                 ngram_range=np.array(self.ngram_range),
+                 escalate_band=np.array(self.escalate_band))
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH):
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"],
+                       data["ngram_range"], data["escalate_band"])
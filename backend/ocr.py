@@ -1,12 +1,20 @@
-import pytesseract
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
 import io
 import re
 import os
 import time
+import bisect
+import difflib
+import threading
 import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import numpy as np
 
+from ocr_cache import OCRCache, sha256_bytes, dhash
+import tesseract_api
+from text_index import normalize_word
+
 # ═══════════════════════════════════════════════════════════════════
 # ЗАЛЕЖНОСТІ З GRACEFUL FALLBACK
 # ═══════════════════════════════════════════════════════════════════
@@ -44,20 +52,45 @@ except ImportError:
     print("[OCR] TrOCR не встановлено — використовується EasyOCR/Tesseract. "
           "Встановіть: pip install transformers torch")
 
-# Для Windows
-if os.name == 'nt':
-    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-
-# Конфігурація Tesseract
+# Конфігурація Tesseract (tesseract_api.py: tesserocr або pytesseract)
 TESSERACT_CONFIG_MULTI = r'--oem 3 --psm 6 -l ukr+rus+eng'
 TESSERACT_CONFIG_ENG = r'--oem 3 --psm 6 -l eng'
 
+# Кеш результатів OCR (SQLite). OCR_CACHE=0 — вимкнути
+OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE', '1') != '0'
+OCR_CACHE_PATH = os.environ.get('OCR_CACHE_PATH', os.path.join('data_cache', 'ocr_cache.sqlite3'))
+OCR_CACHE_SIZE = int(os.environ.get('OCR_CACHE_SIZE', '5000'))
+_ocr_cache = None
+
 # Ліниве завантаження EasyOCR reader
 _easyocr_reader = None
+_easyocr_lock = threading.Lock()
 
 # Ліниве завантаження TrOCR (transformer model + processor)
 _trocr_processor = None
 _trocr_model = None
+_trocr_lock = threading.Lock()
+
+# Скільки смуг TrOCR обробляє за один виклик generate
+TROCR_BATCH_SIZE = int(os.environ.get('TROCR_BATCH_SIZE', '8'))
+# Потоки PyTorch для CPU-інференсу; порожньо — типове значення torch
+TORCH_NUM_THREADS = os.environ.get('TORCH_NUM_THREADS')
+
+
+def get_ocr_cache():
+    """Кеш результатів OCR або None, якщо вимкнений чи недоступний."""
+    global _ocr_cache, OCR_CACHE_ENABLED
+    if _ocr_cache is None and OCR_CACHE_ENABLED:
+        try:
+            _ocr_cache = OCRCache(OCR_CACHE_PATH, maxsize=OCR_CACHE_SIZE)
+        except Exception as e:
+            print(f"[OCR] Кеш OCR недоступний: {e}")
+            OCR_CACHE_ENABLED = False
+    return _ocr_cache
+
+
+# Параметри детектора EasyOCR (CRAFT) — спільні для readtext і _detect_lines
+EASYOCR_DETECT_PARAMS = dict(min_size=20, text_threshold=0.7, low_text=0.4, width_ths=0.7)
 
 
 def _get_easyocr_reader():
@@ -72,16 +105,20 @@ def _get_easyocr_reader():
     бінаризації, краще працює з шумом, бліками та нахилом.
     """
     global _easyocr_reader
-    if _easyocr_reader is None and EASYOCR_AVAILABLE:
-        print("[OCR] Завантаження EasyOCR моделі...")
-        start = time.time()
-        try:
-            _easyocr_reader = easyocr.Reader(
-                ['en'], gpu=False, verbose=False
-            )
-            print(f"[OCR] EasyOCR завантажено за {time.time()-start:.1f}с")
-        except Exception as e:
-            print(f"[OCR] Помилка EasyOCR: {e}")
+    if _easyocr_reader is not None or not EASYOCR_AVAILABLE:
+        return _easyocr_reader
+    # Одночасні перші запити не повинні завантажувати модель двічі
+    with _easyocr_lock:
+        if _easyocr_reader is None:
+            print("[OCR] Завантаження EasyOCR моделі...")
+            start = time.time()
+            try:
+                _easyocr_reader = easyocr.Reader(
+                    ['en'], gpu=False, verbose=False
+                )
+                print(f"[OCR] EasyOCR завантажено за {time.time()-start:.1f}с")
+            except Exception as e:
+                print(f"[OCR] Помилка EasyOCR: {e}")
     return _easyocr_reader
 
 
@@ -89,26 +126,41 @@ def _get_easyocr_reader():
 # ПОПЕРЕДНЯ ОБРОБКА ЗОБРАЖЕННЯ
 # ═══════════════════════════════════════════════════════════════════
 
-def preprocess_image(image):
+# Цільова висота рядкових символів після масштабування, px (Tesseract
+# найкраще читає текст висотою ~30 px; більше — лише зайві пікселі)
+OCR_TEXT_HEIGHT = int(os.environ.get('OCR_TEXT_HEIGHT', '32'))
+PREPROCESS_MAX_SIZE = int(os.environ.get('OCR_PREPROCESS_MAX_SIZE', '2000'))
+# Нижче цього розміру (більша сторона) не зменшуємо, навіть якщо текст великий
+PREPROCESS_MIN_SIZE = int(os.environ.get('OCR_PREPROCESS_MIN_SIZE', '1000'))
+# Bilateral filter — лише якщо оцінка шуму (σ) після CLAHE вища за поріг
+OCR_NOISE_SIGMA = float(os.environ.get('OCR_NOISE_SIGMA', '4.0'))
+# Розмір зменшеної копії для оцінки висоти тексту та кута нахилу
+PREPROCESS_PROBE_SIZE = 1000
+
+
+def preprocess_image(image, timings=None):
     """Попередня обробка зображення для покращення OCR.
 
+    Вхідне зображення не змінюється — повертається нове.
+
     Pipeline (OpenCV):
-      1. Resize
-      2. Grayscale
-      3. Deskew — виправлення нахилу
+      1. Grayscale та оцінка висоти тексту і кута нахилу (зменшена копія)
+      2. Resize до цільової висоти тексту
+      3. Deskew — лише якщо кут ≥ 0.5°
       4. CLAHE — локальне вирівнювання контрасту
-      5. Bilateral filter — шумозаглушення зі збереженням країв
+      5. Bilateral filter — лише для шумних зображень
       6. Unsharp masking — підвищення різкості
       7. Морфологічне закриття
       8. Адаптивна бінаризація
+
+    timings (dict, необов'язково) отримує час кожного кроку в секундах
+    і прийняті рішення (масштаб, висота тексту, кут, рівень шуму).
     """
+    if timings is None:
+        timings = {}
     try:
-        MAX_SIZE = 2000
-        if image.size[0] > MAX_SIZE or image.size[1] > MAX_SIZE:
-            image.thumbnail((MAX_SIZE, MAX_SIZE), Image.Resampling.LANCZOS)
-
         if CV2_AVAILABLE:
-            return _preprocess_opencv(image)
+            return _preprocess_opencv(image, timings)
         else:
             return _preprocess_pil(image)
     except Exception as e:
@@ -117,105 +169,192 @@ def preprocess_image(image):
         return image
 
 
-def _preprocess_opencv(image):
+def _estimate_text_height(binary):
+    """Медіанна висота символів (px) на бінарному зображенні або None.
+
+    Компоненти зв'язності, схожі на символи: не дрібний шум, не лінії
+    й рамки, не великі плями зображень.
+    """
+    h = binary.shape[0]
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    glyphs = (heights >= 4) & (heights <= h * 0.1) & (widths <= heights * 3) & (areas >= 8)
+    if glyphs.sum() < 20:
+        return None
+    return float(np.median(heights[glyphs]))
+
+
+def _skew_angle(binary):
+    """Кут нахилу тексту через minAreaRect або None (мало пікселів)."""
+    coords = np.column_stack(np.where(binary > 0))
+    if len(coords) < 100:
+        return None
+    angle = cv2.minAreaRect(coords)[-1]
+    return -(90 + angle) if angle < -45 else -angle
+
+
+def _noise_sigma(gray):
+    """Швидка оцінка σ гаусового шуму (метод Immerkær, одна згортка)."""
+    h, w = gray.shape[:2]
+    if h < 3 or w < 3:
+        return 0.0
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+    response = cv2.filter2D(gray, cv2.CV_32F, kernel)
+    return float(np.abs(response[1:-1, 1:-1]).sum() * np.sqrt(np.pi / 2) / (6 * (w - 2) * (h - 2)))
+
+
+def _target_scale(long_side, text_height):
+    """Коефіцієнт зменшення: текст до OCR_TEXT_HEIGHT, у межах MIN/MAX_SIZE."""
+    limit = min(1.0, PREPROCESS_MAX_SIZE / long_side)
+    if text_height is None:
+        return limit
+    floor = min(1.0, PREPROCESS_MIN_SIZE / long_side)
+    return min(limit, max(floor, OCR_TEXT_HEIGHT / text_height))
+
+
+def _preprocess_opencv(image, timings):
     """Покращена обробка через OpenCV.
 
+    Масштаб обирається за висотою тексту: великий шрифт на фото 4000 px
+    можна зменшити значно сильніше за 2000 px без втрат для OCR, а всі
+    наступні кроки дешевшають пропорційно площі. Висота тексту й кут
+    нахилу оцінюються на зменшеній копії за один прохід бінаризації.
+
     CLAHE: локальне вирівнювання контрасту. На відміну від глобального
     вирівнювання, CLAHE розбиває зображення на блоки та вирівнює контраст
     локально. Критично для фото етикеток де частина тексту у тіні.
 
     Bilateral filter: зберігає чіткість країв символів. Використовує два
     Гаусівських ядра — просторове та за інтенсивністю — тому пікселі
-    з різкою зміною яскравості (краї букв) не згладжуються.
+    з різкою зміною яскравості (краї букв) не згладжуються. Найдорожчий
+    крок, тому виконується лише коли оцінка шуму перевищує OCR_NOISE_SIGMA.
 
     Adaptive threshold: обчислює поріг для кожного пікселя на основі його
     околу. Значно краще для етикеток з нерівномірним освітленням.
+
+    Зображення конвертується в NumPy один раз (відтінки сірого) і назад
+    у PIL — лише результат.
     """
-    img_array = np.array(image)
+    steps = timings.setdefault('steps', {})
 
-    if len(img_array.shape) == 3:
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = img_array
+    def _step(name, since):
+        steps[name] = round(time.time() - since, 4)
+        return time.time()
 
-    print("[OpenCV] Pipeline обробки:")
+    t = time.time()
+    gray = np.asarray(image if image.mode == 'L' else image.convert('L'))
+    t = _step('grayscale', t)
+
+    # 1. Оцінка на зменшеній копії: висота тексту та кут нахилу
+    h, w = gray.shape
+    long_side = max(h, w)
+    probe_scale = min(1.0, PREPROCESS_PROBE_SIZE / long_side)
+    probe = gray if probe_scale == 1.0 else cv2.resize(
+        gray, (max(int(w * probe_scale), 1), max(int(h * probe_scale), 1)),
+        interpolation=cv2.INTER_AREA)
+    _, probe_bw = cv2.threshold(probe, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    if cv2.countNonZero(probe_bw) > probe_bw.size // 2:
+        # Світлий текст на темному фоні
+        probe_bw = cv2.bitwise_not(probe_bw)
+    text_height = _estimate_text_height(probe_bw)
+    if text_height is not None:
+        text_height /= probe_scale
+        timings['text_height'] = round(text_height, 1)
+    angle = _skew_angle(probe_bw)
+    t = _step('analyze', t)
 
-    # 1. Deskew
-    gray = _deskew(gray)
+    print("[OpenCV] Pipeline обробки:")
 
-    # 2. CLAHE
+    # 2. Resize
+    scale = _target_scale(long_side, text_height)
+    timings['scale'] = round(scale, 3)
+    if scale < 1.0:
+        gray = cv2.resize(gray, (max(int(w * scale), 1), max(int(h * scale), 1)),
+                          interpolation=cv2.INTER_AREA)
+    print(f"  [1/7] Resize ×{scale:.2f} → {gray.shape[1]}×{gray.shape[0]}"
+          + (f" (текст ~{text_height:.0f}px)" if text_height else ""))
+    t = _step('resize', t)
+
+    # 3. Deskew
+    gray = _deskew(gray, angle)
+    timings['deskew_angle'] = None if angle is None else round(angle, 2)
+    t = _step('deskew', t)
+
+    # 4. CLAHE
     clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
     enhanced = clahe.apply(gray)
-    print("  [2/6] CLAHE")
-
-    # 3. Bilateral filter
-    denoised = cv2.bilateralFilter(enhanced, d=9, sigmaColor=75, sigmaSpace=75)
-    print("  [3/6] Bilateral filter")
+    print("  [3/7] CLAHE")
+    t = _step('clahe', t)
+
+    # 5. Bilateral filter
+    sigma = _noise_sigma(enhanced)
+    timings['noise_sigma'] = round(sigma, 2)
+    if sigma > OCR_NOISE_SIGMA:
+        denoised = cv2.bilateralFilter(enhanced, d=9, sigmaColor=75, sigmaSpace=75)
+        print(f"  [4/7] Bilateral filter (шум σ={sigma:.1f})")
+    else:
+        denoised = enhanced
+        print(f"  [4/7] Bilateral filter — пропущено (шум σ={sigma:.1f})")
+    t = _step('bilateral', t)
 
-    # 4. Unsharp masking
+    # 6. Unsharp masking
     gaussian = cv2.GaussianBlur(denoised, (0, 0), 3)
     sharpened = cv2.addWeighted(denoised, 1.5, gaussian, -0.5, 0)
-    print("  [4/6] Unsharp masking")
+    print("  [5/7] Unsharp masking")
+    t = _step('unsharp', t)
 
-    # 5. Морфологічне закриття
+    # 7. Морфологічне закриття
     kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
     morphed = cv2.morphologyEx(sharpened, cv2.MORPH_CLOSE, kernel)
-    print("  [5/6] Морфологічне закриття")
+    print("  [6/7] Морфологічне закриття")
+    t = _step('morphology', t)
 
-    # 6. Адаптивна бінаризація
+    # 8. Адаптивна бінаризація
     binary = cv2.adaptiveThreshold(
         morphed, 255,
         cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
         cv2.THRESH_BINARY,
         blockSize=21, C=10
     )
-    print("  [6/6] Адаптивна бінаризація")
+    print("  [7/7] Адаптивна бінаризація")
+    _step('threshold', t)
 
     return Image.fromarray(binary)
 
 
-def _deskew(gray_image):
-    """Виправлення нахилу тексту через minAreaRect.
+def _deskew(gray_image, angle):
+    """Поворот на кут нахилу, оцінений _skew_angle.
 
-    Алгоритм:
-      1. Бінаризація (Оцу)
-      2. Знаходження координат ненульових пікселів
-      3. minAreaRect визначає кут нахилу
-      4. Поворот зображення (тільки для кутів 0.5°—15°)
+    Кут оцінюється на зменшеній копії (він не залежить від масштабу),
+    тож на повному зображенні лишається тільки поворот — і лише для
+    кутів 0.5°—15°.
     """
+    if angle is None:
+        print("  [2/7] Deskew — пропущено (мало пікселів)")
+        return gray_image
+    if abs(angle) < 0.5 or abs(angle) > 15:
+        print(f"  [2/7] Deskew — {angle:.1f}° (пропущено)")
+        return gray_image
     try:
-        _, thresh = cv2.threshold(gray_image, 0, 255,
-                                  cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-        coords = np.column_stack(np.where(thresh > 0))
-
-        if len(coords) < 100:
-            print("  [1/6] Deskew — пропущено (мало пікселів)")
-            return gray_image
-
-        angle = cv2.minAreaRect(coords)[-1]
-        if angle < -45:
-            angle = -(90 + angle)
-        else:
-            angle = -angle
-
-        if abs(angle) < 0.5 or abs(angle) > 15:
-            print(f"  [1/6] Deskew — {angle:.1f}° (пропущено)")
-            return gray_image
-
         h, w = gray_image.shape[:2]
         M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
         rotated = cv2.warpAffine(gray_image, M, (w, h),
                                   flags=cv2.INTER_CUBIC,
                                   borderMode=cv2.BORDER_REPLICATE)
-        print(f"  [1/6] Deskew — виправлено {angle:.1f}°")
+        print(f"  [2/7] Deskew — виправлено {angle:.1f}°")
         return rotated
     except Exception as e:
-        print(f"  [1/6] Deskew — помилка: {e}")
+        print(f"  [2/7] Deskew — помилка: {e}")
         return gray_image
 
 
 def _preprocess_pil(image):
     """Базова обробка через PIL (fallback)."""
+    if max(image.size) > PREPROCESS_MAX_SIZE:
+        image = image.copy()
+        image.thumbnail((PREPROCESS_MAX_SIZE, PREPROCESS_MAX_SIZE), Image.Resampling.LANCZOS)
     if image.mode != 'L':
         image = image.convert('L')
 
@@ -232,27 +371,334 @@ def _preprocess_pil(image):
     return image
 
 
+# ═══════════════════════════════════════════════════════════════════
+# ОБЛАСТЬ СКЛАДУ (INCI-БЛОК)
+# ═══════════════════════════════════════════════════════════════════
+
+# OCR_CROP_REGION=0 — розпізнавати етикетку повністю
+OCR_CROP_REGION = os.environ.get('OCR_CROP_REGION', '1') != '0'
+# Розмір (більша сторона), до якого зменшується зображення для пошуку блоків
+REGION_DETECT_SIZE = 1200
+# Обрізаємо лише якщо блок займає не більше цієї частки площі
+REGION_MAX_AREA = 0.8
+REGION_MARGIN = 0.02
+# Склад — абзац щонайменше з такої кількості рядків
+REGION_MIN_LINES = 3
+# Рядки сусідніх блоків вважаються одним шрифтом, якщо висоти відрізняються не більше ніж на
+REGION_HEIGHT_TOLERANCE = 0.3
+# Швидко розпізнаються лише стільки найкращих за геометрією блоків
+REGION_CANDIDATES = 4
+# Висота рядка (px), до якої масштабується блок для швидкого розпізнавання
+REGION_RECOGNIZE_LINE_HEIGHT = 24
+
+INGREDIENT_HEADERS = (
+    'ingredients', 'ingredient', 'inci', 'composition',
+    'склад', 'інгредієнти', 'состав', 'ингредиенты',
+)
+
+
+def _detect_text_blocks(gray):
+    """Блоки тексту (x, y, w, h) — морфологічний прохід OpenCV.
+
+      1. Морфологічний градієнт виділяє краї символів
+      2. Бінаризація Оцу
+      3. Горизонтальне закриття зливає символи в рядки
+      4. Вертикальне розширення зливає рядки в абзаци
+      5. Зовнішні контури → прямокутники блоків
+    """
+    h, w = gray.shape[:2]
+    grad = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT,
+                            cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, bw = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    lines = cv2.morphologyEx(bw, cv2.MORPH_CLOSE,
+                             cv2.getStructuringElement(cv2.MORPH_RECT, (max(w // 50, 3), 1)))
+    paragraphs = cv2.dilate(lines, cv2.getStructuringElement(
+        cv2.MORPH_RECT, (max(w // 100, 1), max(h // 80, 3))))
+    contours, _ = cv2.findContours(paragraphs, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    blocks = [cv2.boundingRect(c) for c in contours]
+    return [b for b in blocks if b[2] > w * 0.05 and b[3] > h * 0.01]
+
+
+def _block_layout(blocks, lines):
+    """Для кожного блоку — (кількість рядків, медіанна висота рядка, заповнення ширини).
+
+    lines — рамки рядків (x0, y0, x1, y1); рядок належить блоку, в який
+    потрапляє його центр. Заповнення — середня частка ширини блоку,
+    зайнята рядком (суцільний абзац ≈ 1, розріджені написи — менше).
+    """
+    members = [[] for _ in blocks]
+    for x0, y0, x1, y1 in lines:
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        for i, (bx, by, bw, bh) in enumerate(blocks):
+            if bx <= cx <= bx + bw and by <= cy <= by + bh:
+                members[i].append((x1 - x0, y1 - y0))
+                break
+    layout = []
+    for (bx, by, bw, bh), member in zip(blocks, members):
+        if not member:
+            layout.append((0, 0.0, 0.0))
+            continue
+        heights = sorted(h for _, h in member)
+        fill = sum(w for w, _ in member) / (len(member) * bw)
+        layout.append((len(member), float(heights[len(heights) // 2]), min(fill, 1.0)))
+    return layout
+
+
+def _layout_score(n_lines, line_height, fill, page_line_height):
+    """Чи може блок бути списком складу — лише за геометрією.
+
+    Бал росте з кількістю рядків і заповненням ширини та падає для
+    шрифту, більшого за типовий на етикетці (заголовки, назва бренду).
+    Відбирає кандидатів для _region_score, сам склад не визначає.
+    """
+    if n_lines < REGION_MIN_LINES or not line_height:
+        return 0.0
+    return n_lines * fill * min(1.0, page_line_height / line_height)
+
+
+def _region_score(text):
+    """Наскільки текст блоку схожий на список інгредієнтів."""
+    words = len(text.split())
+    if not words:
+        return 0
+    header = any(hd in text.lower() for hd in INGREDIENT_HEADERS)
+    comma_density = text.count(',') / words
+    return _inci_score(text) + (3 if header else 0) + 5 * comma_density
+
+
+def _recognize_blocks(image, boxes, line_heights, scale):
+    """Текст кожного блоку (рамки на зменшеній копії) — один швидкий прохід Tesseract.
+
+    Блоки вирізаються з оригіналу й масштабуються так, щоб рядок мав
+    REGION_RECOGNIZE_LINE_HEIGHT px: для INCI-слів і ком цього досить.
+    Без Tesseract — порожні рядки.
+    """
+    crops = []
+    for (x, y, w, h), line_height in zip(boxes, line_heights):
+        crop = image.crop((int(x * scale), int(y * scale),
+                           int((x + w) * scale), int((y + h) * scale))).convert('L')
+        factor = REGION_RECOGNIZE_LINE_HEIGHT / (line_height * scale)
+        crops.append(crop.resize((max(int(crop.size[0] * factor), 1),
+                                  max(int(crop.size[1] * factor), 1)),
+                                 Image.Resampling.LANCZOS))
+    tokens = _tesseract_line_tokens(crops, TESSERACT_CONFIG_ENG, single_line=False)
+    if tokens is None:
+        return [''] * len(boxes)
+    return [' '.join(word for word, _ in words) for words in tokens]
+
+
+def _union(boxes):
+    x0 = min(b[0] for b in boxes)
+    y0 = min(b[1] for b in boxes)
+    x1 = max(b[0] + b[2] for b in boxes)
+    y1 = max(b[1] + b[3] for b in boxes)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _crop_ingredient_region(image, timings=None):
+    """Обрізає зображення до блоку зі складом, якщо його вдається знайти.
+
+    Блоки тексту шукаються морфологією OpenCV на зменшеній копії, рядки
+    всередині — _detect_lines (CRAFT, без EasyOCR — морфологія).
+    REGION_CANDIDATES блоків з найвищим _layout_score розпізнаються
+    одним швидким проходом Tesseract, і обирається блок з найвищим
+    _region_score (INCI-слова, заголовок «Ingredients/Склад», щільність
+    ком); сусідні блоки з рядками того ж шрифту приєднуються. Якщо
+    впевненого блоку немає, він майже на все зображення або немає
+    OpenCV — повертається оригінал. Розпізнається потім лише обрізка
+    (слабкий результат повторюється на всьому зображенні —
+    extract_text_from_bytes).
+    """
+    if timings is None:
+        timings = {}
+    if not OCR_CROP_REGION or not CV2_AVAILABLE:
+        return image
+    start = time.time()
+    try:
+        small = image.convert('L')
+        small.thumbnail((REGION_DETECT_SIZE, REGION_DETECT_SIZE), Image.Resampling.LANCZOS)
+        scale = image.size[0] / small.size[0]
+        sw, sh = small.size
+
+        gray = np.array(small)
+        blocks = _detect_text_blocks(gray)
+        lines = _detect_lines(small) or _group_lines(_detect_lines_cv(gray))
+        if not blocks or not lines:
+            return image
+        heights = sorted(y1 - y0 for _, y0, _, y1 in lines)
+        page_line_height = heights[len(heights) // 2]
+
+        layout = _block_layout(blocks, lines)
+        geometry = [(_layout_score(n, lh, fill, page_line_height), box, lh)
+                    for box, (n, lh, fill) in zip(blocks, layout)]
+        candidates = sorted((g for g in geometry if g[0] > 0),
+                            key=lambda g: g[0], reverse=True)[:REGION_CANDIDATES]
+        if not candidates:
+            print("[Region] Блок складу не знайдено")
+            return image
+
+        texts = _recognize_blocks(image, [box for _, box, _ in candidates],
+                                  [lh for _, _, lh in candidates], scale)
+        best_score, best_box, best_height = max(
+            ((_region_score(text), box, lh) for (_, box, lh), text in zip(candidates, texts)),
+            key=lambda s: s[0])
+        if best_score < INCI_GOOD_SCORE:
+            print(f"[Region] Блок складу не знайдено (найкращий score={best_score:.1f})")
+            return image
+
+        # Приєднуємо сусідні блоки-продовження (той самий шрифт, поруч по вертикалі)
+        region = [best_box]
+        for _, box, lh in geometry:
+            if box is best_box or not lh:
+                continue
+            if abs(lh - best_height) > best_height * REGION_HEIGHT_TOLERANCE:
+                continue
+            ux, uy, uw, uh = _union(region)
+            gap = max(box[1] - (uy + uh), uy - (box[1] + box[3]))
+            overlap_x = min(ux + uw, box[0] + box[2]) - max(ux, box[0])
+            if gap <= sh * 0.03 and overlap_x > 0:
+                region.append(box)
+
+        x, y, w, h = _union(region)
+        if (w * h) / (sw * sh) > REGION_MAX_AREA:
+            print("[Region] Блок складу займає майже все зображення — без обрізки")
+            return image
+
+        mx, my = int(sw * REGION_MARGIN), int(sh * REGION_MARGIN)
+        box = (max(0, int((x - mx) * scale)), max(0, int((y - my) * scale)),
+               min(image.size[0], int((x + w + mx) * scale)),
+               min(image.size[1], int((y + h + my) * scale)))
+        cropped = image.crop(box)
+        timings['region'] = list(box)
+        print(f"[Region] ✓ Блок складу {box}, score={best_score:.1f}, "
+              f"{cropped.size[0] * cropped.size[1] / (image.size[0] * image.size[1]):.0%} площі")
+        return cropped
+    except Exception as e:
+        print(f"[Region] Помилка: {e}")
+        return image
+    finally:
+        timings['region_detect'] = round(time.time() - start, 3)
+
+
+# ═══════════════════════════════════════════════════════════════════
+# РЯДКИ ТЕКСТУ (СПІЛЬНА ДЕТЕКЦІЯ ДЛЯ ВСІХ ДВИЖКІВ)
+# ═══════════════════════════════════════════════════════════════════
+
+# OCR_LINE_DETECTION=0 — кожен движок шукає текст сам, як раніше
+OCR_LINE_DETECTION = os.environ.get('OCR_LINE_DETECTION', '1') != '0'
+# Поле навколо рамки рядка (частка висоти рядка)
+LINE_PADDING = 0.15
+# Вирізки нижчі за це збільшуються перед Tesseract, px
+LINE_MIN_HEIGHT = 40
+
+
+def _pad_box(box, size):
+    x0, y0, x1, y1 = box
+    pad = max(int((y1 - y0) * LINE_PADDING), 2)
+    return (max(x0 - pad, 0), max(y0 - pad, 0),
+            min(x1 + pad, size[0]), min(y1 + pad, size[1]))
+
+
+def _group_lines(boxes):
+    """Рамки слів/фрагментів (x0, y0, x1, y1) → рамки рядків у порядку читання.
+
+    Фрагменти зливаються в рядок, якщо перекриваються по вертикалі
+    щонайменше на половину меншої висоти і розділені проміжком, не
+    ширшим за дві висоти рядка (інакше це сусідня колонка).
+    """
+    lines = []
+    for box in sorted(boxes, key=lambda b: (b[0], b[1])):
+        x0, y0, x1, y1 = box
+        for i, (lx0, ly0, lx1, ly1) in enumerate(lines):
+            overlap = min(y1, ly1) - max(y0, ly0)
+            height = min(y1 - y0, ly1 - ly0)
+            if overlap >= height * 0.5 and x0 - lx1 <= 2 * (ly1 - ly0):
+                lines[i] = (min(x0, lx0), min(y0, ly0), max(x1, lx1), max(y1, ly1))
+                break
+        else:
+            lines.append(box)
+    return sorted(lines, key=lambda b: ((b[1] + b[3]) / 2, b[0]))
+
+
+def _detect_lines_cv(gray):
+    """Рамки фрагментів рядків — морфологія OpenCV (як _detect_text_blocks, без злиття рядків)."""
+    h, w = gray.shape[:2]
+    grad = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT,
+                            cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, bw = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    joined = cv2.morphologyEx(bw, cv2.MORPH_CLOSE,
+                              cv2.getStructuringElement(cv2.MORPH_RECT, (max(w // 60, 3), 1)))
+    contours, _ = cv2.findContours(joined, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = []
+    for contour in contours:
+        x, y, bw_, bh = cv2.boundingRect(contour)
+        if bh >= 6 and bw_ >= bh and bh <= h * 0.2:
+            boxes.append((x, y, x + bw_, y + bh))
+    return boxes
+
+
+def _detect_lines(image):
+    """Рядки тексту (x0, y0, x1, y1) на image у порядку читання або None.
+
+    Детекція виконується один раз і спільна для всіх движків ensemble:
+    EasyOCR розпізнає ці рамки без власної детекції, Tesseract і TrOCR
+    отримують вирізки справжніх рядків замість усього зображення чи
+    фіксованих смуг. Детектор — CRAFT з EasyOCR, без нього — морфологія
+    OpenCV; без обох (або якщо рядків не знайдено) повертається None і
+    движки працюють з усім зображенням.
+    """
+    if not OCR_LINE_DETECTION:
+        return None
+    try:
+        reader = _get_easyocr_reader()
+        if reader is not None:
+            horizontal, free = reader.detect(np.array(image.convert('RGB')),
+                                             **EASYOCR_DETECT_PARAMS)
+            boxes = [(int(x0), int(y0), int(x1), int(y1))
+                     for x0, x1, y0, y1 in horizontal[0]]
+            for points in free[0]:
+                xs = [p[0] for p in points]
+                ys = [p[1] for p in points]
+                boxes.append((int(min(xs)), int(min(ys)), int(max(xs)), int(max(ys))))
+        elif CV2_AVAILABLE:
+            boxes = _detect_lines_cv(np.asarray(image.convert('L')))
+        else:
+            return None
+        w, h = image.size
+        boxes = [(max(x0, 0), max(y0, 0), min(x1, w), min(y1, h))
+                 for x0, y0, x1, y1 in boxes if x1 > x0 and y1 > y0]
+        return _group_lines(boxes) or None
+    except Exception as e:
+        print(f"[Lines] Помилка детекції: {e}")
+        return None
+
+
 # ═══════════════════════════════════════════════════════════════════
 # OCR ДВИЖКИ
 # ═══════════════════════════════════════════════════════════════════
 
-def _ocr_easyocr(image):
-    """Розпізнавання через EasyOCR (CRNN нейромережа)."""
+def _ocr_easyocr(image, lines=None):
+    """Розпізнавання через EasyOCR (CRNN нейромережа).
+
+    lines — рядки з _detect_lines: тоді детекція пропускається і
+    розпізнаються лише ці рамки.
+    """
     reader = _get_easyocr_reader()
     if reader is None:
         return None
     try:
-        img_array = np.array(image)
-        results = reader.readtext(
-            img_array, detail=1, paragraph=False,
-            min_size=20, text_threshold=0.7,
-            low_text=0.4, width_ths=0.7
-        )
+        if lines:
+            results = [(None, ' '.join(w for w, _ in tokens), tokens[0][1])
+                       for tokens in _easyocr_lines(image, lines) if tokens]
+        else:
+            results = reader.readtext(
+                np.array(image), detail=1, paragraph=False,
+                **EASYOCR_DETECT_PARAMS
+            )
+            results.sort(key=lambda r: (r[0][0][1], r[0][0][0]))
         if not results:
             return None
 
-        results.sort(key=lambda r: (r[0][0][1], r[0][0][0]))
-
         text_parts = []
         total_conf = 0
         for bbox, text, confidence in results:
@@ -273,6 +719,34 @@ def _ocr_easyocr(image):
         return None
 
 
+def _easyocr_lines(image, lines):
+    """Токени [(слово, довіра)] кожного рядка lines — EasyOCR без власної детекції.
+
+    recognize повертає рамки, відсортовані по вертикалі, тож результати
+    зіставляються з рядками за лівим верхнім кутом.
+    """
+    reader = _get_easyocr_reader()
+    if reader is None:
+        return None
+    results = reader.recognize(
+        np.asarray(image.convert('L')),
+        horizontal_list=[[x0, x1, y0, y1] for x0, y0, x1, y1 in lines],
+        free_list=[], detail=1, paragraph=False
+    )
+    by_corner = {}
+    for bbox, text, confidence in results:
+        by_corner.setdefault((int(bbox[0][0]), int(bbox[0][1])), []).append((text, confidence))
+    tokens = []
+    for x0, y0, _, _ in lines:
+        found = by_corner.get((x0, y0))
+        if found:
+            text, confidence = found.pop(0)
+            tokens.append([(w, float(confidence)) for w in text.split()])
+        else:
+            tokens.append([])
+    return tokens
+
+
 def _get_trocr():
     """Ліниве завантаження TrOCR моделі та процесора.
 
@@ -291,31 +765,39 @@ def _get_trocr():
       - Найвища точність на benchmark-ах (IAM, SROIE)
     """
     global _trocr_processor, _trocr_model
-    if _trocr_processor is None and TROCR_AVAILABLE:
-        print("[OCR] Завантаження TrOCR моделі (перший запуск ~60с)...")
-        start = time.time()
-        try:
-            model_name = "microsoft/trocr-base-printed"
-            _trocr_processor = TrOCRProcessor.from_pretrained(model_name)
-            _trocr_model = VisionEncoderDecoderModel.from_pretrained(model_name)
-            _trocr_model.eval()  # Режим інференсу (без dropout)
-            print(f"[OCR] TrOCR завантажено за {time.time()-start:.1f}с")
-        except Exception as e:
-            print(f"[OCR] Помилка завантаження TrOCR: {e}")
-            _trocr_processor = None
-            _trocr_model = None
+    if _trocr_model is not None or not TROCR_AVAILABLE:
+        return _trocr_processor, _trocr_model
+    with _trocr_lock:
+        if _trocr_model is None:
+            print("[OCR] Завантаження TrOCR моделі (перший запуск ~60с)...")
+            start = time.time()
+            try:
+                model_name = "microsoft/trocr-base-printed"
+                processor = TrOCRProcessor.from_pretrained(model_name)
+                model = VisionEncoderDecoderModel.from_pretrained(model_name)
+                model.eval()  # Режим інференсу (без dropout)
+                if TORCH_NUM_THREADS:
+                    torch.set_num_threads(int(TORCH_NUM_THREADS))
+                # Публікуємо лише повністю готову пару
+                _trocr_processor, _trocr_model = processor, model
+                print(f"[OCR] TrOCR завантажено за {time.time()-start:.1f}с")
+            except Exception as e:
+                print(f"[OCR] Помилка завантаження TrOCR: {e}")
     return _trocr_processor, _trocr_model
 
 
-def _ocr_trocr(image):
+def _ocr_trocr(image, lines=None):
     """Розпізнавання через TrOCR (Vision Transformer + Text Decoder).
 
-    TrOCR працює порядково: зображення розрізається на горизонтальні смуги,
-    кожна смуга розпізнається окремо. Це пов'язано з тим, що модель натренована
-    на однорядкових фрагментах тексту.
+    TrOCR працює порядково: модель натренована на однорядкових фрагментах
+    тексту. Якщо передано lines (_detect_lines) — розпізнаються справжні
+    рядки; інакше зображення розрізається на горизонтальні смуги, які
+    можуть розрізати рядок навпіл.
 
     Для етикеток косметики цей підхід ефективний, бо список інгредієнтів
     зазвичай розташований рядками або через кому в горизонтальних блоках.
+
+    Смуги обробляються пакетами (_trocr_recognize).
     """
     processor, model = _get_trocr()
     if processor is None or model is None:
@@ -326,48 +808,35 @@ def _ocr_trocr(image):
         if image.mode != 'RGB':
             image = image.convert('RGB')
 
-        img_array = np.array(image)
-        h, w = img_array.shape[:2]
-
-        # Розбиваємо на менше смуг для швидкості
-        # Замість h//15 (~15 смуг) беремо h//8 (~8 смуг)
-        line_height = max(60, h // 8)
-        overlap = 10  # Мінімальне перекриття
-
-        lines_text = []
-        y = 0
-        while y < h:
-            y_end = min(y + line_height, h)
-            if h - y_end < line_height // 2:
-                y_end = h  # Захоплюємо залишок
-
-            line_crop = image.crop((0, y, w, y_end))
-
-            # TrOCR inference
-            pixel_values = processor(
-                images=line_crop, return_tensors="pt"
-            ).pixel_values
+        w, h = image.size
 
-            with torch.no_grad():
-                generated_ids = model.generate(
-                    pixel_values,
-                    max_new_tokens=128
-                )
-
-            line_text = processor.batch_decode(
-                generated_ids, skip_special_tokens=True
-            )[0].strip()
-
-            if line_text and len(line_text) > 1:
-                lines_text.append(line_text)
-
-            y = y_end - overlap if y_end < h else h
+        if lines:
+            strips = [image.crop(_pad_box(box, image.size)) for box in lines]
+        else:
+            # Розбиваємо на менше смуг для швидкості
+            # Замість h//15 (~15 смуг) беремо h//8 (~8 смуг)
+            line_height = max(60, h // 8)
+            overlap = 10  # Мінімальне перекриття
+
+            strips = []
+            y = 0
+            while y < h:
+                y_end = min(y + line_height, h)
+                if h - y_end < line_height // 2:
+                    y_end = h  # Захоплюємо залишок
+                strips.append(image.crop((0, y, w, y_end)))
+                y = y_end - overlap if y_end < h else h
+
+        lines_text = [text for text, _ in _trocr_recognize(processor, model, strips)
+                      if len(text) > 1]
 
         if not lines_text:
             return None
 
         full_text = ' '.join(lines_text)
-        print(f"[TrOCR] {len(lines_text)} рядків, {len(full_text)} символів")
+        print(f"[TrOCR] {len(strips)} {'рядків' if lines else 'смуг'}, "
+              f"{len(lines_text)} розпізнано, "
+              f"{len(full_text)} символів")
         return full_text
 
     except Exception as e:
@@ -376,19 +845,171 @@ def _ocr_trocr(image):
         return None
 
 
+def _trocr_recognize(processor, model, crops):
+    """[(текст, довіра)] для кожної вирізки, у тому ж порядку.
+
+    Вирізки обробляються мікропакетами по TROCR_BATCH_SIZE: процесор
+    приводить їх до однакового розміру, тож один виклик generate на пакет
+    замінює цикл по вирізках. Довіра — середня ймовірність згенерованих
+    токенів (без паддінгу після кінця послідовності).
+    """
+    results = []
+    pad_id = model.config.pad_token_id
+    for start in range(0, len(crops), TROCR_BATCH_SIZE):
+        batch = [c if c.mode == 'RGB' else c.convert('RGB')
+                 for c in crops[start:start + TROCR_BATCH_SIZE]]
+
+        # TrOCR inference
+        pixel_values = processor(
+            images=batch, return_tensors="pt"
+        ).pixel_values
+
+        with torch.inference_mode():
+            generated = model.generate(
+                pixel_values,
+                max_new_tokens=128,
+                output_scores=True,
+                return_dict_in_generate=True
+            )
+            probs = model.compute_transition_scores(
+                generated.sequences, generated.scores, normalize_logits=True
+            ).exp()
+
+        tokens = generated.sequences[:, 1:]
+        mask = (tokens != pad_id) if pad_id is not None else torch.ones_like(tokens, dtype=torch.bool)
+        confidence = (probs * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        texts = processor.batch_decode(generated.sequences, skip_special_tokens=True)
+        results.extend((text.strip(), float(c)) for text, c in zip(texts, confidence))
+    return results
+
+
+def _trocr_lines(image, lines):
+    """Токени [(слово, довіра)] кожного рядка lines — TrOCR на вирізках рядків."""
+    processor, model = _get_trocr()
+    if processor is None or model is None:
+        return None
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    crops = [image.crop(_pad_box(box, image.size)) for box in lines]
+    return [[(w, c) for w in text.split()] if len(text) > 1 else []
+            for text, c in _trocr_recognize(processor, model, crops)]
+
+
 def _ocr_tesseract(image, config=None):
-    """Розпізнавання через Tesseract OCR."""
+    """Розпізнавання через Tesseract OCR (дескриптор tesserocr або процес)."""
+    try:
+        return tesseract_api.image_to_string(image, config or TESSERACT_CONFIG_MULTI, timeout=30)
+    except Exception as e:
+        print(f"[Tesseract] Помилка: {e}")
+        return None
+
+
+def _line_crops(image, lines):
+    """Бінаризовані вирізки рядків для Tesseract (висота не менша за LINE_MIN_HEIGHT)."""
+    gray = image.convert('L')
+    crops = []
+    for box in lines:
+        crop = gray.crop(_pad_box(box, gray.size))
+        if crop.size[1] < LINE_MIN_HEIGHT:
+            factor = LINE_MIN_HEIGHT / crop.size[1]
+            crop = crop.resize((max(int(crop.size[0] * factor), 1), LINE_MIN_HEIGHT),
+                               Image.Resampling.LANCZOS)
+        if CV2_AVAILABLE:
+            # Оцу на одному рядку: освітлення в межах рядка майже рівномірне
+            _, bw = cv2.threshold(np.asarray(crop), 0, 255,
+                                  cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            if cv2.countNonZero(bw) < bw.size // 2:
+                bw = cv2.bitwise_not(bw)
+            crop = Image.fromarray(bw)
+        crops.append(crop)
+    return crops
+
+
+def _tesseract_tokens(data, conf_scale=100.0):
+    """[(слово, довіра 0..1)] з результату image_to_data."""
+    return [(word.strip(), float(conf) / conf_scale)
+            for word, conf in zip(data['text'], data['conf'])
+            if word.strip() and float(conf) >= 0]
+
+
+def _tesseract_line_tokens(crops, config, single_line=True):
+    """Токени кожної вирізки рядка для однієї конфігурації Tesseract.
+
+    З tesserocr кожен рядок розпізнається окремо в однорядковому режимі
+    (psm 7; single_line=False — багаторядкові вирізки, psm з config) —
+    виклик дешевий, дескриптор уже завантажений. Через
+    pytesseract процес на кожен рядок занадто дорогий, тому рядки
+    складаються в одну «чисту» сторінку і розпізнаються одним викликом;
+    слова повертаються до рядків за вертикальною позицією.
+    """
+    if tesseract_api.backend() == 'tesserocr':
+        line_config = re.sub(r'--psm\s+\d+', '--psm 7', config) if single_line else config
+        tokens = []
+        for crop in crops:
+            try:
+                tokens.append(_tesseract_tokens(
+                    tesseract_api.image_to_data(crop, line_config, timeout=10)))
+            except Exception as e:
+                print(f"[Tesseract] Помилка рядка: {e}")
+                tokens.append([])
+        return tokens
+
+    gap = LINE_MIN_HEIGHT // 2
+    page = Image.new('L', (max(c.size[0] for c in crops) + 2 * gap,
+                           sum(c.size[1] + gap for c in crops) + gap), 255)
+    tops = []
+    y = gap
+    for crop in crops:
+        page.paste(crop, (gap, y))
+        tops.append(y - gap // 2)
+        y += crop.size[1] + gap
     try:
-        return pytesseract.image_to_string(
-            image, config=config or TESSERACT_CONFIG_MULTI, timeout=30
-        )
+        data = tesseract_api.image_to_data(page, config, timeout=30)
     except Exception as e:
         print(f"[Tesseract] Помилка: {e}")
         return None
+    tokens = [[] for _ in crops]
+    for i, word in enumerate(data['text']):
+        if not word.strip() or float(data['conf'][i]) < 0:
+            continue
+        center = data['top'][i] + data['height'][i] / 2
+        line = min(max(bisect.bisect_right(tops, center) - 1, 0), len(crops) - 1)
+        tokens[line].append((word.strip(), float(data['conf'][i]) / 100.0))
+    return tokens
 
 
-def _ocr_tesseract_multimode(processed_image):
-    """Мультирежимний Tesseract — вибір найкращого результату."""
+def _alpha_quality(text):
+    """Частка літер у тексті, % — критерій вибору конфігурації Tesseract."""
+    return sum(1 for c in text if c.isalpha()) / len(text) * 100 if text else 0
+
+
+def _tesseract_lines(image, lines):
+    """Токени кожного рядка lines — найкраща з конфігурацій мультирежиму."""
+    crops = _line_crops(image, lines)
+    best, best_score = None, 0
+    for name, config in (("multi_lang", TESSERACT_CONFIG_MULTI),
+                         ("english", TESSERACT_CONFIG_ENG)):
+        tokens = _tesseract_line_tokens(crops, config)
+        if not tokens:
+            continue
+        text = ' '.join(w for line in tokens for w, _ in line)
+        score = _alpha_quality(text)
+        if score > best_score:
+            best, best_score = tokens, score
+            print(f"  [{name}] {len(text)} символів, якість: {score:.0f}%")
+    return best
+
+
+def _ocr_tesseract_multimode(image, lines=None):
+    """Мультирежимний Tesseract — вибір найкращого результату.
+
+    image — оброблене зображення; якщо передано lines, це оригінал,
+    з якого вирізаються рядки (_tesseract_lines).
+    """
+    if lines:
+        tokens = _tesseract_lines(image, lines) or []
+        return ' '.join(w for line in tokens for w, _ in line)
+
     configs = [
         ("multi_lang", TESSERACT_CONFIG_MULTI),
         ("english", TESSERACT_CONFIG_ENG),
@@ -396,15 +1017,13 @@ def _ocr_tesseract_multimode(processed_image):
     best_text, best_score = "", 0
 
     for name, config in configs:
-        text = _ocr_tesseract(processed_image, config)
+        text = _ocr_tesseract(image, config)
         if text:
-            alpha = sum(1 for c in text if c.isalpha())
-            total = len(text)
-            score = (alpha / total * 100) if total else 0
+            score = _alpha_quality(text)
             if score > best_score:
                 best_score = score
                 best_text = text
-                print(f"  [{name}] {total} символів, якість: {score:.0f}%")
+                print(f"  [{name}] {len(text)} символів, якість: {score:.0f}%")
     return best_text
 
 
@@ -412,8 +1031,194 @@ def _ocr_tesseract_multimode(processed_image):
 # ENSEMBLE OCR
 # ═══════════════════════════════════════════════════════════════════
 
-def _ensemble_ocr(original_image, processed_image):
-    """Швидкий Ensemble OCR: пріоритетний запуск з ранньою зупинкою.
+INCI_KEYWORDS = {
+    'aqua', 'water', 'sodium', 'glycerin', 'acid', 'parfum',
+    'fragrance', 'alcohol', 'oil', 'extract', 'butter', 'oxide',
+    'sulfate', 'chloride', 'hydroxide', 'stearate', 'cetyl',
+    'lauryl', 'laureth', 'cocamidopropyl', 'betaine', 'glucoside',
+    'dimethicone', 'tocopherol', 'panthenol', 'phenoxyethanol',
+    'carbomer', 'xanthan', 'acrylates', 'polysorbate',
+}
+
+# Результат з INCI-score ≥ INCI_GOOD_SCORE достатній — інші движки не чекаємо
+INCI_GOOD_SCORE = 3
+# TrOCR запускається лише якщо найкращий результат слабший за це
+INCI_WEAK_SCORE = 2
+
+# Паралельний ensemble: EasyOCR і Tesseract стартують одночасно.
+# Обидва більшість часу проводять у нативному коді (PyTorch / tesserocr
+# або процес tesseract), тож потоків достатньо. OCR_PARALLEL=0 — послідовний режим.
+OCR_PARALLEL = os.environ.get('OCR_PARALLEL', '1') != '0'
+OCR_MAX_WORKERS = int(os.environ.get('OCR_MAX_WORKERS', '4'))
+# Загальний дедлайн ensemble (секунди): після нього повертаємо найкраще, що є
+OCR_DEADLINE = float(os.environ.get('OCR_DEADLINE', '60'))
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def _get_ocr_pool():
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS,
+                                           thread_name_prefix='ocr')
+    return _ocr_pool
+
+
+def _inci_score(text):
+    lo = text.lower()
+    return sum(1 for kw in INCI_KEYWORDS if kw in lo) + text.count(',') * 0.5
+
+
+def _report(progress, stage, **info):
+    """Подія прогресу {'stage': ..., ...} для progress(event), якщо він заданий."""
+    if progress is None:
+        return
+    try:
+        progress(dict(info, stage=stage))
+    except Exception as e:
+        print(f"[OCR] Не вдалося передати прогрес: {e}")
+
+
+def _ensemble_ocr(original_image, preprocess=None, timings=None, progress=None):
+    """Ensemble OCR: паралельний (типово) або послідовний режим.
+
+    Спершу один раз шукаються рядки тексту (_detect_lines) — їх отримують
+    усі движки, а результати зливаються по рядках (_ensemble_fused).
+    Без рядків або з OCR_FUSION=0 — вибір найкращого тексту цілком.
+
+    preprocess (callable: зображення → оброблене) викликається лише тоді,
+    коли рядків не знайдено і Tesseract розпізнає зображення цілком —
+    з рядками всі движки читають оригінал. Без preprocess — оригінал.
+
+    timings (dict, необов'язково) заповнюється часом кожного движка
+    в секундах, 'detect' і кількістю рядків 'lines', 'total', обраним
+    движком 'selected' і списком 'pending' движків, на які не чекали
+    (рання зупинка чи дедлайн).
+    progress (callable, необов'язково) отримує подію 'detect' (lines,
+    seconds) і подію 'ocr' після кожного движка: engine, seconds, inci_score.
+    """
+    if timings is None:
+        timings = {}
+    start = time.time()
+    lines = _detect_lines(original_image)
+    if OCR_LINE_DETECTION:
+        timings['detect'] = round(time.time() - start, 3)
+        timings['lines'] = len(lines) if lines else 0
+        _report(progress, 'detect', lines=timings['lines'], seconds=timings['detect'])
+        print(f"[Ensemble] Рядків знайдено: {timings['lines']} за {timings['detect']:.1f}с")
+    if lines and OCR_FUSION:
+        text = _ensemble_fused(original_image, lines, timings, progress)
+    else:
+        processed_image = None
+        if not lines:
+            processed_image = preprocess(original_image) if preprocess else original_image
+        ensemble = _ensemble_parallel if OCR_PARALLEL else _ensemble_sequential
+        try:
+            text = ensemble(original_image, processed_image, lines, timings, progress)
+        finally:
+            if processed_image is not None and processed_image is not original_image:
+                processed_image.close()
+    timings['total'] = round(time.time() - start, 3)
+    return text
+
+
+def _timed(func, image, lines=None):
+    """(текст, секунди) — обгортка для запуску в пулі."""
+    t = time.time()
+    text = func(image, lines)
+    return text, time.time() - t
+
+
+def _ensemble_parallel(original_image, processed_image, lines, timings, progress=None):
+    """Паралельний ensemble з ранньою зупинкою та дедлайном.
+
+      1. EasyOCR (оригінал) і Tesseract (оброблене або рядки оригіналу)
+         стартують одночасно
+      2. Перший результат з INCI-score ≥ 3 повертається одразу; решта
+         движків скасовується (якщо ще не стартували) або ігнорується
+      3. TrOCR — лише якщо обидва результати слабкі й дедлайн дозволяє
+      4. Після OCR_DEADLINE повертаємо найкраще з уже готового
+
+    Кожен движок отримує власну копію зображення: проігноровані задачі
+    можуть дочитувати його вже після того, як extract_text закрив оригінали.
+    """
+    deadline = time.time() + OCR_DEADLINE
+    pool = _get_ocr_pool()
+    results = {}
+
+    futures = {}
+    if EASYOCR_AVAILABLE:
+        futures[pool.submit(_timed, _ocr_easyocr, original_image.copy(), lines)] = 'easyocr'
+    tesseract_image = original_image if lines else processed_image
+    futures[pool.submit(_timed, _ocr_tesseract_multimode,
+                        tesseract_image.copy(), lines)] = 'tesseract'
+    print(f"[Ensemble] Паралельно: {', '.join(futures.values())}...")
+
+    def _collect(pending):
+        while pending:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                engine = futures[future]
+                try:
+                    text, elapsed = future.result()
+                except Exception as e:
+                    print(f"[Ensemble] {engine}: помилка {e}")
+                    continue
+                timings[engine] = round(elapsed, 3)
+                score = _inci_score(text) if text else None
+                _report(progress, 'ocr', engine=engine, seconds=timings[engine], inci_score=score)
+                if not text:
+                    continue
+                results[engine] = (text, score)
+                print(f"[Ensemble] {engine}: {len(text)} символів, "
+                      f"INCI={score:.1f}, {elapsed:.1f}с")
+                if score >= INCI_GOOD_SCORE:
+                    print(f"[Ensemble] ✓ {engine} достатній (INCI≥{INCI_GOOD_SCORE}), "
+                          f"інші не чекаємо")
+                    return pending, engine
+        return pending, None
+
+    pending, winner = _collect(set(futures))
+
+    if winner is None:
+        best_so_far = max((s for _, s in results.values()), default=0)
+        if TROCR_AVAILABLE and best_so_far < INCI_WEAK_SCORE and not pending:
+            if time.time() < deadline:
+                print("[Ensemble] TrOCR (попередні результати слабкі)...")
+                trocr = pool.submit(_timed, _ocr_trocr, original_image.copy(), lines)
+                futures[trocr] = 'trocr'
+                pending, winner = _collect({trocr})
+        elif TROCR_AVAILABLE and best_so_far >= INCI_WEAK_SCORE:
+            print(f"[Ensemble] TrOCR пропущено (вже є результат з INCI={best_so_far:.1f})")
+
+    for future in pending:
+        future.cancel()
+    timings['pending'] = sorted(futures[f] for f in pending)
+    if pending and winner is None:
+        print(f"[Ensemble] Дедлайн {OCR_DEADLINE:.0f}с: не дочекались "
+              f"{', '.join(timings['pending'])}")
+
+    return _select_best(results, timings)
+
+
+def _select_best(results, timings):
+    if not results:
+        return ""
+    # Вибираємо найкращий за INCI-метрикою
+    best_src = max(results, key=lambda k: results[k][1])
+    timings['selected'] = best_src
+    timings['inci_score'] = round(results[best_src][1], 1)
+    print(f"[Ensemble] ✓ Обрано: {best_src} (INCI={results[best_src][1]:.1f})")
+    return results[best_src][0]
+
+
+def _ensemble_sequential(original_image, processed_image, lines, timings, progress=None):
+    """Послідовний Ensemble OCR: пріоритетний запуск з ранньою зупинкою.
 
     Замість запуску всіх трьох движків послідовно (TrOCR ~30с + EasyOCR ~10с
     + Tesseract ~5с = ~45с), використовуємо стратегію раннього виходу:
@@ -426,66 +1231,317 @@ def _ensemble_ocr(original_image, processed_image):
     Це зменшує час обробки з ~45с до ~10-15с у типовому випадку.
     """
     results = {}
-    inci_kw = {
-        'aqua', 'water', 'sodium', 'glycerin', 'acid', 'parfum',
-        'fragrance', 'alcohol', 'oil', 'extract', 'butter', 'oxide',
-        'sulfate', 'chloride', 'hydroxide', 'stearate', 'cetyl',
-        'lauryl', 'laureth', 'cocamidopropyl', 'betaine', 'glucoside',
-        'dimethicone', 'tocopherol', 'panthenol', 'phenoxyethanol',
-        'carbomer', 'xanthan', 'acrylates', 'polysorbate',
-    }
-
-    def _inci_score(text):
-        lo = text.lower()
-        return sum(1 for kw in inci_kw if kw in lo) + text.count(',') * 0.5
 
     # ─── Етап 1: EasyOCR (CRNN, ~8-12с, найкращий баланс) ───
     if EASYOCR_AVAILABLE:
         print("[Ensemble] Етап 1: EasyOCR...")
-        t = time.time()
-        text = _ocr_easyocr(original_image)
+        text, elapsed = _timed(_ocr_easyocr, original_image, lines)
+        timings['easyocr'] = round(elapsed, 3)
+        _report(progress, 'ocr', engine='easyocr', seconds=timings['easyocr'],
+                inci_score=_inci_score(text) if text else None)
         if text:
             score = _inci_score(text)
             results['easyocr'] = (text, score)
             print(f"[Ensemble] EasyOCR: {len(text)} символів, "
-                  f"INCI={score:.1f}, {time.time()-t:.1f}с")
+                  f"INCI={score:.1f}, {elapsed:.1f}с")
             # Рання зупинка: якщо знайдено ≥3 INCI-слова — результат достатній
-            if score >= 3:
+            if score >= INCI_GOOD_SCORE:
                 print(f"[Ensemble] ✓ EasyOCR достатній (INCI≥3), пропускаємо інші")
+                timings['selected'] = 'easyocr'
+                timings['inci_score'] = round(score, 1)
                 return text
 
     # ─── Етап 2: Tesseract (LSTM, ~3-5с, швидкий fallback) ───
     print("[Ensemble] Етап 2: Tesseract...")
-    t = time.time()
-    text = _ocr_tesseract_multimode(processed_image)
+    text, elapsed = _timed(_ocr_tesseract_multimode,
+                           original_image if lines else processed_image, lines)
+    timings['tesseract'] = round(elapsed, 3)
+    _report(progress, 'ocr', engine='tesseract', seconds=timings['tesseract'],
+            inci_score=_inci_score(text) if text else None)
     if text:
         score = _inci_score(text)
         results['tesseract'] = (text, score)
         print(f"[Ensemble] Tesseract: {len(text)} символів, "
-              f"INCI={score:.1f}, {time.time()-t:.1f}с")
+              f"INCI={score:.1f}, {elapsed:.1f}с")
 
     # ─── Етап 3: TrOCR ТІЛЬКИ якщо попередні дали поганий результат ───
     best_so_far = max((s for _, s in results.values()), default=0)
-    if TROCR_AVAILABLE and best_so_far < 2:
+    if TROCR_AVAILABLE and best_so_far < INCI_WEAK_SCORE:
         print("[Ensemble] Етап 3: TrOCR (попередні результати слабкі)...")
-        t = time.time()
-        text = _ocr_trocr(original_image)
+        text, elapsed = _timed(_ocr_trocr, original_image, lines)
+        timings['trocr'] = round(elapsed, 3)
+        _report(progress, 'ocr', engine='trocr', seconds=timings['trocr'],
+                inci_score=_inci_score(text) if text else None)
         if text:
             score = _inci_score(text)
             results['trocr'] = (text, score)
             print(f"[Ensemble] TrOCR: {len(text)} символів, "
-                  f"INCI={score:.1f}, {time.time()-t:.1f}с")
+                  f"INCI={score:.1f}, {elapsed:.1f}с")
     elif TROCR_AVAILABLE:
         print(f"[Ensemble] TrOCR пропущено (вже є результат з INCI={best_so_far:.1f})")
 
-    if not results:
+    return _select_best(results, timings)
+
+
+# ═══════════════════════════════════════════════════════════════════
+# ЗЛИТТЯ РЕЗУЛЬТАТІВ ПО РЯДКАХ
+# ═══════════════════════════════════════════════════════════════════
+#
+# Коли рядки знайдено (_detect_lines), движки повертають для кожного
+# рядка токени (слово, довіра 0..1), а не лише текст. Замість вибору
+# одного тексту-переможця рядки різних движків вирівнюються по словах
+# (difflib), і для кожної позиції обирається слово з найвищою оцінкою:
+# довіра движка + бонус, якщо слово є у словнику назв інгредієнтів.
+# Рядок, де всі слова впевнені й здебільшого словникові, більше не
+# передається наступним движкам — повторно розпізнаються лише слабкі
+# рядки, а не все зображення.
+
+# OCR_FUSION=0 — вибір найкращого тексту цілком, як раніше
+OCR_FUSION = os.environ.get('OCR_FUSION', '1') != '0'
+# Слово впевнене, якщо довіра не нижча за це
+OCR_TOKEN_CONF = float(os.environ.get('OCR_TOKEN_CONF', '0.6'))
+# Рядок без словникових слів вважається впевненим лише з такою середньою довірою
+OCR_LINE_CONF = 0.9
+# Частка словникових слів, з якою впевнений рядок не розпізнається повторно
+OCR_VOCAB_SHARE = 0.5
+# Бонус до оцінки слова зі словника при виборі між движками
+OCR_VOCAB_BONUS = 0.3
+# TrOCR отримує не більше стількох найслабших рядків
+TROCR_MAX_LINES = int(os.environ.get('TROCR_MAX_LINES', '16'))
+
+# Слова з назв інгредієнтів (set_vocabulary); порожньо — без словникового бонусу
+_vocab_words = frozenset()
+
+
+def set_vocabulary(names):
+    """Словник для злиття: слова (від 3 літер) з назв інгредієнтів.
+
+    names — IngredientChecker.known_names(). Пул OCR-процесів отримує
+    словник при старті воркерів, а після змін назв — зі спільного списку,
+    один раз на процес (ocr_service.py).
+    """
+    global _vocab_words
+    _vocab_words = frozenset(w for name in names
+                             for w in re.findall(r'[^\W\d_]{3,}', name.lower()))
+    print(f"[OCR] Словник для злиття рядків: {len(_vocab_words)} слів")
+
+
+def _token_score(token):
+    word, conf, _ = token
+    return conf + (OCR_VOCAB_BONUS if normalize_word(word) in _vocab_words else 0)
+
+
+def _line_score(tokens):
+    return sum(_token_score(t) for t in tokens) / len(tokens) if tokens else 0
+
+
+def _line_confident(tokens):
+    """Чи можна не розпізнавати рядок наступними движками."""
+    if not tokens:
+        return False
+    words = [(normalize_word(w), c) for w, c, _ in tokens]
+    words = [(n, c) for n, c in words if len(n) >= 3]
+    if not words:
+        return min(c for _, c, _ in tokens) >= OCR_TOKEN_CONF
+    if min(c for _, c in words) < OCR_TOKEN_CONF:
+        return False
+    if _vocab_words:
+        known = sum(1 for n, _ in words if n in _vocab_words)
+        if known / len(words) >= OCR_VOCAB_SHARE:
+            return True
+    return sum(c for _, c in words) / len(words) >= OCR_LINE_CONF
+
+
+def _merge_tokens(base, other):
+    """Вирівнює два варіанти рядка [(слово, довіра, движок)] і зливає їх.
+
+      equal   — движки згодні: слово з вищою довірою, довіра зростає
+                як для незалежних свідчень: 1 − (1 − a)(1 − b)
+      replace — рівні за довжиною ділянки пословно, інакше ділянка
+                з вищою середньою оцінкою (_token_score)
+      delete  — слова лише в base лишаються
+      insert  — слова лише в other додаються, якщо вони словникові й впевнені
+    """
+    a = [normalize_word(w) or w.lower() for w, _, _ in base]
+    b = [normalize_word(w) or w.lower() for w, _, _ in other]
+    merged = []
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if op == 'equal':
+            for x, y in zip(base[i1:i2], other[j1:j2]):
+                best = x if x[1] >= y[1] else y
+                merged.append((best[0], 1 - (1 - x[1]) * (1 - y[1]), best[2]))
+        elif op == 'replace':
+            if i2 - i1 == j2 - j1:
+                merged.extend(max(x, y, key=_token_score)
+                              for x, y in zip(base[i1:i2], other[j1:j2]))
+            else:
+                merged.extend(max(base[i1:i2], other[j1:j2], key=_line_score))
+        elif op == 'delete':
+            merged.extend(base[i1:i2])
+        else:
+            merged.extend(t for t in other[j1:j2]
+                          if t[1] >= OCR_TOKEN_CONF and normalize_word(t[0]) in _vocab_words)
+    return merged
+
+
+def _fuse_line(variants):
+    """Злиття варіантів одного рядка {движок: токени}; основа — найкращий варіант."""
+    ordered = sorted(variants.values(), key=_line_score, reverse=True)
+    if not ordered:
+        return []
+    fused = ordered[0]
+    for other in ordered[1:]:
+        fused = _merge_tokens(fused, other)
+    return fused
+
+
+def _ensemble_fused(original_image, lines, timings, progress=None):
+    """Ensemble зі злиттям по рядках і ранньою зупинкою по рядках.
+
+      1. EasyOCR і Tesseract на рядках — паралельно (OCR_PARALLEL) або
+         послідовно, і тоді Tesseract отримує лише слабкі після EasyOCR
+         рядки. Якщо після першого движка слабких рядків немає — решту
+         не чекаємо
+      2. TrOCR — лише на рядках, що лишилися слабкими (не більше
+         TROCR_MAX_LINES найслабших), якщо дедлайн дозволяє
+      3. Після OCR_DEADLINE — злиття того, що вже готове
+
+    timings додатково отримує 'weak_lines', внесок движків у злитий
+    текст 'engines' і 'tokens' — [{'text', 'conf', 'engine'}] для кожного
+    слова злитого тексту.
+    """
+    deadline = time.time() + OCR_DEADLINE
+    variants = [{} for _ in lines]
+    fused = [[] for _ in lines]
+    weak = list(range(len(lines)))
+
+    def _accept(engine, subset, result, elapsed):
+        timings[engine] = round(elapsed, 3)
+        for i, tokens in zip(subset, result or []):
+            if tokens:
+                variants[i][engine] = [(w, c, engine) for w, c in tokens]
+                fused[i] = _fuse_line(variants[i])
+        still_weak = [i for i in range(len(lines)) if not _line_confident(fused[i])]
+        text = ' '.join(w for tokens in (result or []) for w, _ in tokens)
+        score = _inci_score(text) if text else None
+        _report(progress, 'ocr', engine=engine, seconds=timings[engine],
+                inci_score=score, lines=len(subset), weak_lines=len(still_weak))
+        print(f"[Fusion] {engine}: {len(subset)} рядків за {elapsed:.1f}с, "
+              f"слабких лишилось {len(still_weak)}/{len(lines)}")
+        return still_weak
+
+    engines = ([('easyocr', _easyocr_lines)] if EASYOCR_AVAILABLE else []) + \
+              [('tesseract', _tesseract_lines)]
+    timings['pending'] = []
+    if OCR_PARALLEL:
+        pool = _get_ocr_pool()
+        futures = {pool.submit(_timed, func, original_image.copy(), lines): engine
+                   for engine, func in engines}
+        print(f"[Fusion] Паралельно: {', '.join(futures.values())} на {len(lines)} рядках...")
+        pending = set(futures)
+        while pending and weak:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result, elapsed = future.result()
+                except Exception as e:
+                    print(f"[Fusion] {futures[future]}: помилка {e}")
+                    continue
+                weak = _accept(futures[future], range(len(lines)), result, elapsed)
+        for future in pending:
+            future.cancel()
+        timings['pending'] = sorted(futures[f] for f in pending)
+    else:
+        for engine, func in engines:
+            if not weak or time.time() > deadline:
+                break
+            subset = weak
+            try:
+                result, elapsed = _timed(func, original_image, [lines[i] for i in subset])
+            except Exception as e:
+                print(f"[Fusion] {engine}: помилка {e}")
+                continue
+            weak = _accept(engine, subset, result, elapsed)
+
+    if TROCR_AVAILABLE and weak and time.time() < deadline:
+        subset = sorted(sorted(weak, key=lambda i: _line_score(fused[i]))[:TROCR_MAX_LINES])
+        print(f"[Fusion] TrOCR на {len(subset)} слабких рядках...")
+        result = None
+        if OCR_PARALLEL:
+            future = pool.submit(_timed, _trocr_lines, original_image.copy(),
+                                 [lines[i] for i in subset])
+            done, _ = wait({future}, timeout=max(deadline - time.time(), 0))
+            if not done:
+                future.cancel()
+                timings['pending'].append('trocr')
+            else:
+                try:
+                    result, elapsed = future.result()
+                except Exception as e:
+                    print(f"[Fusion] trocr: помилка {e}")
+        else:
+            try:
+                result, elapsed = _timed(_trocr_lines, original_image,
+                                         [lines[i] for i in subset])
+            except Exception as e:
+                print(f"[Fusion] trocr: помилка {e}")
+        if result is not None:
+            weak = _accept('trocr', subset, result, elapsed)
+
+    tokens = [t for line in fused for t in line]
+    if not tokens:
         return ""
+    text = ' '.join(w for w, _, _ in tokens)
+    timings['selected'] = 'fusion'
+    timings['inci_score'] = round(_inci_score(text), 1)
+    timings['weak_lines'] = len(weak)
+    timings['engines'] = dict(Counter(e for _, _, e in tokens))
+    timings['tokens'] = [{'text': w, 'conf': round(c, 3), 'engine': e} for w, c, e in tokens]
+    print(f"[Fusion] ✓ {len(tokens)} слів з {timings['engines']}, "
+          f"слабких рядків: {len(weak)}, INCI={timings['inci_score']}")
+    return text
 
-    # Вибираємо найкращий за INCI-метрикою
-    best_src = max(results, key=lambda k: results[k][1])
-    best_text = results[best_src][0]
-    print(f"[Ensemble] ✓ Обрано: {best_src} (INCI={results[best_src][1]:.1f})")
-    return best_text
+
+# ═══════════════════════════════════════════════════════════════════
+# ПРОГРІВ
+# ═══════════════════════════════════════════════════════════════════
+
+OCR_ENGINES = ('easyocr', 'tesseract', 'trocr')
+
+
+def _warmup_image():
+    image = Image.new('RGB', (480, 64), 'white')
+    ImageDraw.Draw(image).text((8, 24), "Aqua, Glycerin, Sodium Chloride", fill='black')
+    return image
+
+
+def warm_up(engine):
+    """Завантажує движок і проганяє одне фіктивне розпізнавання.
+
+    Перший інференс виділяє буфери та ініціалізує нативні бібліотеки —
+    без прогріву це платить перший користувач. Повертає True, якщо
+    движок готовий, False — якщо недоступний.
+    """
+    image = _warmup_image()
+    if engine == 'easyocr':
+        if _get_easyocr_reader() is None:
+            return False
+        _ocr_easyocr(image)
+    elif engine == 'trocr':
+        if _get_trocr()[1] is None:
+            return False
+        _ocr_trocr(image)
+    elif engine == 'tesseract':
+        # Обидві конфігурації мультирежиму — створює дескриптори tesserocr
+        gray = image.convert('L')
+        return all(_ocr_tesseract(gray, config) is not None
+                   for config in (TESSERACT_CONFIG_MULTI, TESSERACT_CONFIG_ENG))
+    else:
+        raise ValueError(f"Невідомий OCR-движок: {engine}")
+    return True
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -575,48 +1631,144 @@ def clean_text(text):
 # ГОЛОВНА ФУНКЦІЯ
 # ═══════════════════════════════════════════════════════════════════
 
-def extract_text(file):
-    """Головна функція: зображення → текст.
+def _cache_lookup(lookup, key):
+    try:
+        return lookup(key)
+    except Exception as e:
+        print(f"[OCR] Помилка кешу OCR: {e}")
+        return None
+
+
+def _cached_text(hit, timings, total_start, progress=None):
+    timings['cache'] = hit['match']
+    _report(progress, 'cache', match=hit['match'], engine=hit['engine'])
+    timings['ocr'] = {'selected': hit['engine'], 'inci_score': hit['inci_score']}
+    timings['total'] = round(time.time() - total_start, 3)
+    print(f"[OCR] ✓ З кешу ({hit['match']}) за {timings['total'] * 1000:.0f}мс, "
+          f"{len(hit['text'])} символів")
+    return hit['text']
+
+
+def lookup_cached(raw_bytes, timings=None):
+    """Текст з кешу OCR за точним хешем байтів або None (мілісекунди)."""
+    cache = get_ocr_cache()
+    if cache is None or not raw_bytes:
+        return None
+    start = time.time()
+    hit = _cache_lookup(cache.get_exact, sha256_bytes(raw_bytes))
+    if hit is None:
+        return None
+    return _cached_text(hit, {} if timings is None else timings, start)
+
+
+def extract_text(file, timings=None):
+    """Головна функція: завантажений файл (werkzeug FileStorage) → текст."""
+    filename = file.filename if hasattr(file, 'filename') else 'unknown'
+    file.stream.seek(0)
+    return extract_text_from_bytes(file.stream.read(), filename, timings)
+
+
+def extract_text_from_bytes(raw_bytes, filename='unknown', timings=None, progress=None):
+    """Байти зображення → текст.
 
     Pipeline:
       1. Завантаження зображення
-      2. Попередня обробка (OpenCV або PIL)
-      3. Ensemble OCR (EasyOCR + Tesseract)
+      2. Обрізка до блоку зі складом (_crop_ingredient_region)
+      3. Ensemble OCR: спільна детекція рядків, далі EasyOCR + Tesseract
+         (попередня обробка OpenCV/PIL — лише якщо рядків не знайдено);
+         якщо текст обрізки слабший за INCI_WEAK_SCORE — повтор на
+         всьому зображенні
       4. Очищення та корекція
+
+    timings (dict, необов'язково) заповнюється часом етапів у секундах:
+    'region_detect', 'ocr' (див. _ensemble_ocr) і 'total'; 'preprocess'
+    і 'preprocess_steps' — лише якщо попередня обробка виконувалась
+    (кроки й рішення preprocess_image: масштаб, висота тексту, кут
+    нахилу, рівень шуму); 'tokens' — слова злитого
+    тексту з довірою (лише після злиття по рядках, не з кешу);
+    'region' — рамка обрізки, якщо її застосовано; 'region_fallback' —
+    True, якщо обрізку відкинуто і текст взято з усього зображення
+    (тоді 'region' немає); 'cache' — exact, perceptual або miss (див.
+    ocr_cache.py).
+
+    progress (callable, необов'язково) отримує події етапів:
+    'cache' (збіг у кеші), 'detect', 'preprocess' (якщо виконувалась),
+    'ocr' (кожен движок).
     """
+    if timings is None:
+        timings = {}
     try:
-        filename = file.filename if hasattr(file, 'filename') else 'unknown'
         print(f"\n{'='*60}")
         print(f"[OCR] Обробка: {filename}")
         print(f"{'='*60}")
 
         total_start = time.time()
 
-        file.stream.seek(0)
-        file_bytes = io.BytesIO(file.stream.read())
-        file_bytes.seek(0)
-
-        if file_bytes.getbuffer().nbytes == 0:
+        if not raw_bytes:
             return ""
 
+        cache = get_ocr_cache()
+        sha = sha256_bytes(raw_bytes)
+        if cache is not None:
+            hit = _cache_lookup(cache.get_exact, sha)
+            if hit is not None:
+                return _cached_text(hit, timings, total_start, progress)
+
         try:
-            image = Image.open(file_bytes)
+            image = Image.open(io.BytesIO(raw_bytes))
+            image.load()
         except Exception as e:
             print(f"[OCR] Не вдалося відкрити: {e}")
             return ""
 
-        original_image = image.copy()
-        processed_image = preprocess_image(image)
-
-        raw_text = _ensemble_ocr(original_image, processed_image)
-
+        image_hash = dhash(image)
+        if cache is not None:
+            hit = _cache_lookup(cache.get_similar, image_hash)
+            if hit is not None:
+                image.close()
+                return _cached_text(hit, timings, total_start, progress)
+            timings['cache'] = 'miss'
+
+        region = _crop_ingredient_region(image, timings)
+
+        def _preprocess(img):
+            t = time.time()
+            timings['preprocess_steps'] = {}
+            processed = preprocess_image(img, timings['preprocess_steps'])
+            timings['preprocess'] = round(time.time() - t, 3)
+            _report(progress, 'preprocess', seconds=timings['preprocess'],
+                    region=timings.get('region'), steps=timings['preprocess_steps'].get('steps'))
+            return processed
+
+        timings['ocr'] = {}
+        raw_text = _ensemble_ocr(region, _preprocess, timings['ocr'], progress)
+
+        if region is not image:
+            region.close()
+            # Обрізка могла відрізати склад — перевіряємо на всьому зображенні
+            if _inci_score(raw_text) < INCI_WEAK_SCORE:
+                print("[Region] Слабкий текст обрізки — повтор на всьому зображенні")
+                full_timings = {}
+                full_text = _ensemble_ocr(image, _preprocess, full_timings, progress)
+                if _inci_score(full_text) > _inci_score(raw_text):
+                    raw_text = full_text
+                    timings['ocr'] = full_timings
+                    timings.pop('region', None)
+                    timings['region_fallback'] = True
         image.close()
-        original_image.close()
-        processed_image.close()
-        file_bytes.close()
 
         cleaned_text = clean_text(raw_text)
+        if 'tokens' in timings['ocr']:
+            timings['tokens'] = timings['ocr'].pop('tokens')
         elapsed = time.time() - total_start
+        timings['total'] = round(elapsed, 3)
+
+        if cache is not None and cleaned_text:
+            try:
+                cache.put(sha, image_hash, cleaned_text,
+                          timings['ocr'].get('selected'), timings['ocr'].get('inci_score'))
+            except Exception as e:
+                print(f"[OCR] Не вдалося зберегти в кеш: {e}")
 
         print(f"[OCR] ✓ Готово за {elapsed:.1f}с, {len(cleaned_text)} символів")
         return cleaned_text
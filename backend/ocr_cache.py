@@ -0,0 +1,162 @@
+# ocr_cache.py — постійний кеш результатів OCR за хешем зображення
+"""
+Кеш результатів extract_text у локальній SQLite-базі.
+
+  - Ключ — SHA-256 байтів файлу (точний збіг) і dHash зменшеного
+    зображення (майже однакові фото: повторне фото тієї ж етикетки,
+    перезбереження з іншим стисненням). Перцептивний збіг — відстань
+    Хеммінга між dHash не більша за max_distance.
+  - Зберігається очищений текст, обраний движок і INCI-score.
+  - Розмір обмежено: при переповненні видаляються найдавніше використані
+    записи (LRU за last_used).
+  - Безпечний для кількох воркерів: WAL-журнал, окреме з'єднання на
+    кожну операцію, запис у транзакції з очікуванням блокування.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from PIL import Image
+
+DEFAULT_PATH = os.path.join('data_cache', 'ocr_cache.sqlite3')
+DEFAULT_MAXSIZE = 5000
+# dHash 64 біти: до 4 різних біт — те саме фото
+DEFAULT_MAX_DISTANCE = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr_results (
+    sha256      TEXT PRIMARY KEY,
+    dhash       INTEGER NOT NULL,
+    text        TEXT NOT NULL,
+    engine      TEXT,
+    inci_score  REAL,
+    created_at  REAL NOT NULL,
+    last_used   REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_ocr_results_last_used ON ocr_results (last_used);
+-- Покриваючий індекс для перцептивного пошуку: перебір без читання текстів
+CREATE INDEX IF NOT EXISTS idx_ocr_results_dhash ON ocr_results (dhash, sha256);
+"""
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def dhash(image, size=8):
+    """Різницевий хеш: знак градієнта яскравості на зображенні (size+1)×size."""
+    small = image.convert('L').resize((size + 1, size), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _to_signed(value):
+    # SQLite INTEGER — знакове 64-бітне
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class OCRCache:
+    """Кеш OCR: sha256/dHash → (текст, движок, INCI-score)."""
+
+    def __init__(self, path=DEFAULT_PATH, maxsize=DEFAULT_MAXSIZE,
+                 max_distance=DEFAULT_MAX_DISTANCE):
+        self.path = path
+        self.maxsize = maxsize
+        self.max_distance = max_distance
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _touch(self, conn, sha):
+        conn.execute('UPDATE ocr_results SET last_used = ?, hits = hits + 1 WHERE sha256 = ?',
+                     (time.time(), sha))
+
+    def get_exact(self, sha):
+        """Запис для точного хешу байтів або None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT text, engine, inci_score FROM ocr_results WHERE sha256 = ?', (sha,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._touch(conn, sha)
+        self.hits += 1
+        return {'text': row[0], 'engine': row[1], 'inci_score': row[2], 'match': 'exact'}
+
+    def get_similar(self, image_hash):
+        """Найближчий за dHash запис у межах max_distance або None.
+
+        Перебираються лише (sha256, dhash) з покриваючого індексу; текст
+        читається за первинним ключем тільки для найближчого запису.
+        """
+        with self._connect() as conn:
+            best = None
+            for sha, value in conn.execute('SELECT sha256, dhash FROM ocr_results'):
+                distance = bin((value & 0xFFFFFFFFFFFFFFFF) ^ image_hash).count('1')
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, sha)
+            row = None
+            if best is not None:
+                row = conn.execute(
+                    'SELECT text, engine, inci_score FROM ocr_results WHERE sha256 = ?',
+                    (best[1],)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._touch(conn, best[1])
+        self.perceptual_hits += 1
+        return {'text': row[0], 'engine': row[1], 'inci_score': row[2],
+                'match': 'perceptual', 'distance': best[0]}
+
+    def put(self, sha, image_hash, text, engine=None, inci_score=None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO ocr_results '
+                '(sha256, dhash, text, engine, inci_score, created_at, last_used, hits) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, 0)',
+                (sha, _to_signed(image_hash), text, engine, inci_score, now, now))
+            excess = conn.execute('SELECT COUNT(*) FROM ocr_results').fetchone()[0] - self.maxsize
+            if excess > 0:
+                conn.execute(
+                    'DELETE FROM ocr_results WHERE sha256 IN '
+                    '(SELECT sha256 FROM ocr_results ORDER BY last_used LIMIT ?)', (excess,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM ocr_results')
+
+    def stats(self):
+        with self._connect() as conn:
+            size = conn.execute('SELECT COUNT(*) FROM ocr_results').fetchone()[0]
+        return {
+            'size': size,
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'perceptual_hits': self.perceptual_hits,
+            'misses': self.misses,
+            'max_distance': self.max_distance,
+        }
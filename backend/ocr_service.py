@@ -0,0 +1,361 @@
+# ocr_service.py — пул OCR-воркерів, відокремлений від потоків Flask
+"""
+Сервісний шар OCR.
+
+extract_text займає процесор на 10–45 с (OpenCV, нейромережі). Якщо
+виконувати його в потоці запиту, сплеск завантажень фото з'їдає CPU та
+GIL і гальмує текстові ендпоінти (/api/analyze_text, /api/scans). Тут:
+
+  - Обмежений пул процесів (OCR_PROCESSES) з моделями, прогрітими
+    в ініціалізаторі кожного процесу (warmup.py, режим sync).
+  - Черга з backpressure: одночасно не більше OCR_PROCESSES + OCR_QUEUE_SIZE
+    задач; понад це submit() одразу кидає OCRBusy з retry_after, і
+    ендпоінт відповідає 503 + Retry-After, а не чекає.
+  - extract_text(file, timings, timeout) — синхронна обгортка з
+    тайм-аутом (OCRTimeout). Задача, що не вклалася, дорахується у
+    воркері (процес не вбиваємо), але її слот у черзі звільниться лише
+    по завершенню — це і є backpressure.
+  - Точний збіг у кеші OCR (ocr_cache.py) перевіряється ще в процесі
+    Flask і слот у черзі не займає.
+  - Якщо воркер пулу аварійно завершився (OOM, segfault у нативному
+    коді), пул перебудовується; extract_text один раз повторює задачу,
+    далі — OCRWorkerCrashed (503, як OCRBusy).
+  - Словник назв для злиття рядків (ocr.set_vocabulary) береться з
+    джерела з версією (IngredientChecker.vocabulary): процеси отримують
+    його при старті, а після змін назв задача несе лише посилання на
+    спільний список (Manager) — кожен воркер копіює його один раз.
+
+OCR_POOL:
+  process (типово) — пул процесів (forkserver на POSIX, інакше spawn)
+  thread           — пул потоків у тому ж процесі (без ізоляції CPU/GIL)
+  off              — як раніше, extract_text у потоці запиту
+"""
+
+import functools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import ocr
+import warmup
+
+OCR_POOL = os.environ.get('OCR_POOL', 'process')
+OCR_PROCESSES = int(os.environ.get('OCR_PROCESSES', str(min(2, os.cpu_count() or 1))))
+OCR_QUEUE_SIZE = int(os.environ.get('OCR_QUEUE_SIZE', '8'))
+# Скільки чекає /api/analyze, секунд
+OCR_TIMEOUT = float(os.environ.get('OCR_TIMEOUT', '90'))
+# Орієнтовний час однієї задачі — для заголовка Retry-After
+OCR_RETRY_AFTER = int(os.environ.get('OCR_RETRY_AFTER', '15'))
+
+
+class OCRBusy(Exception):
+    """Черга OCR заповнена — запит відхилено одразу."""
+
+    def __init__(self, retry_after=OCR_RETRY_AFTER, reason="Черга OCR заповнена"):
+        super().__init__(f"{reason}, повторіть через {retry_after}с")
+        self.retry_after = retry_after
+
+
+class OCRTimeout(Exception):
+    """Розпізнавання не вклалося в тайм-аут."""
+
+
+class OCRWorkerCrashed(OCRBusy):
+    """Воркер пулу аварійно завершився і на повторі — відповідаємо 503."""
+
+    def __init__(self, retry_after=OCR_RETRY_AFTER):
+        super().__init__(retry_after, reason="Воркер OCR аварійно завершився")
+
+
+# Версія словника, з якою працює цей процес пулу
+_worker_vocabulary_version = None
+
+
+def _set_worker_vocabulary(version, vocabulary):
+    """vocabulary — список або ListProxy; копіюється лише для нової версії."""
+    global _worker_vocabulary_version
+    if vocabulary is not None and version != _worker_vocabulary_version:
+        # [:] — один виклик до Manager замість виклику на кожен елемент
+        ocr.set_vocabulary(vocabulary[:])
+        _worker_vocabulary_version = version
+
+
+def _init_worker(vocabulary=None, version=None):
+    _set_worker_vocabulary(version, vocabulary)
+    # Процес пулу обслуговує лише OCR — гріємо тільки OCR-движки
+    if warmup.WARMUP_MODE != 'off':
+        warmup.start(models=[m for m in warmup.WARMUP_MODELS if m in ocr.OCR_ENGINES],
+                     mode='sync')
+
+
+def _run_job(raw_bytes, filename, progress_queue=None, vocabulary=None):
+    if vocabulary is not None:
+        _set_worker_vocabulary(*vocabulary)
+    timings = {}
+    progress = progress_queue.put if progress_queue is not None else None
+    text = ocr.extract_text_from_bytes(raw_bytes, filename, timings, progress)
+    return text, timings
+
+
+def _ping():
+    return os.getpid()
+
+
+def _mp_context():
+    # forkserver не перезапускає головний модуль (app.py) у кожному
+    # воркері — лише цей модуль з ocr; на Windows доступний тільки spawn
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return multiprocessing.get_context('spawn')
+
+
+class OCRService:
+    """Обмежений пул OCR з чергою та синхронною обгорткою."""
+
+    def __init__(self, mode=OCR_POOL, workers=OCR_PROCESSES, queue_size=OCR_QUEUE_SIZE):
+        self.mode = mode
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._manager = None
+        self._vocabulary_source = None
+        self._vocabulary = None
+        self._vocabulary_version = None
+        # (версія, ListProxy) — словник, спільний для процесів пулу
+        self._shared_vocabulary = None
+        # Версія словника, з якою стартували процеси поточного пулу
+        self._pool_vocabulary_version = None
+        self._ready = mode == 'off'
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def start(self, vocabulary=None):
+        """Створює пул і запускає процеси, щоб вони прогрілися до першого запиту.
+
+        vocabulary — джерело назв інгредієнтів для злиття рядків OCR:
+        функція since → (версія, назви | None), як
+        IngredientChecker.vocabulary. Перевіряється перед кожною задачею.
+        """
+        self._vocabulary_source = vocabulary
+        self._refresh_vocabulary()
+        if self.mode == 'off':
+            return
+        self._ensure_pool()
+
+    def _refresh_vocabulary(self):
+        """Підтягує словник із джерела, якщо його версія змінилась."""
+        if self._vocabulary_source is None:
+            return
+        try:
+            version, names = self._vocabulary_source(since=self._vocabulary_version)
+        except Exception as e:
+            print(f"[OCRService] Словник недоступний: {e}")
+            return
+        if names is None:
+            return
+        vocabulary = sorted(names)
+        with self._lock:
+            self._vocabulary, self._vocabulary_version = vocabulary, version
+        # Для режимів thread/off — той самий процес
+        ocr.set_vocabulary(vocabulary)
+
+    def _job_vocabulary(self):
+        """(версія, спільний список) для задачі, якщо процеси пулу стартували зі старим словником.
+
+        Задача несе лише посилання на список у Manager; воркер копіює його,
+        тільки якщо має іншу версію, — тобто один раз на процес.
+        """
+        with self._lock:
+            if self.mode != 'process' or self._vocabulary_version == self._pool_vocabulary_version:
+                return None
+            version, vocabulary, shared = (self._vocabulary_version, self._vocabulary,
+                                           self._shared_vocabulary)
+        if shared is None or shared[0] != version:
+            shared = (version, self._shared_manager().list(vocabulary))
+            with self._lock:
+                self._shared_vocabulary = shared
+        return shared
+
+    def _ensure_pool(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                return
+            if self.mode == 'process':
+                with self._lock:
+                    vocabulary, version = self._vocabulary, self._vocabulary_version
+                self._pool_vocabulary_version = version
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=_mp_context(),
+                    initializer=_init_worker,
+                    initargs=(vocabulary, version),
+                )
+            else:
+                # thread, а також off для асинхронних задач (submit)
+                self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix='ocr-job')
+        if self.mode == 'off':
+            return
+        pings = [self._pool.submit(_ping) for _ in range(self.workers)]
+        threading.Thread(target=self._await_ready, args=(pings,),
+                         name='ocr-pool-ready', daemon=True).start()
+        print(f"[OCRService] Пул {self.mode}: {self.workers} воркерів, "
+              f"черга {self.capacity - self.workers}")
+
+    def _await_ready(self, pings):
+        for ping in pings:
+            try:
+                ping.result()
+            except Exception as e:
+                print(f"[OCRService] Воркер не стартував: {e}")
+        self._ready = True
+        print("[OCRService] Пул готовий")
+
+    def _rebuild_pool(self, broken):
+        """Замінює зламаний пул новим (один раз, хоч би скільки потоків це помітили)."""
+        with self._pool_lock:
+            if self._pool is not broken:
+                return
+            self._pool = None
+            self._ready = False
+        with self._lock:
+            self.restarts += 1
+        print("[OCRService] Воркер пулу аварійно завершився — перезапуск пулу")
+        broken.shutdown(wait=False, cancel_futures=True)
+        # Нові процеси отримають актуальний словник через ініціалізатор
+        self._refresh_vocabulary()
+        self._ensure_pool()
+
+    def local_warmup_models(self, models=None):
+        """Моделі, які варто гріти в процесі Flask (OCR-движки гріє пул)."""
+        models = warmup.WARMUP_MODELS if models is None else models
+        if self.mode != 'process':
+            return list(models)
+        return [m for m in models if m not in ocr.OCR_ENGINES]
+
+    def progress_queue(self):
+        """Черга для подій прогресу задачі, яку можна передати у воркер пулу."""
+        if self.mode != 'process':
+            return queue.Queue()
+        return self._shared_manager().Queue()
+
+    def _shared_manager(self):
+        """Manager для об'єктів, спільних із процесами пулу (черги прогресу, словник)."""
+        with self._pool_lock:
+            if self._manager is None:
+                self._manager = _mp_context().Manager()
+            return self._manager
+
+    def submit(self, raw_bytes, filename='unknown', progress_queue=None):
+        """Future з (текст, timings) або OCRBusy, якщо черга заповнена.
+
+        progress_queue (з progress_queue()) отримує події етапів OCR.
+        """
+        return self._submit(raw_bytes, filename, progress_queue)[0]
+
+    def _submit(self, raw_bytes, filename, progress_queue=None):
+        """(future, пул, якому задачу віддано)."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise OCRBusy()
+        self._refresh_vocabulary()
+        self._ensure_pool()
+        with self._lock:
+            self.in_flight += 1
+        pool = self._pool
+        try:
+            try:
+                future = pool.submit(_run_job, raw_bytes, filename, progress_queue,
+                                     self._job_vocabulary())
+            except BrokenProcessPool:
+                self._rebuild_pool(pool)
+                pool = self._pool
+                future = pool.submit(_run_job, raw_bytes, filename, progress_queue,
+                                     self._job_vocabulary())
+        except Exception:
+            self._release(None, None)
+            raise
+        future.add_done_callback(functools.partial(self._release, pool))
+        return future, pool
+
+    def _release(self, pool, future):
+        with self._lock:
+            self.in_flight -= 1
+            if future is not None:
+                self.completed += 1
+        self._slots.release()
+        # Пул зламався (воркер убито) — перебудовуємо, щоб наступні задачі не падали
+        if (future is not None and not future.cancelled()
+                and isinstance(future.exception(), BrokenProcessPool)):
+            self._rebuild_pool(pool)
+
+    def extract_text(self, file, timings=None, timeout=OCR_TIMEOUT):
+        """Синхронна обгортка над пулом для ендпоінтів Flask."""
+        if timings is None:
+            timings = {}
+        if self.mode == 'off':
+            self._refresh_vocabulary()
+            return ocr.extract_text(file, timings)
+
+        filename = file.filename if hasattr(file, 'filename') else 'unknown'
+        file.stream.seek(0)
+        raw_bytes = file.stream.read()
+
+        cached = ocr.lookup_cached(raw_bytes, timings)
+        if cached is not None:
+            return cached
+
+        start = time.time()
+        for attempt in range(2):
+            future, pool = self._submit(raw_bytes, filename)
+            try:
+                text, job_timings = future.result(
+                    timeout=max(timeout - (time.time() - start), 0))
+                break
+            except TimeoutError:
+                future.cancel()
+                with self._lock:
+                    self.timeouts += 1
+                raise OCRTimeout(f"OCR не завершився за {timeout:.0f}с")
+            except BrokenProcessPool:
+                self._rebuild_pool(pool)
+                if attempt:
+                    raise OCRWorkerCrashed()
+                print("[OCRService] Повтор задачі на перезапущеному пулі")
+        timings.update(job_timings)
+        timings['queue_wait'] = round(max(time.time() - start - job_timings.get('total', 0), 0), 3)
+        return text
+
+    def is_ready(self):
+        return self._ready
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'workers': self.workers,
+                'capacity': self.capacity,
+                'ready': self._ready,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'restarts': self.restarts,
+                'vocabulary_version': self._vocabulary_version,
+            }
+
+
+ocr_service = OCRService()
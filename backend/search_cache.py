@@ -0,0 +1,140 @@
+# search_cache.py — обмежений кеш результатів пошуку інгредієнтів
+"""
+Кеш для IngredientChecker.search_ingredient.
+
+  - Розмір обмежено: при переповненні витісняється найдавніше використаний
+    запис (LRU).
+  - Кожен запис має TTL залежно від джерела: 'local', 'external',
+    'not_found'. Прострочені записи прибираються при кожному додаванні,
+    а не лише при повторному запиті того самого ключа.
+  - Лічильники влучань, промахів, витіснень, прострочень і вибіркових
+    інвалідацій (invalidate) — у stats().
+  - Влучання повертає незмінне представлення (MappingProxyType), тож
+    виклики, які доповнюють результат (наприклад, position), мають
+    робити власну копію й не псують кеш.
+  - Потокобезпечний: кеш спільний для запитів Flask, потоків асинхронних
+    сканувань і синхронізації індексу (invalidate).
+"""
+
+import threading
+import time
+from types import MappingProxyType
+
+from cachetools import Cache, TLRUCache
+
+
+DEFAULT_MAXSIZE = 10000
+
+# TTL у секундах для кожного джерела результату
+DEFAULT_TTL = {
+    'local': 24 * 3600,
+    'external': 24 * 3600,
+    # Невідоме зараз може з'явитися після авто-збереження чи верифікації
+    'not_found': 3600,
+}
+
+
+def freeze(data):
+    """Незмінна поверхнева копія словника: списки стають кортежами."""
+    return MappingProxyType({
+        key: tuple(value) if isinstance(value, list) else value
+        for key, value in data.items()
+    })
+
+
+class _CountingTLRUCache(TLRUCache):
+    """TLRUCache, що рахує витіснення за розміром і прострочення."""
+
+    def __init__(self, maxsize, ttu, timer=time.monotonic):
+        super().__init__(maxsize, ttu, timer=timer)
+        self.evictions = 0
+        self.expirations = 0
+
+    def expire(self, time=None):
+        # currsize у TLRUCache сам викликає expire — беремо базовий лічильник
+        before = Cache.currsize.fget(self)
+        super().expire(time)
+        self.expirations += before - Cache.currsize.fget(self)
+
+    def popitem(self):
+        # popitem викликається лише при переповненні; спершу він сам
+        # прибирає прострочені записи (рахуються у expire)
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+
+class SearchCache:
+    """Обмежений LRU/TTL-кеш: ключ → (незмінні дані, джерело)."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=None, timer=time.monotonic):
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self._timer = timer
+        self._cache = _CountingTLRUCache(maxsize, self._ttu, timer=timer)
+        # cachetools не потокобезпечний: get переставляє записи, вставка
+        # прибирає прострочені й витісняє
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _ttu(self, key, value, now):
+        return now + self.ttl.get(value[1], self.ttl['not_found'])
+
+    def get(self, key):
+        """Незмінні дані для ключа або None (з урахуванням TTL)."""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, data, source):
+        """Зберігає копію даних і повертає її незмінне представлення."""
+        frozen = freeze(data)
+        with self._lock:
+            self._cache[key] = (frozen, source)
+        return frozen
+
+    def invalidate(self, predicate):
+        """Видаляє записи, для яких predicate(ключ, дані, джерело) істинний."""
+        with self._lock:
+            stale = [key for key, (data, source) in list(self._cache.items())
+                     if predicate(key, data, source)]
+            for key in stale:
+                self._cache.pop(key, None)
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._cache
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cache)
+
+    def clear(self):
+        # Очищення — не витіснення: лічильники переносимо у новий кеш
+        with self._lock:
+            old = self._cache
+            self._cache = _CountingTLRUCache(old.maxsize, self._ttu, timer=self._timer)
+            self._cache.evictions = old.evictions
+            self._cache.expirations = old.expirations
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._cache),
+                'maxsize': self._cache.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self._cache.evictions,
+                'expirations': self._cache.expirations,
+                'invalidations': self.invalidations,
+                'ttl': dict(self.ttl),
+            }
@@ -12,6 +12,8 @@
 --   2. Нова таблиця ingredient_aliases — синоніми, переклади, OCR-виправлення.
 --   3. Нова таблиця scan_ingredients — нормалізований зв'язок Scan ↔ Ingredient.
 --   4. Індекси для пошуку та фільтрації.
+--   5. Нова таблиця index_changes — журнал змін для синхронізації індексів пошуку.
+--   6. Нова таблиця scan_jobs — стан асинхронних завдань сканування.
 
 -- ============================================
 -- КРОК 1: Створення бази даних (виконувати як postgres)
@@ -141,6 +143,21 @@ CREATE INDEX IF NOT EXISTS idx_aliases_type ON ingredient_aliases (alias_type);
 CREATE INDEX IF NOT EXISTS idx_aliases_language ON ingredient_aliases (language);
 
 
+-- ─── ЖУРНАЛ ЗМІН ДЛЯ СИНХРОНІЗАЦІЇ ІНДЕКСІВ (НОВА ТАБЛИЦЯ) ──────
+CREATE TABLE IF NOT EXISTS index_changes (
+    id          SERIAL PRIMARY KEY,
+    entity      VARCHAR(20) NOT NULL,
+    entity_id   INTEGER NOT NULL,
+    action      VARCHAR(10) NOT NULL,
+    name        VARCHAR(200),
+    created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE index_changes IS 'Журнал змін інгредієнтів/аліасів; MAX(id) — версія індексів пошуку';
+COMMENT ON COLUMN index_changes.entity IS 'ingredient | alias';
+COMMENT ON COLUMN index_changes.action IS 'add | update | remove';
+
+
 -- ─── СКАНУВАННЯ ─────────────────────────────────────────────────
 CREATE TABLE IF NOT EXISTS scans (
     id                      SERIAL PRIMARY KEY,
@@ -156,18 +173,44 @@ CREATE TABLE IF NOT EXISTS scans (
     created_at              TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
 
     -- JSON-поле для зворотної сумісності
-    ingredients_detected    JSONB
+    ingredients_detected    JSONB,
+
+    -- Денормалізовані лічильники для історії (GET /api/scans?summary=1)
+    ingredients_count       INTEGER,
+    risk_statistics         JSON
 );
 
 COMMENT ON TABLE scans IS 'Результати сканувань косметичних продуктів';
 COMMENT ON COLUMN scans.safety_status IS 'safe | low_warning | warning | danger';
 COMMENT ON COLUMN scans.ingredients_detected IS 'JSON — для зворотної сумісності з v1';
+COMMENT ON COLUMN scans.risk_statistics IS '{total, high, medium, low, unknown, safe}; NULL у записах до міграції';
 
 CREATE INDEX IF NOT EXISTS idx_scans_user_id ON scans (user_id);
 CREATE INDEX IF NOT EXISTS idx_scans_created_at ON scans (created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_scans_user_created_id ON scans (user_id, created_at, id);
 CREATE INDEX IF NOT EXISTS idx_scans_safety_status ON scans (safety_status);
 
 
+-- ─── АСИНХРОННІ ЗАВДАННЯ СКАНУВАННЯ (НОВА ТАБЛИЦЯ) ─────────────
+CREATE TABLE IF NOT EXISTS scan_jobs (
+    id          VARCHAR(32) PRIMARY KEY,
+    user_id     INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    status      VARCHAR(20) NOT NULL DEFAULT 'queued',
+    stage       VARCHAR(30),
+    events      JSON,
+    result      JSON,
+    error       TEXT,
+    created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE scan_jobs IS 'Асинхронні завдання POST /api/analyze?async=1';
+COMMENT ON COLUMN scan_jobs.status IS 'queued | running | done | failed';
+COMMENT ON COLUMN scan_jobs.events IS 'Події прогресу: preprocess, ocr, candidates, matching, persisted';
+
+CREATE INDEX IF NOT EXISTS idx_scan_jobs_created_at ON scan_jobs (created_at);
+
+
 -- ─── ЗВ'ЯЗОК СКАН ↔ ІНГРЕДІЄНТ (НОВА ТАБЛИЦЯ) ─────────────────
 CREATE TABLE IF NOT EXISTS scan_ingredients (
     id              SERIAL PRIMARY KEY,
@@ -338,3 +381,11 @@ GRANT SELECT ON ALL TABLES IN SCHEMA public TO cosmetics_app;
 -- -- Позначити існуючі інгредієнти як верифіковані
 -- UPDATE ingredients SET verified = TRUE, verified_at = NOW(), verified_by = 'migration_v2'
 -- WHERE verified IS NULL OR verified = FALSE;
+--
+-- -- Лічильники та індекс для пагінованої історії сканувань
+-- -- (старі записи з NULL рахуються з ingredients_detected при читанні)
+-- -- app.py та init_db.py додають їх автоматично (models.ensure_schema);
+-- -- вручну — лише якщо у користувача БД немає прав на ALTER TABLE
+-- ALTER TABLE scans ADD COLUMN IF NOT EXISTS ingredients_count INTEGER;
+-- ALTER TABLE scans ADD COLUMN IF NOT EXISTS risk_statistics JSON;
+-- CREATE INDEX IF NOT EXISTS idx_scans_user_created_id ON scans (user_id, created_at, id);
@@ -0,0 +1,202 @@
+# tesseract_api.py — Tesseract у процесі (tesserocr) з fallback на pytesseract
+"""
+Виклики Tesseract без запуску процесу на кожне розпізнавання.
+
+pytesseract на кожен виклик записує зображення у тимчасовий файл,
+запускає процес tesseract і заново завантажує traineddata — для
+ukr+rus+eng це більша частина з 3–5 с роботи Tesseract. Тут:
+
+  - Через tesserocr (біндинг до C++ API) у процесі тримаються
+    ініціалізовані дескриптори TessBaseAPI — окремий пул на кожен набір
+    (мови, psm, oem). Дескриптор створюється при першому виклику і далі
+    перевикористовується; одночасно ним користується лише один потік.
+    Кожен воркер пулу OCR (ocr_service.py) має власні дескриптори.
+  - Зображення передається з пам'яті (SetImage), без тимчасових файлів.
+  - Без tesserocr, або якщо дескриптор не вдалося створити (немає
+    traineddata), виклики йдуть через pytesseract, як раніше.
+
+Конфігурація передається рядком у форматі командного рядка tesseract
+('--oem 3 --psm 6 -l ukr+rus+eng') — ті самі рядки працюють для обох
+бекендів.
+
+TESSERACT_HANDLES — максимум дескрипторів на один набір (типово 2).
+"""
+
+import os
+import queue
+import re
+import threading
+
+import pytesseract
+
+# tesserocr — in-process Tesseract API
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+    print("[Tesseract] tesserocr підключено — Tesseract працює в процесі")
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+    print("[Tesseract] tesserocr не встановлено — виклики через pytesseract. "
+          "Встановіть: pip install tesserocr")
+
+# Для Windows
+if os.name == 'nt':
+    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+TESSERACT_HANDLES = int(os.environ.get('TESSERACT_HANDLES', '2'))
+
+_pools = {}
+_pools_lock = threading.Lock()
+# Набори, для яких tesserocr не ініціалізувався — одразу на pytesseract
+_broken = set()
+
+
+def _parse_config(config):
+    """'--oem 3 --psm 6 -l eng' → ('eng', 6, 3)."""
+    lang = re.search(r'-l\s+(\S+)', config)
+    psm = re.search(r'--psm\s+(\d+)', config)
+    oem = re.search(r'--oem\s+(\d+)', config)
+    return (lang.group(1) if lang else 'eng',
+            int(psm.group(1)) if psm else 3,
+            int(oem.group(1)) if oem else 3)
+
+
+class _HandlePool:
+    """До max_handles дескрипторів TessBaseAPI для одного набору (мови, psm, oem)."""
+
+    def __init__(self, key, max_handles):
+        self.key = key
+        self.max_handles = max_handles
+        self.created = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _create(self):
+        lang, psm, oem = self.key
+        kwargs = {'lang': lang, 'psm': psm, 'oem': oem}
+        if os.environ.get('TESSDATA_PREFIX'):
+            kwargs['path'] = os.environ['TESSDATA_PREFIX']
+        return tesserocr.PyTessBaseAPI(**kwargs)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self.created < self.max_handles
+            if create:
+                self.created += 1
+        if not create:
+            return self._idle.get()
+        try:
+            return self._create()
+        except Exception:
+            with self._lock:
+                self.created -= 1
+            raise
+
+    def release(self, api):
+        api.Clear()
+        self._idle.put(api)
+
+
+def _get_pool(config):
+    key = _parse_config(config)
+    if not TESSEROCR_AVAILABLE or key in _broken:
+        return None
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = _HandlePool(key, TESSERACT_HANDLES)
+    return pool
+
+
+def _run(image, config, timeout, func, fallback):
+    """Розпізнає image на вільному дескрипторі й повертає func(api); без tesserocr — fallback()."""
+    pool = _get_pool(config)
+    if pool is None:
+        return fallback()
+    try:
+        api = pool.acquire()
+    except Exception as e:
+        _broken.add(pool.key)
+        print(f"[Tesseract] tesserocr не ініціалізувався для {pool.key}: {e} — pytesseract")
+        return fallback()
+    try:
+        api.SetImage(image)
+        if not api.Recognize(int(timeout * 1000)):
+            raise RuntimeError(f"Tesseract не завершив розпізнавання за {timeout}с")
+        return func(api)
+    finally:
+        pool.release(api)
+
+
+def image_to_string(image, config, timeout=30):
+    """Текст зображення (як pytesseract.image_to_string)."""
+    def _recognize(api):
+        return api.GetUTF8Text()
+
+    def _fallback():
+        return pytesseract.image_to_string(image, config=config, timeout=timeout)
+
+    return _run(image, config, timeout, _recognize, _fallback)
+
+
+def image_to_data(image, config, timeout=15):
+    """Слова з рамками та довірою (як pytesseract.image_to_data з Output.DICT).
+
+    Ключі: text, conf, left, top, width, height, block_num, par_num,
+    line_num, word_num — по одному елементу на слово.
+    """
+    def _words(api):
+        data = {k: [] for k in ('text', 'conf', 'left', 'top', 'width', 'height',
+                                'block_num', 'par_num', 'line_num', 'word_num')}
+        level = tesserocr.RIL.WORD
+        block = par = line = word = 0
+        iterator = api.GetIterator()
+        if iterator is None:
+            return data
+        for item in tesserocr.iterate_level(iterator, level):
+            if item.IsAtBeginningOf(tesserocr.RIL.BLOCK):
+                block, par, line, word = block + 1, 0, 0, 0
+            if item.IsAtBeginningOf(tesserocr.RIL.PARA):
+                par, line, word = par + 1, 0, 0
+            if item.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line, word = line + 1, 0
+            word += 1
+            box = item.BoundingBox(level)
+            text = item.GetUTF8Text(level)
+            if box is None or text is None:
+                continue
+            x0, y0, x1, y1 = box
+            data['text'].append(text)
+            data['conf'].append(item.Confidence(level))
+            data['left'].append(x0)
+            data['top'].append(y0)
+            data['width'].append(x1 - x0)
+            data['height'].append(y1 - y0)
+            data['block_num'].append(block)
+            data['par_num'].append(par)
+            data['line_num'].append(line)
+            data['word_num'].append(word)
+        return data
+
+    def _fallback():
+        return pytesseract.image_to_data(image, config=config,
+                                         output_type=pytesseract.Output.DICT, timeout=timeout)
+
+    return _run(image, config, timeout, _words, _fallback)
+
+
+def backend():
+    return 'tesserocr' if TESSEROCR_AVAILABLE else 'pytesseract'
+
+
+def stats():
+    with _pools_lock:
+        return {
+            'backend': backend(),
+            'handles': {'+'.join(map(str, key)): pool.created for key, pool in _pools.items()},
+            'fallback': sorted('+'.join(map(str, key)) for key in _broken),
+        }
@@ -0,0 +1,486 @@
+# text_index.py
+"""
+Індексні структури для швидкого пошуку назв інгредієнтів у тексті.
+
+Структури будуються один раз (у IngredientChecker._build_fuzzy_index)
+і далі використовуються на кожному запиті без повторних сортувань
+та лінійних проходів по словнику назв.
+"""
+
+import re
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+def normalize_word(word):
+    """Літерне ядро слова в нижньому регістрі: 'Glycerin,' → 'glycerin'.
+
+    Спільна форма слова для словника злиття OCR (ocr.py) і зіставлення
+    довіри OCR з кандидатами (IngredientChecker.find_ingredients).
+    """
+    return ''.join(re.findall(r'[^\W\d_]+', word.lower()))
+
+
+# ═══════════════════════════════════════════════════════════════════
+# AHO-CORASICK: ПОШУК УСІХ НАЗВ ЗА ОДИН ПРОХІД
+# ═══════════════════════════════════════════════════════════════════
+
+class AhoCorasick:
+    """Мультишаблонний автомат Ахо–Корасік.
+
+    Замість виклику str.find для кожної відомої назви (O(назв × текст))
+    автомат проходить текст один раз і повертає всі входження всіх
+    шаблонів, включно з перетинами: O(текст + кількість збігів).
+
+    Кожен шаблон має довільне корисне навантаження (payload), яке
+    повертається разом із позицією збігу.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._own = [[]]
+        self._out = [[]]
+        self._count = 0
+        self._built = True
+
+    def __len__(self):
+        return self._count
+
+    def add(self, pattern, payload):
+        """Додає шаблон. Після додавання потрібно викликати build()."""
+        if not pattern:
+            return
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+                self._out.append([])
+                self._goto[node][ch] = nxt
+            node = nxt
+        self._own[node].append((len(pattern), payload))
+        self._count += 1
+        self._built = False
+
+    def remove(self, pattern, payload=None):
+        """Прибирає шаблон (лише з цим payload, якщо його задано).
+
+        Вузли лишаються в дереві; вихідні списки перераховуються
+        при наступному build() чи пошуку.
+        """
+        node = 0
+        for ch in pattern:
+            node = self._goto[node].get(ch)
+            if node is None:
+                return
+        own = self._own[node]
+        kept = [(length, p) for length, p in own
+                if payload is not None and p != payload]
+        if len(kept) != len(own):
+            self._own[node] = kept
+            self._count -= len(own) - len(kept)
+            self._built = False
+
+    def build(self):
+        """Обчислює fail-посилання обходом у ширину."""
+        self._out = [list(own) for own in self._own]
+        queue = list(self._goto[0].values())
+        for child in queue:
+            self._fail[child] = 0
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._own[child] + self._out[self._fail[child]]
+        self._built = True
+
+    def iter_matches(self, text):
+        """Генерує (start, length, payload) для кожного входження шаблону."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                for length, payload in out[node]:
+                    yield i - length + 1, length, payload
+
+
+# ═══════════════════════════════════════════════════════════════════
+# ПОСЛІВНЕ ПРЕФІКСНЕ ДЕРЕВО (TRIE) ДЛЯ СЕГМЕНТАЦІЇ
+# ═══════════════════════════════════════════════════════════════════
+
+class TokenTrie:
+    """Префіксне дерево над словами (а не символами) відомих назв.
+
+    Дозволяє за один прохід вперед від позиції знайти найдовшу відому
+    назву, що починається з цього слова: O(довжина збігу) замість
+    перебору вікон 6..1 з об'єднанням рядків і пошуком у словниках.
+    """
+
+    # Кінець назви; str.split() ніколи не дає порожнього слова, а рядок,
+    # на відміну від object(), переживає pickle (знімок індексів)
+    _END = ''
+
+    def __init__(self):
+        self._root = {}
+        self.max_depth = 0
+
+    def add(self, phrase):
+        words = phrase.split()
+        if not words:
+            return
+        node = self._root
+        for word in words:
+            node = node.setdefault(word, {})
+        node[self._END] = True
+        self.max_depth = max(self.max_depth, len(words))
+
+    def remove(self, phrase):
+        """Знімає позначку кінця назви; порожні вузли не заважають пошуку."""
+        node = self._root
+        for word in phrase.split():
+            node = node.get(word)
+            if node is None:
+                return
+        node.pop(self._END, None)
+
+    def longest_match(self, tokens, start):
+        """Кількість слів найдовшої відомої назви з позиції start (0 — немає)."""
+        node = self._root
+        best = 0
+        for i in range(start, len(tokens)):
+            node = node.get(tokens[i])
+            if node is None:
+                break
+            if self._END in node:
+                best = i - start + 1
+        return best
+
+
+# ═══════════════════════════════════════════════════════════════════
+# N-GRAM ІНДЕКС ДЛЯ ПІДРЯДКОВОГО ПОШУКУ
+# ═══════════════════════════════════════════════════════════════════
+
+class SubstringIndex:
+    """Відповідає на запити «запит міститься в назві» та «назва міститься
+    в запиті» без лінійного перебору всіх назв.
+
+      - «запит у назві»: перетин списків триграм запиту дає невелику
+        множину кандидатів, які перевіряються звичайним `in`.
+      - «назва у запиті»: автомат Ахо–Корасік над назвами проходить
+        запит один раз.
+
+    Кожна назва має порядковий номер; first_match повертає назву
+    з найменшим номером — так само, як перший збіг при перебиранні
+    словника у порядку вставки.
+    """
+
+    def __init__(self, min_len=5, n=3):
+        self.min_len = min_len
+        self.n = n
+        self._grams = {}
+        self._ordinals = {}
+        self._names = {}
+        self._automaton = AhoCorasick()
+
+    def __len__(self):
+        return len(self._ordinals)
+
+    def _ngrams(self, text):
+        return {text[i:i+self.n] for i in range(len(text) - self.n + 1)}
+
+    def add(self, name, ordinal):
+        if len(name) < self.min_len or name in self._ordinals:
+            return
+        self._ordinals[name] = ordinal
+        self._names[ordinal] = name
+        for gram in self._ngrams(name):
+            self._grams.setdefault(gram, set()).add(ordinal)
+        self._automaton.add(name, ordinal)
+
+    def remove(self, name):
+        ordinal = self._ordinals.pop(name, None)
+        if ordinal is None:
+            return
+        del self._names[ordinal]
+        for gram in self._ngrams(name):
+            postings = self._grams.get(gram)
+            postings.discard(ordinal)
+            if not postings:
+                del self._grams[gram]
+        self._automaton.remove(name, ordinal)
+
+    def build(self):
+        self._automaton.build()
+
+    def get(self, ordinal):
+        return self._names.get(ordinal)
+
+    def first_match(self, query):
+        """Порядковий номер першої назви, що містить query або міститься в ньому."""
+        if len(query) < self.min_len:
+            return None
+        best = None
+
+        # Назва містить запит: кожна триграма запиту має бути в назві
+        postings = [self._grams.get(gram) for gram in self._ngrams(query)]
+        if all(postings):
+            postings.sort(key=len)
+            for ordinal in sorted(postings[0].intersection(*postings[1:])):
+                if query in self._names[ordinal]:
+                    best = ordinal
+                    break
+
+        # Запит містить назву
+        for _, _, ordinal in self._automaton.iter_matches(query):
+            if best is None or ordinal < best:
+                best = ordinal
+        return best
+
+
+# ═══════════════════════════════════════════════════════════════════
+# ПОПЕРЕДНІЙ ВІДБІР КАНДИДАТІВ ДЛЯ RAPIDFUZZ
+# ═══════════════════════════════════════════════════════════════════
+
+class FuzzyCandidateIndex:
+    """Відсікає назви, які гарантовано не досягнуть порогу RapidFuzz.
+
+    Обидва скорери з _fuzzy_search зводяться до Indel-подібності
+    100 · 2·LCS / (l1 + l2), а LCS обмежена зверху двома величинами,
+    які рахуються векторно для всіх назв одразу:
+
+      - спільні біграми: якщо LCS ≥ L, то рядки мають щонайменше
+        3L − l1 − l2 − 1 спільних біграм (кожен видалений символ
+        руйнує ≤ 2 біграми, кожен вставлений — ≤ 1); рахуються через
+        інвертований індекс біграм;
+      - спільні символи: LCS ≤ перетину мультимножин символів;
+        рахуються по щільній матриці лічильників N × 64 лише для назв,
+        що пройшли біграмний фільтр.
+
+    token_sort_ratio перевіряється на рядках зі відсортованими словами
+    (плюс вікно довжин), partial_ratio — на вихідних рядках з мінімумом
+    по всіх довжинах вікна k ≤ min(l1, l2).
+
+    Назви, що не пройшли відбір, не можуть досягти порогу, а порядок
+    решти зберігається, тож extractOne повертає той самий найкращий
+    збіг, що й на повному списку.
+    """
+
+    N_BUCKETS = 64
+
+    def __init__(self, names=()):
+        self.names = []
+        self._lengths = []
+        self._sorted_lengths = []
+        self._spaces = []
+        self._sorted_spaces = []
+        self._char_rows = []
+        # Нові входження біграм накопичуються у списках і зливаються
+        # з масивами постінгів при першому зверненні до біграми
+        self._pending = {'raw': {}, 'sorted': {}}
+        self._arrays = {}
+        self._dirty = set()
+        self._removed = set()
+        self._stale = True
+        self._required = {}
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def _token_sorted(text):
+        return ' '.join(sorted(text.split()))
+
+    @staticmethod
+    def _bigram_counts(text):
+        counts = {}
+        for i in range(len(text) - 1):
+            gram = text[i:i+2]
+            counts[gram] = counts.get(gram, 0) + 1
+        return counts
+
+    @classmethod
+    def _char_row(cls, text):
+        """Лічильники непробільних символів; кілька символів можуть ділити кошик."""
+        row = bytearray(cls.N_BUCKETS)
+        for ch in text:
+            if not ch.isspace():
+                code = ord(ch)
+                bucket = code - 97 if 97 <= code <= 122 else 26 + code % (cls.N_BUCKETS - 26)
+                row[bucket] = min(row[bucket] + 1, 255)
+        return bytes(row)
+
+    def add(self, name):
+        ident = len(self.names)
+        sorted_name = self._token_sorted(name)
+        self.names.append(name)
+        self._lengths.append(len(name))
+        self._sorted_lengths.append(len(sorted_name))
+        self._spaces.append(sum(1 for ch in name if ch.isspace()))
+        self._sorted_spaces.append(sorted_name.count(' '))
+        self._char_rows.append(self._char_row(name))
+        for kind, text in (('raw', name), ('sorted', sorted_name)):
+            pending = self._pending[kind]
+            for gram, count in self._bigram_counts(text).items():
+                ids, values = pending.setdefault(gram, ([], []))
+                ids.append(ident)
+                values.append(count)
+                self._dirty.add((kind, gram))
+        self._stale = True
+
+    def remove(self, ident):
+        """Виключає назву з відбору; ідентифікатори решти назв не змінюються."""
+        self._removed.add(ident)
+        self._stale = True
+
+    def _refresh(self):
+        if not self._stale:
+            return
+        self._names_arr = np.array(self.names, dtype=object)
+        self._lengths_arr = np.array(self._lengths, dtype=np.int32)
+        self._sorted_lengths_arr = np.array(self._sorted_lengths, dtype=np.int32)
+        self._spaces_arr = np.array(self._spaces, dtype=np.int32)
+        self._sorted_spaces_arr = np.array(self._sorted_spaces, dtype=np.int32)
+        self._chars = np.frombuffer(b''.join(self._char_rows), dtype=np.uint8).reshape(
+            len(self.names), self.N_BUCKETS)
+        self._alive_arr = np.ones(len(self.names), dtype=bool)
+        self._alive_arr[list(self._removed)] = False
+        self._stale = False
+
+    def _postings(self, kind, gram):
+        key = (kind, gram)
+        if key in self._dirty:
+            ids, values = self._pending[kind].pop(gram)
+            ids = np.array(ids, dtype=np.intp)
+            values = np.array(values, dtype=np.int32)
+            if key in self._arrays:
+                old_ids, old_values = self._arrays[key]
+                ids = np.concatenate((old_ids, ids))
+                values = np.concatenate((old_values, values))
+            self._arrays[key] = (ids, values)
+            self._dirty.discard(key)
+        return self._arrays.get(key)
+
+    def __getstate__(self):
+        # Для знімка: усі постінги зливаються в масиви (їх можна віддати
+        # поза pickle і відкрити через mmap), похідні масиви не зберігаються
+        for kind, gram in list(self._dirty):
+            self._postings(kind, gram)
+        state = {key: value for key, value in self.__dict__.items()
+                 if not key.endswith('_arr') and key != '_chars'}
+        state['_stale'] = True
+        return state
+
+    def _common_bigrams(self, kind, text):
+        """Кількість спільних біграм text з кожною назвою (мультимножинний перетин)."""
+        single = []
+        common = np.zeros(len(self.names), dtype=np.int32)
+        for gram, count in self._bigram_counts(text).items():
+            postings = self._postings(kind, gram)
+            if postings is None:
+                continue
+            if count == 1:
+                single.append(postings[0])
+            else:
+                common[postings[0]] += np.minimum(postings[1], count)
+        if single:
+            common += np.bincount(np.concatenate(single),
+                                  minlength=len(self.names)).astype(np.int32)
+        return common
+
+    def _common_chars(self, idx, text):
+        """Кількість спільних непробільних символів text з назвами idx."""
+        row = np.frombuffer(self._char_row(text), dtype=np.uint8)
+        return np.minimum(self._chars[idx], row).sum(axis=1, dtype=np.int32)
+
+    @staticmethod
+    def _min_lcs(cutoff, total):
+        """Найменша LCS, за якої 200 · LCS / total ≥ cutoff."""
+        return np.ceil(cutoff * total / 200.0 - 1e-9)
+
+    def _partial_required(self, m, cutoff):
+        """(біграм, символів) без яких partial_ratio < cutoff для будь-якого вікна k ≤ m."""
+        key = (m, cutoff)
+        if key not in self._required:
+            bigrams, chars = [], []
+            for k in range(1, m + 1):
+                lcs = int(self._min_lcs(cutoff, m + k))
+                if lcs <= k:
+                    bigrams.append(3 * lcs - m - k - 1)
+                    chars.append(lcs)
+            impossible = np.iinfo(np.int32).max
+            self._required[key] = ((min(bigrams), min(chars)) if bigrams
+                                   else (impossible, impossible))
+        return self._required[key]
+
+    def candidates(self, query, token_cutoff, partial_cutoff=None):
+        """Повертає (назви для token_sort_ratio, назви для partial_ratio) у вихідному порядку.
+
+        Якщо partial_cutoff не задано, другий список порожній.
+        """
+        token_idx, partial_idx = self.candidate_ids(query, token_cutoff, partial_cutoff)
+        if not len(token_idx) and not len(partial_idx):
+            return [], []
+        return (self._names_arr[token_idx].tolist(),
+                self._names_arr[partial_idx].tolist())
+
+    def candidate_ids(self, query, token_cutoff, partial_cutoff=None):
+        """Те саме, що candidates, але повертає масиви індексів назв."""
+        empty = np.zeros(0, dtype=np.intp)
+        if not self.names:
+            return empty, empty
+        self._refresh()
+
+        # token_sort_ratio: LCS ≤ min(l1, l2) дає вікно довжин, далі біграми й символи
+        q_sorted = self._token_sorted(query)
+        q_len = len(q_sorted)
+        totals = self._sorted_lengths_arr + q_len
+        lcs_needed = self._min_lcs(token_cutoff, totals)
+        common = self._common_bigrams('sorted', q_sorted)
+        token_idx = np.flatnonzero(
+            self._alive_arr
+            & (lcs_needed <= np.minimum(self._sorted_lengths_arr, q_len))
+            & (common >= 3 * lcs_needed - totals - 1))
+        if len(token_idx):
+            chars = (self._common_chars(token_idx, q_sorted)
+                     + np.minimum(self._sorted_spaces_arr[token_idx], q_sorted.count(' ')))
+            token_idx = token_idx[chars >= lcs_needed[token_idx]]
+
+        if partial_cutoff is None:
+            return token_idx, empty
+
+        # partial_ratio: пороги залежать лише від m = min(l1, l2)
+        required = np.array([self._partial_required(m, partial_cutoff)
+                             for m in range(len(query) + 1)], dtype=np.int64)
+        shorter = np.minimum(self._lengths_arr, len(query))
+        common = self._common_bigrams('raw', query)
+        partial_idx = np.flatnonzero(self._alive_arr & (shorter > 0)
+                                     & (common >= required[shorter, 0]))
+        if len(partial_idx):
+            q_spaces = sum(1 for ch in query if ch.isspace())
+            chars = (self._common_chars(partial_idx, query)
+                     + np.minimum(self._spaces_arr[partial_idx], q_spaces))
+            partial_idx = partial_idx[chars >= required[shorter[partial_idx], 1]]
+
+        return token_idx, partial_idx
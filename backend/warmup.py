@@ -0,0 +1,108 @@
+# warmup.py — прогрів OCR та NLP моделей при старті воркера
+"""
+Прогрів моделей до прийому трафіку.
+
+Без прогріву моделі завантажуються ліниво всередині першого запиту:
+перший користувач на кожному воркері чекає десятки секунд. Тут моделі
+завантажуються при старті, і кожна проганяє один фіктивний інференс
+(виділення буферів, ініціалізація нативних бібліотек).
+
+Які моделі гріти — змінна середовища WARMUP_MODELS (через кому):
+  easyocr, tesseract, trocr — OCR-движки (ocr.warm_up)
+  classifier                — ML-фільтр кандидатів (ingredient_classifier.warm_up)
+Типово: easyocr,tesseract,classifier. WARMUP_MODELS=none — без прогріву.
+
+WARMUP_MODE:
+  background (типово) — у фоновому потоці; /api/health повертає 503,
+                        доки прогрів не завершився
+  sync                — блокує старт воркера до завершення прогріву
+  off                 — лише ліниве завантаження
+
+Стан кожної моделі: pending → loading → ready | unavailable | failed.
+Воркер готовий, коли жодна модель не в pending/loading; недоступна чи
+зламана модель не блокує готовність — запити підуть на fallback.
+"""
+
+import os
+import threading
+import time
+import traceback
+
+DEFAULT_MODELS = ('easyocr', 'tesseract', 'classifier')
+
+WARMUP_MODE = os.environ.get('WARMUP_MODE', 'background')
+WARMUP_MODELS = tuple(
+    m.strip() for m in os.environ.get('WARMUP_MODELS', ','.join(DEFAULT_MODELS)).split(',')
+    if m.strip() and m.strip() != 'none'
+)
+
+_lock = threading.Lock()
+_status = {}
+_started = False
+
+
+def _warm_classifier():
+    try:
+        import ingredient_classifier
+    except ImportError:
+        return False
+    ingredient_classifier.warm_up()
+    return True
+
+
+def _warm_one(name):
+    import ocr
+    if name == 'classifier':
+        return _warm_classifier()
+    if name in ocr.OCR_ENGINES:
+        return ocr.warm_up(name)
+    raise ValueError(f"Невідома модель для прогріву: {name}")
+
+
+def _set(name, **fields):
+    with _lock:
+        _status[name] = dict(_status.get(name, {}), **fields)
+
+
+def _run(models):
+    for name in models:
+        _set(name, state='loading')
+        start = time.time()
+        try:
+            ok = _warm_one(name)
+            _set(name, state='ready' if ok else 'unavailable',
+                 seconds=round(time.time() - start, 2))
+            print(f"[Warmup] {name}: {'готово' if ok else 'недоступно'} "
+                  f"за {time.time() - start:.1f}с")
+        except Exception as e:
+            _set(name, state='failed', error=str(e), seconds=round(time.time() - start, 2))
+            print(f"[Warmup] {name}: помилка {e}")
+            traceback.print_exc()
+
+
+def start(models=None, mode=None):
+    """Запускає прогрів (один раз на процес)."""
+    global _started
+    models = tuple(models) if models is not None else WARMUP_MODELS
+    mode = mode or WARMUP_MODE
+    with _lock:
+        if _started or mode == 'off' or not models:
+            return
+        _started = True
+        for name in models:
+            _status[name] = {'state': 'pending'}
+    print(f"[Warmup] Прогрів ({mode}): {', '.join(models)}")
+    if mode == 'sync':
+        _run(models)
+    else:
+        threading.Thread(target=_run, args=(models,), name='warmup', daemon=True).start()
+
+
+def is_ready():
+    with _lock:
+        return all(s['state'] not in ('pending', 'loading') for s in _status.values())
+
+
+def status():
+    with _lock:
+        return {name: dict(s) for name, s in _status.items()}
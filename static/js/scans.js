@@ -5,6 +5,8 @@ class ScansManager {
         this.currentPage = 1;
         this.perPage = 10;
         this.totalPages = 1;
+        // Курсори keyset-пагінації: номер сторінки → next_cursor попередньої
+        this.pageCursors = { 1: null };
         this.selectedScans = new Set();
         this.allScansSelected = false;
         this.filters = { risk: '', method: '' };
@@ -130,8 +132,20 @@ class ScansManager {
         this.clearSelection();
         this.showLoadingState();
 
+        // Курсори відомі лише для вже пройдених сторінок
+        if (page === 1 || this.pageCursors[page] === undefined) {
+            page = 1;
+            this.currentPage = 1;
+            this.pageCursors = { 1: null };
+        }
+
+        var params = new URLSearchParams({ summary: '1', limit: String(this.perPage) });
+        if (this.pageCursors[page]) params.set('cursor', this.pageCursors[page]);
+        if (this.filters.risk) params.set('risk', this.filters.risk);
+        if (this.filters.method) params.set('method', this.filters.method);
+
         try {
-            var response = await fetch('/api/scans');
+            var response = await fetch('/api/scans?' + params.toString());
             if (!response.ok) {
                 if (response.status === 401) { window.location.href = '/login'; return; }
                 throw new Error(window.i18n('serverError'));
@@ -139,30 +153,12 @@ class ScansManager {
 
             var data = await response.json();
             if (data.status === 'success') {
-                var filteredScans = data.scans;
-
-                if (this.filters.risk) {
-                    var riskFilter = this.filters.risk;
-                    filteredScans = filteredScans.filter(function(scan) {
-                        var rl = scansManager.normalizeRiskLevel(scan.safety_status || scansManager.calculateRiskLevel(scan.ingredients || []));
-                        return rl === riskFilter;
-                    });
-                }
+                if (data.next_cursor) this.pageCursors[page + 1] = data.next_cursor;
+                this.totalPages = Math.ceil(data.total / this.perPage);
 
-                if (this.filters.method) {
-                    var methodFilter = this.filters.method;
-                    filteredScans = filteredScans.filter(function(scan) {
-                        return scan.input_method === methodFilter;
-                    });
-                }
-
-                var startIndex = (page - 1) * this.perPage;
-                var paginatedScans = filteredScans.slice(startIndex, startIndex + this.perPage);
-                this.totalPages = Math.ceil(filteredScans.length / this.perPage);
-
-                this.displayScans(paginatedScans);
-                this.updatePagination(filteredScans.length);
-                this.updateScansCount(filteredScans.length);
+                this.displayScans(data.scans);
+                this.updatePagination(data.total);
+                this.updateScansCount(data.total);
             } else {
                 throw new Error(data.message);
             }
@@ -541,11 +537,20 @@ class ScansManager {
             html += '<button disabled>‹</button>';
         }
 
+        var prevEllipsis = false;
         for (var idx = 0; idx < pages.length; idx++) {
             var page = pages[idx];
+            // На сторінку без відомого курсора перейти не можна — показуємо як «…»
+            if (page !== '...' && page !== current && this.pageCursors[page] === undefined) {
+                page = '...';
+            }
             if (page === '...') {
-                html += '<span class="page-ellipsis">…</span>';
-            } else if (page === current) {
+                if (!prevEllipsis) html += '<span class="page-ellipsis">…</span>';
+                prevEllipsis = true;
+                continue;
+            }
+            prevEllipsis = false;
+            if (page === current) {
                 html += '<span class="page-current">' + page + '</span>';
             } else {
                 html += '<button onclick="scansManager.loadScans(' + page + ')">' + page + '</button>';